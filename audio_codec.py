@@ -0,0 +1,240 @@
+import struct
+import warnings
+
+import numpy as np
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:  # removed in Python 3.13
+    audioop = None
+
+# Coded audio payload: codec id u8 | channels u8 | coded rate u16 | samples u16,
+# followed by the codec data. `samples` is the chunk length at the sender's
+# capture rate, so the receiver can restore exactly that many samples.
+AUDIO_HEADER = struct.Struct("!BBHH")
+
+PCM_ID = 0
+ULAW_ID = 1
+ADPCM_ID = 2
+
+
+class PcmCodec:
+    codec_id = PCM_ID
+    name = "pcm"
+
+    def encode(self, samples):
+        return samples.astype(np.int16).tobytes()
+
+    def decode(self, data):
+        return np.frombuffer(data, dtype=np.int16, count=len(data) // 2)
+
+
+def _ulaw_encode_table():
+    # G.711 mu-law (as in the reference g711.c) for every int16 value, indexed by
+    # the value reinterpreted as uint16
+    x = np.arange(-32768, 32768, dtype=np.int32) >> 2
+    mask = np.where(x < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(x), 8159) + 0x21
+    segment = np.floor(np.log2(magnitude)).astype(np.int32) - 5
+    codes = np.where(segment > 7, 0x7F, (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)) ^ mask
+    return np.roll(codes.astype(np.uint8), -32768)
+
+
+def _ulaw_decode_table():
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    magnitude = (((u & 0x0F) << 3) + 0x84) << exponent
+    return np.where(u & 0x80, 0x84 - magnitude, magnitude - 0x84).astype(np.int16)
+
+
+class MuLawCodec:
+    # G.711 mu-law through two lookup tables, 8 bits per sample
+    codec_id = ULAW_ID
+    name = "ulaw"
+    encode_table = _ulaw_encode_table()
+    decode_table = _ulaw_decode_table()
+
+    def encode(self, samples):
+        return self.encode_table[samples.astype(np.int16).view(np.uint16)].tobytes()
+
+    def decode(self, data):
+        return self.decode_table[np.frombuffer(data, dtype=np.uint8)]
+
+
+ADPCM_STEPS = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+    107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428,
+    4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350,
+    22385, 24623, 27086, 29794, 32767,
+]
+ADPCM_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8]
+# Chunk prefix: predicted value s16 | step index u8 | 1 if the last nibble is padding
+ADPCM_STATE = struct.Struct("!hBB")
+
+
+def _adpcm_encode(samples, valpred, index):
+    # Reference IMA/DVI loop, used when audioop is unavailable
+    codes = []
+    for sample in samples.tolist():
+        step = ADPCM_STEPS[index]
+        diff = sample - valpred
+        code = 8 if diff < 0 else 0
+        diff = abs(diff)
+        vpdiff = step >> 3
+        if diff >= step:
+            code |= 4
+            diff -= step
+            vpdiff += step
+        step >>= 1
+        if diff >= step:
+            code |= 2
+            diff -= step
+            vpdiff += step
+        step >>= 1
+        if diff >= step:
+            code |= 1
+            vpdiff += step
+        valpred = max(-32768, min(32767, valpred - vpdiff if code & 8 else valpred + vpdiff))
+        index = max(0, min(88, index + ADPCM_INDEX[code]))
+        codes.append(code)
+    codes = np.array(codes, dtype=np.uint8)
+    # first sample of each pair in the high nibble, as audioop does
+    return ((codes[0::2] << 4) | codes[1::2]).tobytes(), (valpred, index)
+
+
+def _adpcm_decode(data, count, valpred, index):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    codes = np.empty(len(packed) * 2, dtype=np.uint8)
+    codes[0::2] = packed >> 4
+    codes[1::2] = packed & 0x0F
+    out = np.empty(count, dtype=np.int16)
+    for i, code in enumerate(codes[:count].tolist()):
+        step = ADPCM_STEPS[index]
+        vpdiff = step >> 3
+        if code & 4:
+            vpdiff += step
+        if code & 2:
+            vpdiff += step >> 1
+        if code & 1:
+            vpdiff += step >> 2
+        valpred = max(-32768, min(32767, valpred - vpdiff if code & 8 else valpred + vpdiff))
+        index = max(0, min(88, index + ADPCM_INDEX[code]))
+        out[i] = valpred
+    return out
+
+
+class AdpcmCodec:
+    # IMA-ADPCM, 4 bits per sample. The predictor recursion is sequential, so it
+    # runs in audioop's C implementation when available. Every chunk starts with
+    # the predictor state so chunks decode independently of lost neighbours.
+    codec_id = ADPCM_ID
+    name = "adpcm"
+
+    def __init__(self):
+        self.state = (0, 0)
+
+    def encode(self, samples):
+        samples = samples.astype(np.int16)
+        valpred, index = self.state
+        header = ADPCM_STATE.pack(valpred, index, len(samples) % 2)
+        if len(samples) % 2:
+            # two samples per byte, repeat the last one rather than lose it
+            samples = np.append(samples, samples[-1:])
+        if audioop is not None:
+            data, self.state = audioop.lin2adpcm(samples.tobytes(), 2, (valpred, index))
+        else:
+            data, self.state = _adpcm_encode(samples, valpred, index)
+        return header + data
+
+    def decode(self, data):
+        valpred, index, padded = ADPCM_STATE.unpack_from(data)
+        body = bytes(data[ADPCM_STATE.size :])
+        count = len(body) * 2 - padded
+        if audioop is not None:
+            pcm, _ = audioop.adpcm2lin(body, 2, (valpred, index))
+            return np.frombuffer(pcm, dtype=np.int16, count=count)
+        return _adpcm_decode(body, count, valpred, index)
+
+
+CODECS = {codec.name: codec for codec in (PcmCodec, MuLawCodec, AdpcmCodec)}
+CODEC_IDS = {codec.codec_id: codec for codec in (PcmCodec, MuLawCodec, AdpcmCodec)}
+
+
+def is_coded_audio(payload):
+    # Whether AudioDecoder can take the payload: a complete header naming a known codec,
+    # and for ADPCM a predictor state the decoder accepts
+    if len(payload) < AUDIO_HEADER.size or payload[0] not in CODEC_IDS:
+        return False
+    if payload[0] != ADPCM_ID:
+        return True
+    if len(payload) < AUDIO_HEADER.size + ADPCM_STATE.size:
+        return False
+    _, index, padded = ADPCM_STATE.unpack_from(payload, AUDIO_HEADER.size)
+    return index < len(ADPCM_STEPS) and padded in (0, 1)
+
+
+_lowpass_cache = {}
+
+
+def lowpass(ratio, taps=31):
+    # Windowed-sinc anti-aliasing filter for downsampling by `ratio` (< 1)
+    key = (round(ratio, 6), taps)
+    if key not in _lowpass_cache:
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = np.sinc(ratio * n) * np.hamming(taps)
+        _lowpass_cache[key] = (kernel / kernel.sum()).astype(np.float32)
+    return _lowpass_cache[key]
+
+
+def resample(samples, count):
+    # Linear interpolation of one chunk to exactly `count` samples
+    if len(samples) == count or not len(samples):
+        return samples
+    positions = np.linspace(0, len(samples) - 1, count, dtype=np.float32)
+    return np.interp(positions, np.arange(len(samples), dtype=np.float32), samples.astype(np.float32))
+
+
+class AudioEncoder:
+    # Encodes captured int16 PCM chunks, optionally resampled to a lower voice rate.
+    # The anti-aliasing filter runs over the stream, not each chunk: the last
+    # taps - 1 input samples are kept and filtered along with the next chunk.
+    def __init__(self, codec="pcm", rate=44100, coded_rate=None, channels=1):
+        self.codec = CODECS[codec]()
+        self.rate = rate
+        self.coded_rate = coded_rate or rate
+        self.channels = channels
+        self.history = None
+
+    def encode(self, pcm):
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        count = len(samples)
+        if self.coded_rate != self.rate:
+            ratio = self.coded_rate / self.rate
+            kernel = lowpass(ratio)
+            if self.history is None:
+                self.history = np.zeros(len(kernel) - 1, dtype=np.float32)
+            stream = np.concatenate([self.history, samples.astype(np.float32)])
+            self.history = stream[len(stream) - len(self.history) :]
+            filtered = np.convolve(stream, kernel, mode="valid")  # one output per input sample
+            samples = np.clip(resample(filtered, int(round(count * ratio))), -32768, 32767).astype(np.int16)
+        header = AUDIO_HEADER.pack(self.codec.codec_id, self.channels, self.coded_rate, count)
+        return header + self.codec.encode(samples)
+
+
+class AudioDecoder:
+    def __init__(self, rate=44100):
+        self.rate = rate
+        self.codecs = {}
+
+    def decode(self, payload):
+        # Returns int16 PCM bytes at the local playback rate
+        codec_id, channels, coded_rate, count = AUDIO_HEADER.unpack_from(payload)
+        if codec_id not in self.codecs:
+            self.codecs[codec_id] = CODEC_IDS[codec_id]()
+        samples = self.codecs[codec_id].decode(memoryview(payload)[AUDIO_HEADER.size :])
+        if coded_rate != self.rate or len(samples) != count:
+            samples = np.clip(resample(samples, count), -32768, 32767).astype(np.int16)
+        return samples.tobytes()
@@ -0,0 +1,201 @@
+import bisect
+import itertools
+import threading
+from collections import deque
+
+import metrics
+from protocol import now_us
+
+# Lip sync. Every media message carries the capture time on the sender's clock
+# (protocol header timestamp). Per peer, ClockOffset maps that clock onto ours;
+# the audio jitter buffers report the capture time of what they are playing out;
+# PlayoutScheduler holds each decoded video frame until the audio has reached
+# the frame's capture time, and drops frames that are already too late for that.
+MIX_STREAM = 0  # relay-mixed audio (server_tw.py), the reference when a peer has no audio of its own
+SKEW_BUCKETS = (-0.2, -0.12, -0.08, -0.04, -0.02, 0.0, 0.02, 0.04, 0.08, 0.12, 0.2)
+
+
+class ClockOffset:
+    # Sender clock to local clock: the smallest (arrival - capture) seen over the
+    # last `window` seconds, i.e. the clock difference plus the fastest one-way
+    # trip. Kept as a minimum per second so it follows drift and route changes.
+    def __init__(self, window=10):
+        self.window = window
+        self.lock = threading.Lock()
+        self.minima = deque()  # (second, smallest delta that second)
+
+    def observe(self, timestamp, arrival=None):
+        arrival = now_us() if arrival is None else arrival
+        delta = arrival - timestamp
+        second = arrival // 1_000_000
+        with self.lock:
+            if self.minima and self.minima[-1][0] == second:
+                if delta < self.minima[-1][1]:
+                    self.minima[-1] = (second, delta)
+            else:
+                self.minima.append((second, delta))
+                while self.minima and self.minima[0][0] <= second - self.window:
+                    self.minima.popleft()
+
+    def offset(self):
+        # us to add to a sender timestamp for local time, None before any message
+        with self.lock:
+            return min(delta for _, delta in self.minima) if self.minima else None
+
+
+class PlayoutScheduler:
+    # Video frames are scheduled against the audio playout clock: a frame
+    # captured at T is due when the audio being played reaches T. Both are
+    # compared in local time through the senders' clock offsets, so the
+    # reference can be another clock (the relay's mix) and still line up.
+    # Without any audio playing, frames are shown `default_delay` after their
+    # best-case arrival.
+    #
+    # Frames wait in due-time order, so one that arrives late or out of order
+    # does not hold up those behind it; one captured before the frame last
+    # shown for its stream would step back in time and is dropped.
+    #
+    # pop_due() hands out the newest due frame per stream. Frames already more
+    # than `max_late` behind the audio are dropped rather than shown, except a
+    # stream's first, so it shows up while startup is still slow. When video
+    # keeps arriving late (a slower path than audio) the audio is delayed to
+    # meet it: `sync_delay` is added to every jitter buffer's target delay, and
+    # given back while video is early again.
+    def __init__(self, max_late=0.08, max_hold=1.0, default_delay=0.05, audio_latency=0.0, max_sync_delay=0.25):
+        self.max_late = max_late
+        self.max_hold = max_hold
+        self.default_delay = default_delay
+        self.audio_latency = audio_latency
+        self.max_sync_delay = max_sync_delay
+        self.lock = threading.Lock()
+        self.offsets = {}
+        self.audio = {}  # stream -> AudioJitterBuffer playing it
+        self.frames = {}  # stream -> list of (due us, arrival order, timestamp, frame), by due time
+        self.order = itertools.count()  # breaks ties between equal due times, frames do not compare
+        self.shown = {}  # stream -> capture timestamp of the frame last presented
+        self.sync_delay = 0.0
+        self.presented = 0
+        self.late = 0
+        self.skew = None
+        self.skew_metric = metrics.histogram(
+            "av_skew_seconds", "Video minus audio capture time at presentation", buckets=SKEW_BUCKETS
+        )
+        self.late_metric = metrics.counter("video_late_dropped_total", "Video frames dropped as too late for the audio")
+        metrics.gauge("av_sync_delay_ms", "Audio delay added to meet late video", fn=lambda: self.sync_delay * 1000)
+
+    def observe(self, header, arrival=None):
+        # Every media message from the receive thread, audio and video alike
+        offset = self.offsets.get(header.stream)
+        if offset is None:
+            offset = self.offsets[header.stream] = ClockOffset()
+        offset.observe(header.timestamp, arrival)
+
+    def add_audio(self, stream, jitter):
+        jitter.sync_delay = self.sync_delay
+        self.audio[stream] = jitter
+
+    def remove(self, stream):
+        with self.lock:
+            self.frames.pop(stream, None)
+            self.shown.pop(stream, None)
+        self.audio.pop(stream, None)
+        self.offsets.pop(stream, None)
+
+    def local_time(self, stream, timestamp):
+        offset = self.offsets.get(stream)
+        offset = offset.offset() if offset is not None else None
+        return None if offset is None else timestamp + offset
+
+    def audio_clock(self, stream, now=None):
+        # Local time (us) of the audio being heard: the stream's own, or the mix
+        for source in (stream, MIX_STREAM):
+            jitter = self.audio.get(source)
+            if jitter is None:
+                continue
+            position = jitter.position(now)
+            if position is None:
+                continue
+            local = self.local_time(source, position - self.audio_latency * 1e6)
+            if local is not None:
+                return local
+        return None
+
+    def due(self, stream, timestamp, now_local):
+        # Local time (us) to show a frame captured at `timestamp`
+        local = self.local_time(stream, timestamp)
+        if local is None:
+            return now_local
+        audio = self.audio_clock(stream)
+        if audio is None:
+            return local + self.default_delay * 1e6
+        return now_local + (local - audio)
+
+    def push(self, header, frame):
+        # A decoded frame, from any thread
+        now = now_us()
+        due = self.due(header.stream, header.timestamp, now)
+        self.adapt((due - now) / 1e6)
+        due = min(due, now + self.max_hold * 1e6)  # a stalled audio clock must not freeze video
+        with self.lock:
+            if header.timestamp <= self.shown.get(header.stream, -1):
+                self.late += 1
+                self.late_metric.inc()
+                return
+            bisect.insort(self.frames.setdefault(header.stream, []), (due, next(self.order), header.timestamp, frame))
+
+    def adapt(self, slack):
+        # slack: how long a frame waits for its audio, negative when it comes late
+        if slack < -self.max_late / 2:
+            self.sync_delay = min(self.max_sync_delay, self.sync_delay - slack / 4)
+        elif slack > self.max_late and self.sync_delay > 0:
+            self.sync_delay = max(0.0, self.sync_delay - 0.005)
+        else:
+            return
+        for jitter in list(self.audio.values()):
+            jitter.sync_delay = self.sync_delay
+
+    def pop_due(self):
+        # [(stream, frame)] to show now, from the thread that displays them
+        now = now_us()
+        ready = []
+        with self.lock:
+            for stream, frames in self.frames.items():
+                count = bisect.bisect_right(frames, (now, float("inf")))
+                if not count:
+                    continue
+                due = frames[:count]
+                del frames[:count]
+                # the newest capture among the due ones; the others are superseded
+                newest = max(due, key=lambda entry: entry[2])
+                last = self.shown.get(stream)
+                dropped = count - 1
+                if last is not None and (newest[2] <= last or now - newest[0] > self.max_late * 1e6):
+                    dropped = count
+                self.late += dropped
+                self.late_metric.inc(dropped)
+                if dropped == count:
+                    continue
+                self.shown[stream] = newest[2]
+                ready.append((stream, newest[2], newest[3]))
+        shown = []
+        for stream, timestamp, frame in ready:
+            video = self.local_time(stream, timestamp)
+            audio = self.audio_clock(stream)
+            if video is not None and audio is not None:
+                self.skew = (video - audio) / 1e6
+                self.skew_metric.observe(self.skew)
+            self.presented += 1
+            shown.append((stream, frame))
+        return shown
+
+    def waiting(self):
+        with self.lock:
+            return sum(map(len, self.frames.values()))
+
+    def stats(self):
+        return {
+            "presented": self.presented,
+            "late": self.late,
+            "skew_ms": None if self.skew is None else round(self.skew * 1000, 1),
+            "sync_delay_ms": round(self.sync_delay * 1000, 1),
+        }
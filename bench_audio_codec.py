@@ -0,0 +1,75 @@
+import argparse
+import time
+import wave
+
+import numpy as np
+
+from audio_codec import AudioDecoder, AudioEncoder
+
+
+def voice_like(seconds, rate=44100, seed=0):
+    # Harmonic "vowels" with a wandering pitch, syllable-rate amplitude envelope,
+    # a little breath noise and short pauses
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    signal = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None) * (np.sin(2 * np.pi * 0.25 * t) > -0.6)
+    signal = signal * envelope + 0.02 * rng.standard_normal(len(t))
+    return (signal / np.abs(signal).max() * 12000).astype(np.int16)
+
+
+def wav_file(path, rate):
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError("Only 16-bit WAV files are supported")
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        samples = samples[:: wav.getnchannels()]  # first channel
+        if wav.getframerate() != rate:
+            raise ValueError(f"WAV file is {wav.getframerate()} Hz, expected {rate}")
+    return samples
+
+
+def snr(reference, decoded):
+    noise = np.sum((reference.astype(np.float64) - decoded) ** 2)
+    return 99.0 if noise == 0 else 10 * np.log10(np.sum(reference.astype(np.float64) ** 2) / noise)
+
+
+def run(samples, rate, chunk, configs):
+    chunks = [samples[i : i + chunk].tobytes() for i in range(0, len(samples) - chunk + 1, chunk)]
+    raw = sum(len(c) for c in chunks)
+    reference = np.frombuffer(b"".join(chunks), dtype=np.int16)
+    for codec, coded_rate in configs:
+        encoder = AudioEncoder(codec, rate, coded_rate)
+        decoder = AudioDecoder(rate)
+        encoded = []
+        start = time.process_time()
+        for data in chunks:
+            encoded.append(encoder.encode(data))
+        encode_cpu = time.process_time() - start
+        start = time.process_time()
+        decoded = [decoder.decode(payload) for payload in encoded]
+        decode_cpu = time.process_time() - start
+
+        size = sum(len(p) for p in encoded)
+        label = f"{codec}@{(coded_rate or rate) // 1000}k"
+        print(
+            f"{label:<10} {raw / size:>6.2f}x {size * rate / len(reference) / 1000:>7.1f} KB/s "
+            f"{encode_cpu / len(chunks) * 1e6:>8.1f} us enc {decode_cpu / len(chunks) * 1e6:>8.1f} us dec "
+            f"{snr(reference, np.frombuffer(b''.join(decoded), dtype=np.int16)):>6.1f} dB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audio codec benchmark: ratio, CPU per chunk, SNR")
+    parser.add_argument("-w", "--wav", help="16-bit WAV file to use instead of the synthetic voice")
+    parser.add_argument("-s", "--seconds", type=float, default=10, help="Length of the synthetic signal")
+    parser.add_argument("-r", "--rate", type=int, default=44100, help="Capture rate")
+    parser.add_argument("-c", "--chunk", type=int, default=1024, help="Samples per chunk")
+    parser.add_argument("--voice_rate", type=int, default=16000, help="Resampled rate to compare")
+    args = parser.parse_args()
+
+    samples = wav_file(args.wav, args.rate) if args.wav else voice_like(args.seconds, args.rate)
+    configs = [(codec, rate) for rate in (None, args.voice_rate) for codec in ("pcm", "ulaw", "adpcm")]
+    run(samples, args.rate, args.chunk, configs)
@@ -0,0 +1,68 @@
+import argparse
+import time
+
+import cv2
+
+from bench_delta import talking_head
+from codec_pool import CodecPool
+
+
+def inline(frames, jpegs, params):
+    start = time.perf_counter()
+    for frame in frames:
+        cv2.imencode(".jpg", frame, params)
+    encode = len(frames) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for jpeg in jpegs:
+        cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+    return encode, len(jpegs) / (time.perf_counter() - start)
+
+
+def pooled(pool, items, submit):
+    # Keep every slot busy and drain results in order, like a pipeline stage would
+    start = time.perf_counter()
+    received = 0
+    for i, item in enumerate(items):
+        while pool.free.empty():
+            pool.get()
+            received += 1
+        submit(item, i)
+    while received < len(items):
+        pool.get()
+        received += 1
+    return len(items) / (time.perf_counter() - start)
+
+
+def run(sizes, workers, kind, count, quality):
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    for width, height in sizes:
+        frames = list(talking_head(count, width, height))
+        jpegs = [cv2.imencode(".jpg", frame, params)[1] for frame in frames]
+        encode, decode = inline(frames, jpegs, params)
+        print(f"{width}x{height} inline      {encode:>7.1f} fps enc {decode:>7.1f} fps dec")
+        for n in workers:
+            pool = CodecPool(n, kind, slot_size=width * height * 3)
+            try:
+                encode_fps = pooled(pool, frames, lambda frame, i: pool.encode(frame, params, i))
+                decode_fps = pooled(pool, jpegs, lambda jpeg, i: pool.decode(jpeg, i))
+            finally:
+                pool.close()
+            print(
+                f"{width}x{height} {kind:<7} x{n:<2} {encode_fps:>7.1f} fps enc {decode_fps:>7.1f} fps dec "
+                f"({encode_fps / encode:.2f}x / {decode_fps / decode:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JPEG worker pool scaling benchmark")
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to try")
+    parser.add_argument("-k", "--kind", choices=["process", "thread"], default="process", help="Pool kind")
+    parser.add_argument("-n", "--frames", type=int, default=120, help="Frames per measurement")
+    parser.add_argument("-q", "--quality", type=int, default=80, help="JPEG quality")
+    parser.add_argument(
+        "-s", "--sizes", nargs="+", default=["640x480", "1280x720", "1920x1080"], help="Resolutions, WxH"
+    )
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes]
+    run(sizes, args.workers, args.kind, args.frames, args.quality)
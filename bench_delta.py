@@ -0,0 +1,94 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from delta import TileDecoder, TileEncoder
+
+
+def talking_head(frames, width=640, height=480, seed=0):
+    # Static textured background with a slowly moving head and a talking mouth,
+    # plus a little sensor noise on every frame
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    background = np.stack([xx * 255 // width, yy * 255 // height, (xx + yy) * 127 // (width + height)], axis=-1)
+    background = cv2.GaussianBlur((background + rng.integers(0, 40, background.shape)).astype(np.uint8), (5, 5), 0)
+    for i in range(frames):
+        frame = background.copy()
+        cx = int(width / 2 + width / 20 * np.sin(i / 25))
+        cy = int(height / 2 + height / 40 * np.sin(i / 17))
+        cv2.ellipse(frame, (cx, cy), (width // 8, height // 5), 0, 0, 360, (150, 170, 210), -1)
+        mouth = int(3 + 8 * abs(np.sin(i / 3)))
+        cv2.ellipse(frame, (cx, cy + height // 10), (width // 30, mouth), 0, 0, 360, (60, 40, 120), -1)
+        noise = rng.normal(0, 1.5, frame.shape)
+        yield np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def video_file(path, frames):
+    cap = cv2.VideoCapture(path)
+    for _ in range(frames):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+    cap.release()
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return 99.0 if mse == 0 else 10 * np.log10(255.0**2 / mse)
+
+
+def run(clip, quality, fps, tile, threshold):
+    full_bytes = delta_bytes = 0
+    full_cpu = delta_cpu = 0.0
+    full_psnr = delta_psnr = 0.0
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    encoder = TileEncoder(tile=tile, threshold=threshold)
+    decoder = TileDecoder()
+    frames = 0
+    for seq, frame in enumerate(clip):
+        start = time.process_time()
+        jpeg = cv2.imencode(".jpg", frame, params)[1]
+        full_cpu += time.process_time() - start
+        full_bytes += len(jpeg)
+        full_psnr += psnr(frame, cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+
+        start = time.process_time()
+        data, token = encoder.encode(frame, quality)
+        delta_cpu += time.process_time() - start
+        encoder.on_send(token, seq)
+        delta_bytes += len(data)
+        decoded = decoder.decode(data)
+        encoder.on_ack(seq)  # ideal link: acknowledged before the next frame
+        delta_psnr += psnr(frame, decoded)
+        frames += 1
+
+    for name, total, cpu, quality_db in (
+        ("full", full_bytes, full_cpu, full_psnr),
+        ("delta", delta_bytes, delta_cpu, delta_psnr),
+    ):
+        print(
+            f"{name:<6} {total * fps / frames / 1000:>10.1f} KB/s {cpu / frames * 1000:>8.2f} ms/frame "
+            f"{quality_db / frames:>7.2f} dB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tile delta vs full-frame JPEG benchmark")
+    parser.add_argument("-v", "--video", help="Video file to use instead of the synthetic clip")
+    parser.add_argument("-n", "--frames", type=int, default=300, help="Frames to encode")
+    parser.add_argument("-W", "--width", type=int, default=640, help="Synthetic clip width")
+    parser.add_argument("-H", "--height", type=int, default=480, help="Synthetic clip height")
+    parser.add_argument("-q", "--quality", type=int, default=80, help="JPEG quality")
+    parser.add_argument("--fps", type=float, default=30, help="Frame rate used for KB/s")
+    parser.add_argument("--tile", type=int, default=32, help="Tile size in pixels")
+    parser.add_argument("--threshold", type=float, default=6.0, help="Mean abs difference per tile")
+    args = parser.parse_args()
+
+    if args.video:
+        clip = video_file(args.video, args.frames)
+    else:
+        clip = talking_head(args.frames, args.width, args.height)
+    run(clip, args.quality, args.fps, args.tile, args.threshold)
@@ -0,0 +1,68 @@
+import argparse
+import socket
+import time
+import tracemalloc
+from threading import Thread
+
+from framing import HEADERSIZE, FrameReader, make_header
+
+# Typical JPEG sizes (quality 90) for the resolutions we send
+FRAME_SIZES = {"320x240": 15_000, "640x480": 50_000, "1920x1080": 300_000}
+
+
+def sender(sock, size, frames):
+    message = make_header(size) + bytes(size)
+    for _ in range(frames):
+        sock.sendall(message)
+    sock.close()
+
+
+# The original receive loop, with the recv bounded so frames do not bleed into each other
+def legacy_read(sock):
+    data = b""
+    msg_size = int(sock.recv(HEADERSIZE))
+    while len(data) < msg_size:
+        data += sock.recv(min(4096, msg_size - len(data)))
+    return data
+
+
+def run(name, read_frame_factory, size, frames, trace):
+    a, b = socket.socketpair()
+    t = Thread(target=sender, args=(a, size, frames), daemon=True)
+    read_frame = read_frame_factory(b)
+    peak = 0
+    if trace:
+        tracemalloc.start()
+    t.start()
+    start = time.perf_counter()
+    for _ in range(frames):
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        read_frame()
+        if trace:
+            peak += tracemalloc.get_traced_memory()[1] - base
+    elapsed = time.perf_counter() - start
+    if trace:
+        tracemalloc.stop()
+    t.join()
+    b.close()
+    return frames * size / elapsed / 1e6, peak / frames / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frame receive benchmark")
+    parser.add_argument("-n", "--frames", type=int, default=500, help="Frames per run")
+    args = parser.parse_args()
+
+    readers = {
+        "legacy": lambda sock: lambda: legacy_read(sock),
+        "framed": lambda sock: FrameReader(sock).read_frame,
+    }
+    print(f"{'resolution':<10} {'reader':<7} {'MB/s':>9} {'alloc KB/frame':>15}")
+    for resolution, size in FRAME_SIZES.items():
+        for name, factory in readers.items():
+            # throughput and allocations are measured separately since tracing slows the loop down
+            mbps, _ = run(name, factory, size, args.frames, trace=False)
+            _, alloc = run(name, factory, size, min(args.frames, 100), trace=True)
+            print(f"{resolution:<10} {name:<7} {mbps:>9.1f} {alloc:>15.1f}")
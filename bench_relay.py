@@ -0,0 +1,150 @@
+import asyncio
+import argparse
+import multiprocessing
+import socket
+import time
+from threading import Thread
+
+from framing import HEADERSIZE, make_header
+from protocol import JOIN, VIDEO, pack_header, read_message_async
+from server_tw import Relay
+
+
+# Thread-per-client pairing as in the original myClass.receive_and_send:
+# client 2k forwards to 2k+1 and vice versa. The reads are bounded to the
+# message size so back-to-back frames do not get merged under load.
+def legacy_server(ip, port_queue):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((ip, 0))
+    s.listen(1024)
+    port_queue.put(s.getsockname()[1])
+
+    clients = []
+
+    def receive_and_send(i):
+        clientsocket = clients[i]
+        o = i + 1 if i % 2 == 0 else i - 1
+        while True:
+            data = b""
+            header = b""
+            while len(header) < HEADERSIZE:
+                packet = clientsocket.recv(HEADERSIZE - len(header))
+                if not packet:
+                    return
+                header += packet
+            msg_size = int(header)
+            while len(data) < msg_size:
+                data += clientsocket.recv(min(4096, msg_size - len(data)))
+            clients[o].sendall(bytes("{:<{}}".format(len(data), HEADERSIZE), "utf-8") + data)
+
+    while True:
+        clientsocket, _ = s.accept()
+        clients.append(clientsocket)
+        if len(clients) % 2 == 0:
+            for i in (len(clients) - 2, len(clients) - 1):
+                Thread(target=receive_and_send, args=(i,), daemon=True).start()
+
+
+def relay_server(ip, port_queue, video_queue):
+    async def run():
+        relay = Relay(ip, 0, video_queue=video_queue)
+        await relay.start()
+        port_queue.put(relay.port)
+        await relay.serve_forever()
+
+    asyncio.run(run())
+
+
+async def read_legacy(reader):
+    header = await reader.readexactly(HEADERSIZE)
+    return await reader.readexactly(int(header))
+
+
+async def run_clients(ip, port, clients, messages, size, relay, idle):
+    payload = bytes(size)
+    header = pack_header(VIDEO, size) if relay else make_header(size)
+    read_message = read_message_async if relay else read_legacy
+
+    t0 = time.perf_counter()
+    conns = []
+    for i in range(clients):
+        reader, writer = await asyncio.open_connection(ip, port)
+        if relay:
+            room = f"room-{i // 2}".encode("utf-8")
+            writer.write(pack_header(JOIN, len(room)) + room)
+        conns.append((reader, writer))
+    connect_time = time.perf_counter() - t0
+    # give the server a moment to register everyone before traffic starts
+    await asyncio.sleep(0.2 + clients * 0.002)
+
+    async def send(writer):
+        for _ in range(messages):
+            writer.write(header)
+            writer.write(payload)
+            await writer.drain()
+
+    # Messages the relay dropped never arrive, so a receiver gives up once
+    # nothing has come for `idle` seconds; it returns what it got and when
+    async def receive(reader):
+        received, last = 0, time.perf_counter()
+        try:
+            if relay:
+                await asyncio.wait_for(read_message(reader), idle)  # the relay's answer to JOIN
+            while received < messages:
+                await asyncio.wait_for(read_message(reader), idle)
+                received, last = received + 1, time.perf_counter()
+        except asyncio.TimeoutError:
+            pass
+        return received, last
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(send(w) for _, w in conns), *(receive(r) for r, _ in conns))
+    received = results[clients:]
+    delivered = sum(n for n, _ in received)
+    transfer_time = max(last for _, last in received) - t0
+
+    for _, writer in conns:
+        writer.close()
+    return connect_time, transfer_time, delivered
+
+
+def bench(name, target, ip, clients, messages, size, idle, *server_args):
+    port_queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=target, args=(ip, port_queue, *server_args), daemon=True)
+    proc.start()
+    port = port_queue.get(timeout=10)
+    try:
+        connect_time, transfer_time, delivered = asyncio.run(
+            run_clients(ip, port, clients, messages, size, target is relay_server, idle)
+        )
+    finally:
+        proc.terminate()
+        proc.join()
+    print(
+        f"{name:<8} clients={clients:<5} conn/s={clients / connect_time:>9.0f} "
+        f"msg/s={delivered / transfer_time:>9.0f} MB/s={delivered * size / transfer_time / 1e6:>8.1f} "
+        f"dropped={clients * messages - delivered}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relay throughput benchmark")
+    parser.add_argument("-i", "--ip", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument(
+        "-c", "--clients", type=int, nargs="+", default=[2, 50, 200], help="Client counts (even numbers)"
+    )
+    parser.add_argument("-n", "--messages", type=int, default=200, help="Messages sent per client")
+    parser.add_argument("-s", "--size", type=int, default=8000, help="Message size in bytes")
+    parser.add_argument(
+        "--video_queue",
+        type=int,
+        help="Relay video frames queued per receiver (default: --messages, so nothing is dropped like legacy)",
+    )
+    parser.add_argument("--idle", type=float, default=2.0, help="Seconds without a message before a receiver stops")
+    args = parser.parse_args()
+    video_queue = args.messages if args.video_queue is None else args.video_queue
+
+    for clients in args.clients:
+        bench("legacy", legacy_server, args.ip, clients, args.messages, args.size, args.idle)
+        bench("relay", relay_server, args.ip, clients, args.messages, args.size, args.idle, video_queue)
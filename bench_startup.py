@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Starts every entry point headless, the way a participant joining a call would,
+# and reports the startup milestones it records with --startup_json (startup.py)
+# in milliseconds from when the process was spawned: "imported" is the import
+# time (interpreter start included), "connected" when the relay has answered
+# JOIN or the server accepted, "first_frame" the first remote frame on screen.
+# A bare interpreter start is the floor for the import column.
+MILESTONES = ("imported", "listening", "connected", "audio", "camera", "warm", "first_frame")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Run:
+    # The processes of one measurement, all stopped by close()
+    def __init__(self, directory):
+        self.directory = directory
+        self.log = os.path.join(directory, "startup.jsonl")
+        self.procs = []
+
+    def spawn(self, script, *args):
+        # (process, spawn time); output goes to <script>-<n>.log
+        out = open(os.path.join(self.directory, f"{script}-{len(self.procs)}.log"), "w")
+        spawned = time.time()
+        proc = subprocess.Popen(
+            [sys.executable, script, *args],
+            stdout=out,
+            stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        self.procs.append(proc)
+        return proc, spawned
+
+    def marks(self, proc, timeout=30.0):
+        # Milestones the process reported, once it has
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(self.log):
+                with open(self.log) as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        if entry["pid"] == proc.pid:
+                            return entry["marks"]
+            if proc.poll() is not None:
+                raise RuntimeError(f"{proc.args[1]} exited with {proc.returncode}, see {self.directory}")
+            time.sleep(0.02)
+        raise TimeoutError(f"{proc.args[1]} reported no startup within {timeout} s")
+
+    def close(self):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            proc.wait()
+
+
+def since(marks, spawned):
+    return {m: (t - spawned) * 1000 for m, t in marks.items()}
+
+
+def bench_interpreter():
+    start = time.time()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return {"imported": (time.time() - start) * 1000}
+
+
+def bench_relay_client(directory, settle):
+    # Relay, a peer already in the room, then the client that is measured
+    run = Run(directory)
+    port = str(free_port())
+    try:
+        relay, spawned = run.spawn("server_tw.py", "-p", port, "--startup_json", run.log)
+        relay_marks = since(run.marks(relay), spawned)
+        run.spawn("client_tw_av.py", "bench", "--headless", "-p", port, "--duration", "60")
+        time.sleep(settle)
+        client, spawned = run.spawn(
+            "client_tw_av.py", "bench", "--headless", "-p", port, "--duration", "60", "--startup_json", run.log
+        )
+        return relay_marks, since(run.marks(client), spawned)
+    finally:
+        run.close()
+
+
+def bench_video_app(directory, settle):
+    # A video_app server, then the client that is measured
+    run = Run(directory)
+    port = str(free_port())
+    try:
+        run.spawn("video_app.py", "-m", "server", "--headless", "-p", port)
+        time.sleep(settle)
+        client, spawned = run.spawn(
+            "video_app.py", "-m", "client", "--headless", "-p", port, "--startup_json", run.log
+        )
+        return since(run.marks(client), spawned)
+    finally:
+        run.close()
+
+
+def report(name, runs):
+    medians = []
+    for milestone in MILESTONES:
+        values = [r[milestone] for r in runs if milestone in r]
+        medians.append(f"{statistics.median(values):>12.0f}" if values else f"{'-':>12}")
+    print(f"{name:<18}" + "".join(medians))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entry point startup and time-to-first-frame benchmark")
+    parser.add_argument("-n", "--runs", type=int, default=3, help="Runs per entry point, medians are shown")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds the call runs before the client joins")
+    parser.add_argument("--keep", action="store_true", help="Keep the process logs and print where they are")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_startup-")
+    results = {"python": [], "server_tw": [], "client_tw_av": [], "video_app client": []}
+    try:
+        for _ in range(args.runs):
+            results["python"].append(bench_interpreter())
+            relay, client = bench_relay_client(directory, args.settle)
+            results["server_tw"].append(relay)
+            results["client_tw_av"].append(client)
+            results["video_app client"].append(bench_video_app(directory, args.settle))
+
+        print(f"ms since spawn, median of {args.runs}")
+        print(f"{'':<18}" + "".join(f"{m:>12}" for m in MILESTONES))
+        for name, runs in results.items():
+            report(name, runs)
+    finally:
+        if args.keep:
+            print(f"logs in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
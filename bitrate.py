@@ -0,0 +1,153 @@
+import time
+from threading import Lock
+
+DEFAULT_SIZES = [(320, 240), (480, 360), (640, 480)]
+
+
+class BitrateController:
+    # Congestion-aware encoder settings. Every sent video frame is registered with
+    # on_send(); the receiver acknowledges it and on_ack() turns that into an RTT
+    # sample and a delivered-throughput estimate. update() then moves a single
+    # quality level in [0, 1] down multiplicatively when the link is congested
+    # (RTT above target, frames piling up unacknowledged or never acknowledged at
+    # all, or the frame rate we are asking for exceeding what was delivered) and up
+    # additively when it is not. update() runs from should_capture() as well as
+    # on_ack(), so the level keeps falling when the ACKs stop altogether.
+    # JPEG quality, capture size and frame rate are all derived from that level.
+    def __init__(
+        self,
+        min_quality=30,
+        max_quality=90,
+        sizes=DEFAULT_SIZES,
+        min_fps=5,
+        max_fps=30,
+        target_latency=0.2,
+        max_inflight=4,
+        level=0.5,
+        interval=0.25,
+    ):
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.sizes = list(sizes)
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.target_latency = target_latency
+        self.max_inflight = max_inflight
+        self.level = level
+        self.interval = interval
+
+        self.lock = Lock()
+        self.inflight = {}
+        self.inflight_bytes = 0
+        self.srtt = None
+        self.throughput = None
+        self.frame_bytes = None
+        self.delivered = 0
+        self.expired = 0  # frames given up on since the last update
+        self.lost = 0
+        self.last_update = None
+        self.last_frame = None
+
+    @property
+    def quality(self):
+        return int(round(self.min_quality + self.level * (self.max_quality - self.min_quality)))
+
+    @property
+    def fps(self):
+        return self.min_fps + self.level * (self.max_fps - self.min_fps)
+
+    @property
+    def frame_size(self):
+        return self.sizes[min(int(self.level * len(self.sizes)), len(self.sizes) - 1)]
+
+    def encode_params(self, cv2):
+        return [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+
+    def should_capture(self, now=None):
+        # Paces capture to the current target fps and holds off while the link is backed up
+        now = time.monotonic() if now is None else now
+        self.update(now)
+        if self.last_frame is not None and now - self.last_frame < 1.0 / self.fps:
+            return False
+        with self.lock:
+            self.expire(now)
+            if len(self.inflight) >= self.max_inflight:
+                return False
+        self.last_frame = now
+        return True
+
+    def expire(self, now):
+        # frames that were never acknowledged (receiver gone, dropped on the way), counted as lost
+        for seq in [s for s, (_, t) in self.inflight.items() if now - t > 4 * self.target_latency + 1]:
+            self.inflight_bytes -= self.inflight.pop(seq)[0]
+            self.expired += 1
+            self.lost += 1
+
+    def on_send(self, seq, size, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.inflight[seq] = (size, now)
+            self.inflight_bytes += size
+            self.frame_bytes = size if self.frame_bytes is None else 0.8 * self.frame_bytes + 0.2 * size
+            self.expire(now)
+
+    def on_ack(self, seq, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if seq not in self.inflight:
+                return
+            # cumulative: older frames the receiver skipped were delivered as well
+            for older in [s for s in self.inflight if s < seq]:
+                size = self.inflight.pop(older)[0]
+                self.inflight_bytes -= size
+                self.delivered += size
+            size, sent = self.inflight.pop(seq)
+            self.inflight_bytes -= size
+            self.delivered += size
+            rtt = now - sent
+            self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+        self.update(now)
+
+    def update(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.last_update is None:
+                self.last_update = now
+                return
+            elapsed = now - self.last_update
+            if elapsed < self.interval:
+                return
+            rate = self.delivered / elapsed
+            self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+            self.delivered = 0
+            self.last_update = now
+
+            self.expire(now)
+            congested = (
+                (self.srtt is not None and self.srtt > self.target_latency)
+                or len(self.inflight) >= self.max_inflight
+                or self.expired > 0
+            )
+            self.expired = 0
+            if not congested and self.frame_bytes and self.throughput and self.srtt is not None:
+                # asking for more than gets delivered while a queue is starting to form
+                demand = self.frame_bytes * self.fps
+                congested = demand > self.throughput * 1.1 and self.srtt > self.target_latency / 2
+
+            if congested:
+                self.level = max(0.0, self.level * 0.7)
+            elif self.srtt is not None and self.srtt < self.target_latency / 2:
+                self.level = min(1.0, self.level + 0.05 * elapsed / self.interval)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "level": self.level,
+                "quality": self.quality,
+                "fps": self.fps,
+                "size": self.frame_size,
+                "srtt_ms": None if self.srtt is None else self.srtt * 1000,
+                "throughput_kbps": None if self.throughput is None else self.throughput * 8 / 1000,
+                "inflight": len(self.inflight),
+                "lost": self.lost,
+            }
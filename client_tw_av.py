@@ -1,15 +1,36 @@
-import socket, sys, cv2, pickle, struct
-from threading import Thread
-from datetime import datetime
-from time import sleep
-import matplotlib.pyplot as plt
+import argparse, cv2
+from threading import Event, Thread, Timer
+from time import perf_counter, sleep
 import numpy as np
-import pyaudio
+from audio_codec import AudioDecoder, AudioEncoder
+from avsync import PlayoutScheduler
+from bitrate import BitrateController
+import metrics
+from jitter import AudioJitterBuffer
+from media import close_audio, open_audio_sink, open_audio_source, open_display, open_video
+from protocol import (
+    ACK,
+    AUDIO,
+    AUDIO_CODED,
+    AUDIO_TYPES,
+    COMFORT_NOISE,
+    LEAVE,
+    SIMULCAST,
+    TILES,
+    VIDEO,
+    now_us,
+    unpack_ack,
+)
+from render import GridRenderer
+from session import RelaySession
+from simulcast import encode_layers
+from startup import Startup
+from vad import COMFORT, SILENT, SPEECH, VoiceActivityDetector, unpack_comfort_noise
 
+startup = Startup("client_tw_av")
 print("[DEBUG] Imported all required modules")
 
 sending, receiving = False, False
-HEADERSIZE = 10
 
 print("[DEBUG] Initialized global variables")
 
@@ -21,100 +42,259 @@ class myClass:
         self.name = name
         self.img = img
         self.local_buffer = None
-        self.p = pyaudio.PyAudio()
-        self.stream = self.p.open(
-            format=sample_format, channels=channels, rate=fs, frames_per_buffer=chunk, input=True, output=True
+        self.bitrate = BitrateController()
+        self.jitter_buffers = {}
+        self.audio_encoder = AudioEncoder(audio_codec, fs, voice_rate, channels)
+        # silence goes out as occasional comfort noise markers instead of audio
+        self.vad = None if args.no_vad else VoiceActivityDetector(fs, chunk, channels)
+        self.audio_decoders = {}
+        # devices are opened by open_audio() and open_camera(), while connecting
+        self.audio_in = None
+        self.audio_out = None
+        self.cam = None
+        self.display = open_display(args.display)
+        self.session = None
+        # video is shown in step with the audio being played (of the same participant, or the relay's mix)
+        self.scheduler = PlayoutScheduler(audio_latency=chunk / fs)
+        # decodes on worker threads and composites every participant into one window
+        self.renderer = GridRenderer(
+            self.display,
+            f"{name} {room}",
+            max_fps=args.render_fps,
+            workers=args.decode_workers,
+            on_decoded=self.ack,
+            scheduler=self.scheduler,
         )
+        # counters instead of a print per frame; no-ops unless --metrics_port/--metrics_json
+        directions = ("in", "out")
+        self.frames = {d: metrics.counter("frames_total", "Video frames", direction=d) for d in directions}
+        self.video_bytes = {d: metrics.counter("video_bytes_total", "Video bytes", direction=d) for d in directions}
+        self.audio_chunks = {d: metrics.counter("audio_chunks_total", "Audio chunks", direction=d) for d in directions}
+        self.audio_bytes = {d: metrics.counter("audio_bytes_total", "Audio bytes", direction=d) for d in directions}
+        self.vad_chunks = {
+            d: metrics.counter("vad_chunks_total", "Captured audio chunks by VAD decision", decision=d)
+            for d in (SPEECH, COMFORT, SILENT)
+        }
+        self.encode_latency = metrics.histogram("encode_seconds", "JPEG encode time")
+        self.network_latency = metrics.histogram("network_latency_seconds", "Capture to receive time of video")
+        metrics.gauge("bitrate_level", "Adaptive bitrate level", fn=lambda: self.bitrate.level)
         print("[DEBUG] Client initialized successfully")
 
-    def send_to_client(self, clientsocket):
+    def open_audio(self):
+        self.audio_in = open_audio_source(args.audio_in, fs, channels, chunk)
+        self.audio_out = open_audio_sink(args.audio_out, fs, channels, chunk)
+
+    def open_camera(self):
+        self.cam = open_video(args.video)
+        self.cam.set(3, 640)
+        self.cam.set(4, 480)
+
+    def warm_up(self):
+        # First calls load and set up the codecs; better now than on the first frame
+        width, height = self.bitrate.frame_size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        if args.simulcast > 1:
+            encode_layers(frame, self.bitrate.encode_params(cv2), args.simulcast)
+        result, data = cv2.imencode(".jpg", frame, self.bitrate.encode_params(cv2))
+        cv2.resize(cv2.imdecode(data, cv2.IMREAD_COLOR), self.renderer.tile_size, interpolation=cv2.INTER_AREA)
+        if audio_codec != "pcm":
+            # a throwaway encoder, so the real one's state stays in step with the receivers
+            AudioEncoder(audio_codec, fs, voice_rate, channels).encode(bytes(2 * chunk * channels))
+
+    def send_to_client(self, writer):
         print("[DEBUG] Starting video capture and sending")
-        cam = cv2.VideoCapture(0)
-        cam.set(3, 320)
-        cam.set(4, 240)
+        cam = self.cam
         img_counter = 0
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
         while True:
             ret, frame = cam.read()
+            captured = now_us()
+            # quality, size and frame rate follow the bitrate controller
+            if not self.bitrate.should_capture():
+                sleep(0.005)
+                continue
             try:
-                result, frame = cv2.imencode(".jpg", frame, encode_param)
+                start = perf_counter()
+                frame = cv2.resize(frame, self.bitrate.frame_size)
+                if args.simulcast > 1:
+                    # the relay forwards each receiver the largest layer its link keeps up with
+                    layers = encode_layers(frame, self.bitrate.encode_params(cv2), args.simulcast)
+                else:
+                    result, data = cv2.imencode(".jpg", frame, self.bitrate.encode_params(cv2))
+                self.encode_latency.observe(perf_counter() - start)
             except:
                 print("[DEBUG] Failed to encode frame")
                 continue
-            data = pickle.dumps(frame, 0)
-            size = len(data)
             if self.stop:
                 break
             else:
-                print(f"[DEBUG] Sending frame {img_counter}, size: {size} bytes")
-                clientsocket.sendall(bytes("{:<{}}".format(len(data), HEADERSIZE), "utf-8") + data)
+                if args.simulcast > 1:
+                    seq = writer.send(SIMULCAST, layers[0], timestamp=captured)
+                    for layer in layers[1:]:
+                        writer.send(SIMULCAST, layer, timestamp=captured, seq=seq)
+                    size = sum(map(len, layers))
+                else:
+                    seq = writer.send(VIDEO, data, timestamp=captured)
+                    size = len(data)
+                self.frames["out"].inc()
+                self.video_bytes["out"].inc(size)
+                self.bitrate.on_send(seq, size)
                 img_counter += 1
-                sleep(0.5)
         print("[DEBUG] Client stopped sending video")
-        cam.release()
 
-    def receive_from_client(self, clientsocket):
-        print("[DEBUG] Starting video reception")
+    def receive_from_client(self, session):
+        print("[DEBUG] Starting reception")
         print("Receiving...", receiving)
+        resumes = 0
         while not self.stop:
-            data = b""
-            payload_size = HEADERSIZE
-            msg_size = int(clientsocket.recv(HEADERSIZE))
-            print(f"[DEBUG] Receiving frame of size: {msg_size} bytes")
-            while len(data) < msg_size:
-                data += clientsocket.recv(4096)
-            frame_data = data  # [:msg_size]
-            if len(frame_data) == 0:
+            # a dropped connection is resumed inside read()
+            try:
+                message = session.read()
+            except ConnectionError as e:
+                print(f"[DEBUG] {e}")
+                break
+            if message is None:
+                break
+            if session.resumes != resumes:
+                resumes = session.resumes
+                print(f"[DEBUG] Connection resumed as participant {session.id}")
+            header, payload = message
+            if header.type == LEAVE:
+                print(f"[DEBUG] Participant {header.stream} left")
+                self.remove_peer(header.stream)
+                continue
+            if header.type in AUDIO_TYPES or header.type in (VIDEO, TILES, COMFORT_NOISE):
+                self.scheduler.observe(header)
+            if header.type in AUDIO_TYPES or header.type == COMFORT_NOISE:
+                self.audio_chunks["in"].inc()
+                self.audio_bytes["in"].inc(header.length)
+                self.playAudio(header, payload)
+                continue
+            if header.type == ACK:
+                seq, _ = unpack_ack(payload)
+                self.bitrate.on_ack(seq)
+                continue
+            if header.type not in (VIDEO, TILES):
+                continue
+            self.frames["in"].inc()
+            self.video_bytes["in"].inc(header.length)
+            self.network_latency.observe(max(0, now_us() - header.timestamp) / 1e6)
+            if header.length == 0:
                 print("[DEBUG] Received empty frame")
                 continue
-            frame = pickle.loads(frame_data, fix_imports=True, encoding="bytes")
-            frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
-
-            cv2.imshow(self.name, frame)
-            cv2.resizeWindow(str(clientsocket), 320, 240)
-            cv2.waitKey(1)
-        print("[DEBUG] Video reception stopped")
-        cv2.destroyAllWindows()
-
-    def fetchAudio(self, audio_socket):
-        print("[DEBUG] Starting audio reception")
-        frames = []
+            # the reader reuses its buffer; frames superseded before decoding are skipped
+            self.renderer.submit(header, bytes(payload))
+        print("[DEBUG] Reception stopped")
+
+    def remove_peer(self, stream):
+        # Its tile leaves the grid, its audio stops playing
+        self.renderer.remove(stream)  # and its playout state
+        self.jitter_buffers.pop(stream, None)
+        self.audio_decoders.pop(stream, None)
+
+    def ack(self, header):
+        # Frames are acknowledged once decoded, from the renderer's workers
+        if self.session is not None and not self.stop:
+            self.session.writer.ack(header)
+
+    def show(self, duration=None):
+        # The window is driven from the main thread until Esc, Enter or `duration` seconds
+        print("[DEBUG] Rendering; Esc or Enter to stop")
+        hang_up = Event()
+
+        def wait_for_enter():
+            try:
+                input()
+            except EOFError:
+                pass
+            hang_up.set()
+
+        timer = Timer(duration, hang_up.set) if duration is not None else None
+        if timer is None:
+            Thread(target=wait_for_enter, daemon=True).start()
+        else:
+            timer.start()
+        while not hang_up.is_set():
+            self.renderer.render()
+            if self.renderer.first_frame is not None and not startup.reported:
+                startup.mark("first_frame", self.renderer.first_frame)
+                print(f"[DEBUG] Startup: {startup.report()}")
+            if self.display.poll() & 0xFF == 27:
+                break
+            sleep(0.005)
+        if timer is not None:
+            timer.cancel()
+        self.display.close()
+
+    def playAudio(self, header, data):
+        # one jitter buffer per remote participant, drained by playbackAudio
+        if header.stream not in self.jitter_buffers:
+            self.jitter_buffers[header.stream] = AudioJitterBuffer(chunk, fs, channels)
+            self.audio_decoders[header.stream] = AudioDecoder(fs)
+            self.scheduler.add_audio(header.stream, self.jitter_buffers[header.stream])
+        if header.type == COMFORT_NOISE:
+            self.jitter_buffers[header.stream].comfort(header.timestamp, unpack_comfort_noise(data))
+            return
+        if header.type == AUDIO_CODED:
+            data = self.audio_decoders[header.stream].decode(data)
+        self.jitter_buffers[header.stream].put(header.seq, header.timestamp, data)
+
+    def playbackAudio(self):
+        print("[DEBUG] Starting audio playback")
         while not self.stop:
+            buffers = list(self.jitter_buffers.values())
+            if not buffers:
+                sleep(chunk / fs)
+                continue
+            mix = np.zeros(chunk * channels, dtype=np.int32)
+            for buffer in buffers:
+                mix += np.frombuffer(buffer.get(), dtype=np.int16)
             try:
-                print("[DEBUG] Waiting for audio data...")
-                data = audio_socket.recv(4096)
-                frames.append(data)
-                print(f"[DEBUG] Received audio chunk of size: {len(data)} bytes")
-                self.stream.write(data)
+                self.audio_out.write(np.clip(mix, -32768, 32767).astype(np.int16).tobytes())
             except:
-                print("[DEBUG] Error receiving audio")
-                continue
-        print("[DEBUG] Audio reception stopped")
+                print("[DEBUG] Error playing audio")
+        print("[DEBUG] Audio playback stopped")
 
-    def recordAudio(self, audio_socket):
+    def recordAudio(self, writer):
         print("[DEBUG] Starting audio recording")
         while not self.stop:
-            data = self.stream.read(chunk)
-            print(f"[DEBUG] Sending audio chunk of size: {len(data)} bytes")
-            audio_socket.sendall(data)
+            data = self.audio_in.read(chunk)
+            captured = now_us() - int(chunk / fs * 1e6)  # first sample of the chunk
+            decision = SPEECH if self.vad is None else self.vad.process(data)
+            self.vad_chunks[decision].inc()
+            if decision == COMFORT:
+                writer.send(COMFORT_NOISE, self.vad.comfort_noise(), timestamp=captured)
+            if decision != SPEECH:
+                continue
+            if audio_codec == "pcm" and voice_rate is None:
+                writer.send(AUDIO, data, timestamp=captured)
+            else:
+                data = self.audio_encoder.encode(data)
+                writer.send(AUDIO_CODED, data, timestamp=captured)
+            self.audio_chunks["out"].inc()
+            self.audio_bytes["out"].inc(len(data))
+        if self.vad is not None:
+            print(f"[DEBUG] VAD: {self.vad.stats()}")
         print("[DEBUG] Audio recording stopped")
 
-    def inititate(self, clientsocket, audio_socket):
+    def inititate(self, session, auto=False):
         print("[DEBUG] Initiating connection threads")
-        t = Thread(target=self.send_to_client, args=(clientsocket,))
-        t2 = Thread(target=self.receive_from_client, args=(clientsocket,))
-        
-        audioSendingThread = Thread(target=self.recordAudio, args=(audio_socket,))
-        audioReceivingThread = Thread(target=self.fetchAudio, args=(audio_socket,))
+        self.session = session
+        writer = session.writer
+        t = Thread(target=self.send_to_client, args=(writer,))
+        t2 = Thread(target=self.receive_from_client, args=(session,))
+
+        audioSendingThread = Thread(target=self.recordAudio, args=(writer,))
+        audioPlaybackThread = Thread(target=self.playbackAudio)
 
         self.stop = False
         sending_started = False
         receiving_started = False
+        choices = iter([1, 2]) if auto else None  # headless runs start both without asking
         
-        while len(self.threads) < 2:
+        while not (sending_started and receiving_started):
             try:
                 print("[DEBUG] Waiting for user input")
-                c = int(input("1: initiate sending \n 2: initiate receiving:"))
+                c = next(choices) if auto else int(input("1: initiate sending \n 2: initiate receiving:"))
             except:
                 print("[DEBUG] Invalid input")
                 continue
@@ -122,14 +302,16 @@ class myClass:
             if c == 1 and not sending_started:
                 print("[DEBUG] Starting sending threads")
                 t.start()
-                audioReceivingThread.start()
+                audioSendingThread.start()
                 self.threads.append(t)
+                self.threads.append(audioSendingThread)
                 sending_started = True
             elif c == 2 and not receiving_started:
                 print("[DEBUG] Starting receiving threads")
                 t2.start()
-                audioSendingThread.start()
+                audioPlaybackThread.start()
                 self.threads.append(t2)
+                self.threads.append(audioPlaybackThread)
                 receiving_started = True
             else:
                 print("[DEBUG] This option has already been initiated")
@@ -139,40 +321,74 @@ class myClass:
     def end(self):
         print("[DEBUG] Stopping all threads")
         self.stop = True
+        if self.session is not None:
+            self.session.close()  # leaves the room and wakes up the receiving thread
         for t in self.threads:
             t.join()
-        self.stream.close()
-        self.p.terminate()
+        self.renderer.close()
+        self.audio_in.close()
+        self.audio_out.close()
+        self.cam.release()
+        close_audio()
         print("[DEBUG] All threads stopped")
+        if not startup.reported:
+            print(f"[DEBUG] Startup: {startup.report()}")
 
 
 # IP = "192.168.0.108"
 IP = "127.0.0.1"
-PORT = 1234
+PORT = 1222
+
+parser = argparse.ArgumentParser(description="Video chat room client")
+parser.add_argument("room", nargs="?", default="default", help="Room to join (default: default)")
+parser.add_argument("audio_codec", nargs="?", default="pcm", choices=["pcm", "ulaw", "adpcm"], help="Audio codec")
+parser.add_argument("-i", "--ip", default=IP, help=f"Relay address (default: {IP})")
+parser.add_argument("-p", "--port", type=int, default=PORT, help=f"Relay or netem.py port (default: {PORT})")
+parser.add_argument("--video", help="Video source: camera index, synthetic, file:<path> or rec:<dir> (default: 0)")
+parser.add_argument("--audio_in", help="Audio source: mic, tone[:<hz>], noise, wav:<path> or rec:<dir> (default: mic)")
+parser.add_argument("--audio_out", choices=["speaker", "null"], help="Audio sink (default: speaker)")
+parser.add_argument("--display", choices=["window", "null"], help="Video display (default: window)")
+parser.add_argument("--headless", action="store_true", help="Synthetic media and null sinks, no devices")
+parser.add_argument("--simulcast", type=int, choices=[1, 2, 3], default=1, help="Video layers sent per frame")
+parser.add_argument("--no_vad", action="store_true", help="Send every audio chunk, silent or not")
+parser.add_argument("--render_fps", type=float, default=30, help="Grid refresh rate cap (default: 30)")
+parser.add_argument("--decode_workers", type=int, default=2, help="Video decode threads (default: 2)")
+parser.add_argument("--metrics_port", type=int, help="Serve Prometheus metrics on this localhost port")
+parser.add_argument("--metrics_json", help="Append a JSON metrics snapshot to this file every 5 seconds")
+parser.add_argument("--trace_every", type=int, default=0, help="Record spans for one frame in N (default: off)")
+parser.add_argument("--duration", type=float, help="Seconds to run before hanging up (default: until Enter)")
+parser.add_argument("--startup_json", help="Append the startup milestones to this file as a JSON line")
+args = parser.parse_args()
+startup.path = args.startup_json
+if args.metrics_port:
+    metrics.serve(args.metrics_port)
+if args.metrics_json:
+    metrics.SnapshotWriter(args.metrics_json).start()
+metrics.TRACER.sample_every = args.trace_every
+args.video = args.video or ("synthetic" if args.headless else "0")
+args.audio_in = args.audio_in or ("tone" if args.headless else "mic")
+args.audio_out = args.audio_out or ("null" if args.headless else "speaker")
+args.display = args.display or ("null" if args.headless else "window")
+room = args.room
+audio_codec = args.audio_codec
+voice_rate = 16000 if audio_codec != "pcm" else None  # resample compressed voice to 16 kHz
 
 chunk = 1024  # Record in chunks of 1024 samples
-sample_format = pyaudio.paInt16  # 16 bits per sample
 channels = 1  # Changed from 2 to 1 (mono audio)
 fs = 44100  # Record at 44100 samples per second
 seconds = 3
 
-print("[DEBUG] Setting up sockets")
-audio_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-print(f"[DEBUG] Connecting to server at {IP}")
-s.connect((IP, 1222))
-audio_socket.connect((IP, PORT))
-print("[DEBUG] Connected successfully")
-
-plt.show()
 name = "client"
 img = None
 print("[DEBUG] Creating client object")
 obj = myClass(name, img)
-obj.inititate(s, audio_socket)
-print("[DEBUG] Press Enter to stop")
-input()
+
+# joining the room, opening the devices and warming up the codecs don't depend on each other
+print(f"[DEBUG] Connecting to server at {args.ip}:{args.port} and joining room {room}")
+session = RelaySession((args.ip, args.port), room)
+startup.parallel(connected=session.connect, audio=obj.open_audio, camera=obj.open_camera, warm=obj.warm_up)
+print(f"[DEBUG] Joined as participant {session.id}")
+obj.inititate(session, auto=args.headless)
+obj.show(args.duration)
 obj.end()
-s.close()
 print("[DEBUG] Connection closed")
@@ -0,0 +1,182 @@
+import multiprocessing
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+ENCODE = 0
+DECODE = 1
+SLOT_SIZE = 1920 * 1080 * 3  # one 1080p BGR frame
+
+
+class FrameRing:
+    # Fixed-size frame slots in one shared memory block. The owner creates it;
+    # workers attach by name and read/write frames in place, so a raw frame
+    # crosses the process boundary without being pickled.
+    def __init__(self, slots, slot_size=SLOT_SIZE, name=None):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=slots * slot_size)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_size)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _run(op, data, params):
+    # The actual codec call, shared by thread and process workers
+    if op == ENCODE:
+        ok, jpeg = cv2.imencode(".jpg", data, params)
+        return jpeg.tobytes() if ok else None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _process_worker(ring_name, slots, slot_size, tasks, results):
+    ring = FrameRing(slots, slot_size, ring_name)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            job, op, slot, shape, data, params = task
+            try:
+                if op == ENCODE:
+                    result = _run(op, ring.view(slot, shape), params)
+                else:
+                    frame = _run(op, data, params)
+                    result = None
+                    if frame is not None and frame.nbytes <= slot_size:
+                        ring.view(slot, frame.shape)[...] = frame
+                        result = frame.shape
+            except Exception:
+                result = None
+            results.put((job, result))
+    finally:
+        ring.close()
+
+
+def _thread_worker(tasks, results):
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job, op, slot, shape, data, params = task
+        try:
+            result = _run(op, data, params)
+        except Exception:
+            result = None
+        results.put((job, result))
+
+
+class CodecPool:
+    # JPEG encode/decode on several workers, with results handed back in
+    # submission order. `kind="thread"` relies on OpenCV releasing the GIL;
+    # `kind="process"` moves raw frames through a FrameRing, one slot per job in
+    # flight, so submit() blocks (or raises queue.Empty after `timeout`) once
+    # all slots are busy. submit() and get() may run on different threads.
+    def __init__(self, workers=2, kind="process", slots=None, slot_size=SLOT_SIZE):
+        self.workers = workers
+        self.kind = kind
+        slots = slots or 2 * workers
+        self.free = queue.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.pending = {}
+        self.done = {}
+        self.next_job = 0
+        self.next_result = 0
+        self.ring = None
+        if kind == "process":
+            self.ring = FrameRing(slots, slot_size)
+            self.tasks = multiprocessing.Queue()
+            self.results = multiprocessing.Queue()
+            self.procs = [
+                multiprocessing.Process(
+                    target=_process_worker,
+                    args=(self.ring.name, slots, slot_size, self.tasks, self.results),
+                    daemon=True,
+                )
+                for _ in range(workers)
+            ]
+        elif kind == "thread":
+            self.tasks = queue.Queue()
+            self.results = queue.Queue()
+            self.procs = [
+                threading.Thread(target=_thread_worker, args=(self.tasks, self.results), daemon=True)
+                for _ in range(workers)
+            ]
+        else:
+            raise ValueError(f"Unknown pool kind {kind!r}")
+        for proc in self.procs:
+            proc.start()
+
+    def submit(self, op, data, params=None, context=None, timeout=None):
+        slot = self.free.get(timeout=timeout)
+        job = self.next_job
+        self.next_job += 1
+        shape = None
+        if self.ring is not None:
+            if op == ENCODE:
+                if data.nbytes > self.ring.slot_size:
+                    self.free.put(slot)
+                    raise ValueError(f"Frame of {data.nbytes} bytes does not fit a {self.ring.slot_size} byte slot")
+                shape = data.shape
+                self.ring.view(slot, shape)[...] = data
+                data = None
+            else:
+                data = bytes(data)
+        self.pending[job] = (op, slot, context)
+        self.tasks.put((job, op, slot, shape, data, params))
+        return job
+
+    def encode(self, frame, params, context=None, timeout=None):
+        return self.submit(ENCODE, frame, params, context, timeout)
+
+    def decode(self, data, context=None, timeout=None):
+        return self.submit(DECODE, data, None, context, timeout)
+
+    def get(self, timeout=None):
+        # Next result in submission order as (context, result); result is JPEG
+        # bytes for an encode, a BGR frame for a decode, None if it failed.
+        # Raises queue.Empty if it is not ready within `timeout`.
+        while self.next_result not in self.done:
+            job, result = self.results.get(timeout=timeout)
+            self.done[job] = result
+        job = self.next_result
+        self.next_result += 1
+        result = self.done.pop(job)
+        op, slot, context = self.pending.pop(job)
+        if self.ring is not None and op == DECODE and result is not None:
+            result = self.ring.view(slot, result).copy()
+        self.free.put(slot)
+        return context, result
+
+    def warm_up(self, shape=(480, 640, 3)):
+        # A job per worker and back, so the first frames do not wait for the workers to start
+        frame = np.zeros(shape, dtype=np.uint8)
+        for _ in range(self.workers):
+            self.encode(frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+        for _ in range(self.workers):
+            self.get()
+
+    def in_flight(self):
+        return self.next_job - self.next_result
+
+    def close(self):
+        for _ in self.procs:
+            self.tasks.put(None)
+        for proc in self.procs:
+            proc.join(1.0)
+        if self.ring is not None:
+            self.ring.close()
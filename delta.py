@@ -0,0 +1,151 @@
+import struct
+from threading import Lock
+
+import cv2
+import numpy as np
+
+# Tile payload: width u16 | height u16 | tile u8 | flags u8 | count u16, then
+# `count` big-endian u16 tile indices (row-major over the tile grid) and one JPEG
+# holding the changed tiles packed into a mosaic in the same order.
+TILE_HEADER = struct.Struct("!HHBBH")
+KEYFRAME = 1
+
+
+class TileEncoder:
+    # Sends only the tiles that differ from what the receiver is known to have.
+    # The reference is the state of the last acknowledged frame; every frame
+    # carries all tiles changed since then, so the receiver can apply any of them
+    # (and skip superseded ones) without its canvas drifting.
+    def __init__(self, tile=32, threshold=6.0, keyframe_interval=150, max_pending=60):
+        self.tile = tile
+        self.threshold = threshold
+        self.keyframe_interval = keyframe_interval
+        self.max_pending = max_pending
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.pending = []
+        self.shape = None
+        self.frames = 0
+
+    def grid(self, frame):
+        h, w = frame.shape[:2]
+        t = self.tile
+        return -(-h // t), -(-w // t)
+
+    def pad(self, frame):
+        gh, gw = self.grid(frame)
+        h, w = frame.shape[:2]
+        if (gh * self.tile, gw * self.tile) == (h, w):
+            return frame
+        return cv2.copyMakeBorder(frame, 0, gh * self.tile - h, 0, gw * self.tile - w, cv2.BORDER_REPLICATE)
+
+    def tiles(self, frame):
+        # (gh, gw, t, t, c) view of a padded frame
+        gh, gw = self.grid(frame)
+        t = self.tile
+        return frame.reshape(gh, t, gw, t, -1).swapaxes(1, 2)
+
+    def changed(self, frame):
+        # per-tile sum of absolute differences, accumulated in uint32; a tile has
+        # changed when the mean difference per sample exceeds the threshold
+        gh, gw = self.grid(frame)
+        t = self.tile
+        diff = cv2.absdiff(frame, self.reference).reshape(gh, t, gw, -1)  # rows of t * channels samples
+        sad = diff.sum(axis=(1, 3), dtype=np.uint32)
+        samples = t * diff.shape[-1]  # t * t * channels
+        return sad > self.threshold * samples
+
+    def encode(self, frame, quality=80, keyframe=False):
+        # Returns (payload, token); pass the token to on_send once the sequence number is known
+        h, w = frame.shape[:2]
+        padded = self.pad(frame)
+        with self.lock:
+            if self.shape != padded.shape:
+                self.reset()
+                self.shape = padded.shape
+            keyframe = keyframe or self.frames % self.keyframe_interval == 0 or len(self.pending) > self.max_pending
+            if keyframe and len(self.pending) > self.max_pending:
+                self.pending = []
+            self.frames += 1
+
+            gh, gw = self.grid(padded)
+            if self.reference is None or keyframe:
+                mask = np.ones((gh, gw), dtype=bool)
+            else:
+                mask = self.changed(padded)
+                for entry in self.pending:
+                    mask |= entry["mask"]
+            entry = {"seq": None, "mask": mask, "frame": padded, "keyframe": bool(mask.all())}
+            self.pending.append(entry)
+
+        indices = np.flatnonzero(mask)
+        flags = KEYFRAME if keyframe else 0
+        header = TILE_HEADER.pack(w, h, self.tile, flags, len(indices))
+        if not len(indices):
+            return header, entry
+
+        t = self.tile
+        changed = self.tiles(padded)[mask]
+        cols = int(np.ceil(np.sqrt(len(indices))))
+        rows = -(-len(indices) // cols)
+        if rows * cols != len(changed):
+            filler = np.zeros((rows * cols - len(changed), t, t, changed.shape[-1]), dtype=changed.dtype)
+            changed = np.concatenate([changed, filler])
+        mosaic = changed.reshape(rows, cols, t, t, -1).swapaxes(1, 2).reshape(rows * t, cols * t, -1)
+        jpeg = cv2.imencode(".jpg", mosaic, [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1]
+        return b"".join([header, indices.astype(">u2").tobytes(), jpeg.tobytes()]), entry
+
+    def on_send(self, token, seq):
+        token["seq"] = seq
+
+    def on_ack(self, seq):
+        # The receiver has applied `seq`: its canvas now equals that frame's source in
+        # every tile the frame carried and the previous reference elsewhere.
+        with self.lock:
+            for i, entry in enumerate(self.pending):
+                if entry["seq"] == seq:
+                    break
+            else:
+                return
+            if self.reference is None:
+                if not entry["mask"].all():
+                    return
+                self.reference = entry["frame"].copy()
+            else:
+                self.tiles(self.reference)[entry["mask"]] = self.tiles(entry["frame"])[entry["mask"]]
+            del self.pending[: i + 1]
+
+
+class TileDecoder:
+    def __init__(self):
+        self.canvas = None
+        self.size = None
+
+    def decode(self, payload):
+        # Patches the local canvas and returns a copy of it, or None if the frame
+        # cannot be applied yet (no keyframe seen for this size).
+        payload = memoryview(payload)
+        w, h, t, flags, count = TILE_HEADER.unpack_from(payload)
+        gh, gw = -(-h // t), -(-w // t)
+        complete = count == gh * gw
+        if self.size != (w, h, t):
+            if not complete:
+                return None
+            self.canvas = np.zeros((gh * t, gw * t, 3), dtype=np.uint8)
+            self.size = (w, h, t)
+
+        if count:
+            offset = TILE_HEADER.size
+            indices = np.frombuffer(payload, dtype=">u2", count=count, offset=offset)
+            jpeg = np.frombuffer(payload, dtype=np.uint8, offset=offset + 2 * count)
+            mosaic = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            if mosaic is None:
+                return None
+            rows, cols = mosaic.shape[0] // t, mosaic.shape[1] // t
+            tiles = mosaic.reshape(rows, t, cols, t, 3).swapaxes(1, 2).reshape(rows * cols, t, t, 3)
+            grid = self.canvas.reshape(gh, t, gw, t, 3).swapaxes(1, 2)
+            grid[indices // gw, indices % gw] = tiles[:count]
+        return self.canvas[:h, :w].copy()
@@ -0,0 +1,59 @@
+HEADERSIZE = 10
+
+
+class FrameReader:
+    # Reads length-prefixed frames from a blocking socket with recv_into.
+    # Payloads land in one reusable buffer that grows to the largest frame seen,
+    # and are handed out as memoryviews. A view is only valid until the next
+    # read, so copy it (bytes(view)) if it has to outlive the loop iteration.
+    def __init__(self, sock, initial_size=65536, header_size=HEADERSIZE):
+        self.sock = sock
+        self.header_size = header_size
+        self.header = bytearray(header_size)
+        self.header_view = memoryview(self.header)
+        self.buffer = bytearray(initial_size)
+        self.view = memoryview(self.buffer)
+
+    def reserve(self, size):
+        if size > len(self.buffer):
+            self.view.release()
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+            self.view = memoryview(self.buffer)
+
+    def read_into(self, view):
+        # Keep reading until the view is full; recv may return short counts.
+        got = 0
+        size = len(view)
+        while got < size:
+            n = self.sock.recv_into(view[got:], size - got)
+            if n == 0:
+                raise ConnectionError("Socket closed by peer")
+            got += n
+        return view
+
+    def read_header(self, size=None):
+        size = self.header_size if size is None else size
+        if size > len(self.header):
+            self.header_view.release()
+            self.header = bytearray(size)
+            self.header_view = memoryview(self.header)
+        return self.read_into(self.header_view[:size])
+
+    def read_payload(self, size):
+        self.reserve(size)
+        return self.read_into(self.view[:size])
+
+    def read_length(self, size=4):
+        return int.from_bytes(self.read_header(size), byteorder="big")
+
+    def read_frame(self):
+        # 10-byte left-aligned ASCII length header followed by the payload
+        return self.read_payload(int(bytes(self.read_header())))
+
+    def read_sized(self, size=4):
+        # big-endian binary length prefix followed by the payload
+        return self.read_payload(self.read_length(size))
+
+
+def make_header(size):
+    return bytes("{:<{}}".format(size, HEADERSIZE), "utf-8")
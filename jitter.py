@@ -0,0 +1,210 @@
+import time
+from threading import Lock
+
+import numpy as np
+
+
+class AudioJitterBuffer:
+    # Reorders incoming PCM chunks by sequence number and plays them out after an
+    # adaptive delay. get() never blocks and always returns exactly `chunk`
+    # samples: real audio when it is there, otherwise a faded repeat of the last
+    # chunk (packet-loss concealment) that decays to silence.
+    #
+    # The target delay follows the RFC 3550 interarrival jitter estimate. An
+    # underrun conceals without consuming a sequence number, which grows the
+    # delay by one chunk; when more than the target is queued, the oldest chunk
+    # is discarded to shrink it again.
+    #
+    # When the sender stops for silence (comfort noise, see vad.py), underruns
+    # are filled with noise at the signalled level instead, and the next talk
+    # spurt is buffered up to the target delay again before it plays.
+    #
+    # It also keeps track of the capture timestamp of the audio it hands out, so
+    # video can be played out against it (see avsync.py); `sync_delay` is extra
+    # delay the A/V scheduler asks for when video arrives later than audio. That
+    # delay is built up by holding back a chunk (concealing) rather than waiting
+    # for an underrun.
+    def __init__(self, chunk=1024, rate=44100, channels=1, min_delay=0.02, max_delay=0.3, fade_chunks=3):
+        self.chunk = chunk
+        self.rate = rate
+        self.channels = channels
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.fade_chunks = fade_chunks
+        self.lock = Lock()
+        self.packets = {}
+        self.timestamps = {}
+        self.next_seq = None
+        self.leftover = np.zeros(0, dtype=np.int16)
+        self.leftover_timestamp = None
+        self.playing = None  # (capture timestamp us of the last chunk handed out, time.monotonic() then)
+        self.sync_delay = 0.0
+        self.dtx = False  # the sender is silent, not losing packets
+        self.noise_amplitude = 0.0
+        self.rng = np.random.default_rng()
+        self.last = np.zeros(chunk * channels, dtype=np.int16)
+        self.concealed_run = 0
+        self.started = False
+        self.jitter = 0.0
+        self.last_arrival = None
+        self.stats_counts = {
+            "received": 0,
+            "played": 0,
+            "late": 0,
+            "lost": 0,
+            "concealed": 0,
+            "discarded": 0,
+            "comfort": 0,
+        }
+
+    @property
+    def chunk_duration(self):
+        return self.chunk / self.rate
+
+    @property
+    def target_delay(self):
+        return min(self.max_delay, max(self.min_delay, 3 * self.jitter + self.chunk_duration) + self.sync_delay)
+
+    def buffered(self):
+        # seconds of audio queued, including the partially consumed packet
+        samples = sum(len(p) for p in self.packets.values()) + len(self.leftover)
+        return samples / self.channels / self.rate
+
+    def put(self, seq, timestamp, data, now=None):
+        now = time.monotonic() if now is None else now
+        # keep whole samples only, a stray byte would shift everything after it
+        samples = np.frombuffer(data, dtype=np.int16, count=len(data) // 2 // self.channels * self.channels)
+        with self.lock:
+            self.stats_counts["received"] += 1
+            if self.last_arrival is not None:
+                last_seq, last_time, last_ts = self.last_arrival
+                if seq > last_seq:
+                    transit = (now - last_time) - (timestamp - last_ts) / 1e6
+                    self.jitter += (abs(transit) - self.jitter) / 16
+            if self.last_arrival is None or seq > self.last_arrival[0]:
+                self.last_arrival = (seq, now, timestamp)
+
+            if self.next_seq is not None and seq < self.next_seq:
+                self.stats_counts["late"] += 1
+                return
+            self.packets[seq] = samples.copy()
+            self.timestamps[seq] = timestamp
+            if self.dtx:
+                self.dtx = False
+                self.started = False
+
+    def comfort(self, timestamp, level, now=None):
+        # The sender went silent; `level` is its background noise in dBFS
+        with self.lock:
+            self.dtx = True
+            self.noise_amplitude = 32767 * 10 ** (level / 20)
+            if self.playing is None:
+                self.playing = (timestamp, time.monotonic() if now is None else now)
+
+    def comfort_noise(self, n):
+        self.stats_counts["comfort"] += 1
+        # keeps the playout clock running for A/V sync while nothing is received
+        if self.playing is not None:
+            self.playing = (self.playing[0] + n / self.channels / self.rate * 1e6, time.monotonic())
+        if not self.noise_amplitude:
+            return np.zeros(n, dtype=np.int16)
+        return np.clip(self.rng.normal(0, self.noise_amplitude, n), -32768, 32767).astype(np.int16)
+
+    def position(self, now=None):
+        # Capture timestamp (us) of the audio being handed to the output now, None before playback
+        if self.playing is None:
+            return None
+        timestamp, handed_out = self.playing
+        now = time.monotonic() if now is None else now
+        return timestamp + min(now - handed_out, 2 * self.chunk_duration) * 1e6
+
+    def take(self):
+        # Next packet in sequence as (samples, timestamp), None if it has not arrived (yet)
+        if self.next_seq is None:
+            if not self.packets:
+                return None
+            self.next_seq = min(self.packets)
+        samples = self.packets.pop(self.next_seq, None)
+        if samples is not None:
+            timestamp = self.timestamps.pop(self.next_seq, None)
+            self.next_seq += 1
+            return samples, timestamp
+        if self.packets and self.buffered() >= self.target_delay:
+            # a later packet is waiting and we cannot afford to wait longer: lost
+            self.stats_counts["lost"] += 1
+            self.next_seq += 1
+        return None
+
+    def conceal(self, n):
+        self.concealed_run += 1
+        self.stats_counts["concealed"] += 1
+        if self.concealed_run > self.fade_chunks:
+            return np.zeros(n, dtype=np.int16)
+        start = 1.0 - (self.concealed_run - 1) / self.fade_chunks
+        fade = np.linspace(start, start - 1.0 / self.fade_chunks, n, dtype=np.float32)
+        repeat = np.resize(self.last, n)
+        return (repeat * fade).astype(np.int16)
+
+    def get(self):
+        n = self.chunk * self.channels
+        with self.lock:
+            if not self.started:
+                if self.buffered() < self.target_delay:
+                    return self.comfort_noise(n).tobytes() if self.noise_amplitude else bytes(2 * n)
+                self.started = True
+
+            # shrink the delay when far more than the target is queued
+            while self.packets and self.buffered() > self.target_delay + 2 * self.chunk_duration:
+                oldest = min(self.packets)
+                self.packets.pop(oldest)
+                self.timestamps.pop(oldest, None)
+                self.stats_counts["discarded"] += 1
+                if self.next_seq is not None:
+                    self.next_seq = min(self.packets) if self.packets else self.next_seq + 1
+
+            stretch = self.sync_delay and self.packets and self.buffered() + self.chunk_duration < self.target_delay
+            parts = [self.leftover]
+            have = len(self.leftover)
+            # (sample offset in the output, capture timestamp) of each real packet in it
+            marks = [(0, self.leftover_timestamp)] if have and self.leftover_timestamp is not None else []
+            while have < n and not stretch:
+                taken = self.take()
+                if taken is None:
+                    break
+                samples, timestamp = taken
+                if timestamp is not None:
+                    marks.append((have, timestamp))
+                if self.concealed_run:
+                    # fade back in after concealment to avoid a click
+                    ramp = min(len(samples), 64)
+                    samples = samples.copy()
+                    samples[:ramp] = (samples[:ramp] * np.linspace(0, 1, ramp)).astype(np.int16)
+                    self.concealed_run = 0
+                parts.append(samples)
+                have += len(samples)
+
+            if have < n:
+                parts.append(self.comfort_noise(n - have) if self.dtx else self.conceal(n - have))
+            else:
+                self.stats_counts["played"] += 1
+            out = np.concatenate(parts)
+            self.leftover = out[n:]
+            out = out[:n]
+            self.leftover_timestamp = None
+            if marks:
+                offset, timestamp = marks[0]
+                self.playing = (timestamp - offset / self.channels / self.rate * 1e6, time.monotonic())
+                offset, timestamp = marks[-1]
+                self.leftover_timestamp = timestamp + (n - offset) / self.channels / self.rate * 1e6
+            if self.concealed_run == 0:
+                self.last = out
+            return out.tobytes()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.stats_counts)
+            stats["jitter_ms"] = self.jitter * 1000
+            stats["target_ms"] = self.target_delay * 1000
+            stats["buffered_ms"] = self.buffered() * 1000
+            stats["sync_delay_ms"] = self.sync_delay * 1000
+            return stats
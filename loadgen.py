@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from media import SyntheticVideo
+from netem import proxy_process
+from protocol import (
+    ACK,
+    ACK_PAYLOAD,
+    AUDIO,
+    AUDIO_TYPES,
+    JOIN,
+    LEAVE,
+    SIMULCAST,
+    VIDEO,
+    now_us,
+    pack_ack,
+    pack_header,
+    read_message_async,
+    unpack_ack,
+)
+from server_tw import Relay
+from simulcast import encode_layers
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def process_usage(pid):
+    # (cpu seconds, resident bytes) of a process; psutil if present, else /proc
+    if psutil is not None:
+        proc = psutil.Process(pid)
+        times = proc.cpu_times()
+        return times.user + times.system, proc.memory_info().rss
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu, rss
+
+
+def relay_server(ip, port_queue, mix):
+    async def run():
+        relay = Relay(ip, 0, mix=mix)
+        await relay.start()
+        port_queue.put(relay.port)
+        await relay.serve_forever()
+
+    asyncio.run(run())
+
+
+class Participant:
+    # One simulated client: sends paced video and audio with capture timestamps,
+    # acknowledges and timestamps everything it receives
+    def __init__(self, index, room, video, fps, chunk, rate):
+        self.index = index
+        self.room = room
+        self.video = video
+        self.fps = fps
+        self.chunk = chunk
+        self.rate = rate
+        self.sent = {VIDEO: 0, AUDIO: 0}
+        self.received = {VIDEO: 0, AUDIO: 0}
+        self.latencies = []
+        self.rtts = []
+        self.gaps = 0
+        self.video_bytes = 0
+        self.last_seq = {}
+        self.measuring = False
+
+    async def send_loop(self, writer, msg_type, payloads, interval, stop):
+        # several payloads are the simulcast layers of one frame, sent under one seq
+        seq = 0
+        deadline = time.monotonic()
+        while not stop.is_set():
+            for payload in payloads:
+                writer.write(pack_header(msg_type, len(payload), seq=seq))
+                writer.write(payload)
+            await writer.drain()
+            seq += 1
+            self.sent[AUDIO if msg_type == AUDIO else VIDEO] += 1
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    async def receive_loop(self, reader, writer):
+        while True:
+            header, _, data = await read_message_async(reader)
+            now = now_us()
+            if not self.measuring:
+                continue  # still waiting for the start, or draining after the end
+            if header.type == VIDEO:
+                self.received[VIDEO] += 1
+                self.video_bytes += header.length
+                self.latencies.append((now - header.timestamp) / 1000)
+                last = self.last_seq.get(header.stream)
+                if last is not None and header.seq > last + 1:
+                    self.gaps += header.seq - last - 1
+                self.last_seq[header.stream] = header.seq
+                writer.write(pack_header(ACK, ACK_PAYLOAD.size, stream=header.stream) + pack_ack(header))
+            elif header.type in AUDIO_TYPES:
+                self.received[AUDIO] += 1
+            elif header.type == ACK:
+                _, timestamp = unpack_ack(data)
+                self.rtts.append((now - timestamp) / 1000)
+
+    async def run(self, ip, port, duration, start_at):
+        reader, writer = await asyncio.open_connection(ip, port)
+        room = self.room.encode("utf-8")
+        writer.write(pack_header(JOIN, len(room)) + room)
+        # read from the start so nothing queues up before the measurement
+        receiver = asyncio.create_task(self.receive_loop(reader, writer))
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        self.measuring = True
+        stop = asyncio.Event()
+        video_type = SIMULCAST if len(self.video) > 1 else VIDEO
+        tasks = [
+            asyncio.create_task(self.send_loop(writer, video_type, self.video, 1 / self.fps, stop)),
+            asyncio.create_task(self.send_loop(writer, AUDIO, [bytes(2 * self.chunk)], self.chunk / self.rate, stop)),
+        ]
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0.5)  # let in-flight frames arrive
+        self.measuring = False
+        receiver.cancel()
+        writer.write(pack_header(LEAVE, 0))
+        writer.close()
+        return self
+
+
+def room_members(index, clients, room_size):
+    # Participants in the room of client `index`; the last room holds whatever is left over
+    start = index // room_size * room_size
+    return min(room_size, clients - start)
+
+
+def client_process(ip, port, indices, clients, room_size, video, fps, chunk, rate, duration, start_at, results):
+    async def run():
+        participants = [Participant(i, f"load-{i // room_size}", video, fps, chunk, rate) for i in indices]
+        return await asyncio.gather(*(p.run(ip, port, duration, start_at) for p in participants))
+
+    done = asyncio.run(run())
+    results.put(
+        {
+            "sent": sum(p.sent[VIDEO] for p in done),
+            # every frame is expected by the other members of the sender's room
+            "expected": sum(p.sent[VIDEO] * (room_members(p.index, clients, room_size) - 1) for p in done),
+            "received": sum(p.received[VIDEO] for p in done),
+            "audio_sent": sum(p.sent[AUDIO] for p in done),
+            "audio_received": sum(p.received[AUDIO] for p in done),
+            "gaps": sum(p.gaps for p in done),
+            "video_bytes": sum(p.video_bytes for p in done),
+            "latencies": [x for p in done for x in p.latencies],
+            "rtts": [x for p in done for x in p.rtts],
+        }
+    )
+
+
+def run_level(ip, port, server_pid, clients, args, video):
+    # Runs `clients` participants spread over worker processes, returns the merged report
+    processes = max(1, min(args.processes, clients))
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.0 + clients * 0.005  # everyone connected before traffic starts
+    workers = []
+    for i in range(processes):
+        indices = list(range(i, clients, processes))
+        options = (clients, args.room_size, video, args.fps, args.chunk, args.rate, args.duration, start_at)
+        workers.append(multiprocessing.Process(target=client_process, args=(ip, port, indices, *options, results)))
+    for w in workers:
+        w.start()
+    time.sleep(max(0.0, start_at - time.time()))
+    cpu_start, _ = process_usage(server_pid)
+    wall_start = time.monotonic()
+    merged = [results.get() for _ in workers]
+    cpu_end, rss = process_usage(server_pid)
+    wall = time.monotonic() - wall_start
+    for w in workers:
+        w.join()
+
+    keys = ("sent", "expected", "received", "audio_sent", "audio_received", "gaps", "video_bytes")
+    report = {key: sum(r[key] for r in merged) for key in keys}
+    latencies = np.array([x for r in merged for x in r["latencies"]])
+    rtts = np.array([x for r in merged for x in r["rtts"]])
+    report["clients"] = clients
+    if args.target == "relay":
+        # one stream per ordered pair within a room
+        streams = sum(room_members(i, clients, args.room_size) - 1 for i in range(clients))
+        delivered, expected = report["received"], report["expected"]
+    else:
+        # VideoChat sends its own video back; frames it decoded are the ones it acknowledged
+        streams = clients
+        delivered, expected = len(rtts), report["sent"]
+    report["fps"] = report["received"] / max(streams, 1) / args.duration
+    report["kbps"] = report["video_bytes"] * 8 / 1000 / max(streams, 1) / args.duration
+    report["drop"] = max(0.0, 1 - delivered / expected) if expected else 0.0
+    report["p50"], report["p95"], report["p99"] = (
+        np.percentile(latencies, [50, 95, 99]) if len(latencies) else (float("nan"),) * 3
+    )
+    report["rtt_p50"] = np.percentile(rtts, 50) if len(rtts) else float("nan")
+    report["cpu"] = (cpu_end - cpu_start) / wall * 100
+    report["rss"] = rss / 1e6
+    return report
+
+
+def start_target(args):
+    # Returns (port, pid, stop callback) for the server under test
+    if args.target == "relay":
+        port_queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=relay_server, args=(args.ip, port_queue, not args.no_mix), daemon=True)
+        proc.start()
+        port = port_queue.get(timeout=10)
+        return port, proc.pid, lambda: (proc.terminate(), proc.join())
+    # VideoChat serves one client at a time on its fixed port
+    proc = subprocess.Popen(
+        [sys.executable, "video_app.py", "-m", "server", "--headless"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    time.sleep(2.0)
+    return 12345, proc.pid, lambda: (proc.terminate(), proc.wait())
+
+
+def start_proxy(args, port):
+    # Puts netem.py between the clients and the server; returns (port, stop callback)
+    port_queue = multiprocessing.Queue()
+    options = (args.ip, args.ip, port, args.profile, args.seed, port_queue, args.netem_log)
+    proc = multiprocessing.Process(target=proxy_process, args=options, daemon=True)
+    proc.start()
+    return port_queue.get(timeout=10), lambda: (proc.terminate(), proc.join())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the relay and VideoChat server")
+    parser.add_argument("-t", "--target", choices=["relay", "videochat"], default="relay", help="Server to load")
+    parser.add_argument("-i", "--ip", default="127.0.0.1", help="Address to bind and connect (default: 127.0.0.1)")
+    parser.add_argument("-c", "--clients", type=int, nargs="+", default=[2, 10, 50, 100], help="Concurrency ramp")
+    parser.add_argument("-r", "--room_size", type=int, default=2, help="Participants per room (default: 2)")
+    parser.add_argument("-d", "--duration", type=float, default=10, help="Seconds per level (default: 10)")
+    parser.add_argument("-W", "--width", type=int, default=640, help="Video width (default: 640)")
+    parser.add_argument("-H", "--height", type=int, default=480, help="Video height (default: 480)")
+    parser.add_argument("-q", "--quality", type=int, default=70, help="JPEG quality (default: 70)")
+    parser.add_argument("--fps", type=float, default=15, help="Video frames per second (default: 15)")
+    parser.add_argument("--rate", type=int, default=44100, help="Audio sample rate (default: 44100)")
+    parser.add_argument("--chunk", type=int, default=1024, help="Audio samples per message (default: 1024)")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(), help="Client worker processes")
+    parser.add_argument("--no_mix", action="store_true", help="Relay forwards audio instead of mixing")
+    parser.add_argument("--simulcast", type=int, choices=[1, 2, 3], default=1, help="Video layers per frame")
+    parser.add_argument("--profile", help="Network profile to impair the clients' links with (see netem.py)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the network profile (default: 0)")
+    parser.add_argument("--netem_log", help="Append the impairment proxy's JSON lines log to this file")
+    args = parser.parse_args()
+    if args.target == "videochat":
+        args.clients = [1]
+
+    # one representative JPEG of the synthetic pattern stands in for every frame
+    _, frame = SyntheticVideo(args.width, args.height).read()
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), args.quality]
+    if args.simulcast > 1:
+        video = encode_layers(frame, params, args.simulcast)
+    else:
+        video = [cv2.imencode(".jpg", frame, params)[1].tobytes()]
+    print(
+        f"{args.target}: {args.width}x{args.height} @ {args.fps:g} fps, "
+        f"{'/'.join(str(len(v)) for v in video)} byte frames, "
+        f"audio {args.rate} Hz / {args.chunk}, rooms of {args.room_size}"
+        + (f", {args.profile} network (seed {args.seed})" if args.profile else "")
+    )
+
+    port, pid, stop = start_target(args)
+    if args.profile:
+        port, stop_proxy = start_proxy(args, port)
+        stop_target = stop
+        stop = lambda: (stop_proxy(), stop_target())  # noqa: E731
+    try:
+        for clients in args.clients:
+            r = run_level(args.ip, port, pid, clients, args, video)
+            print(
+                f"clients={r['clients']:<5} fps={r['fps']:>6.1f} video={r['kbps']:>7.0f} kbps "
+                f"drop={r['drop'] * 100:>5.1f}% "
+                f"latency p50={r['p50']:>7.1f} p95={r['p95']:>7.1f} p99={r['p99']:>7.1f} ms "
+                f"rtt p50={r['rtt_p50']:>7.1f} ms server cpu={r['cpu']:>5.1f}% rss={r['rss']:>6.1f} MB"
+            )
+    finally:
+        stop()
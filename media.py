@@ -0,0 +1,279 @@
+import time
+import wave
+
+import cv2
+import numpy as np
+
+# Capture, playback and display backends. Video sources look like
+# cv2.VideoCapture (read/isOpened/release), audio sources and sinks like a
+# PyAudio stream (read/write/stop_stream/close), so the synthetic ones drop in
+# wherever the devices were used. Synthetic sources pace themselves in real
+# time, the way a camera or sound card would.
+
+
+class Pacer:
+    def __init__(self, interval):
+        self.interval = interval
+        self.deadline = None
+
+    def wait(self):
+        now = time.monotonic()
+        if self.deadline is None or now - self.deadline > 10 * self.interval:
+            self.deadline = now  # first call, or fell far behind: resync
+        else:
+            time.sleep(max(0.0, self.deadline - now))
+        self.deadline += self.interval
+
+
+class SyntheticVideo:
+    # Scrolling gradient with a bouncing box and a frame counter, so every frame
+    # differs and motion is easy to eyeball
+    def __init__(self, width=640, height=480, fps=30):
+        self.width = width
+        self.height = height
+        self.pacer = Pacer(1.0 / fps)
+        self.frame_count = 0
+        yy, xx = np.mgrid[0:height, 0:width]
+        self.background = np.stack(
+            [xx * 255 // width, yy * 255 // height, (xx + yy) * 127 // (width + height)], axis=-1
+        ).astype(np.uint8)
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        self.pacer.wait()
+        i = self.frame_count
+        self.frame_count += 1
+        frame = np.roll(self.background, i * 2, axis=1)
+        size = min(self.width, self.height) // 4
+        x = int((self.width - size) * (0.5 + 0.5 * np.sin(i / 20)))
+        y = int((self.height - size) * (0.5 + 0.5 * np.cos(i / 31)))
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (40, 200, 240), -1)
+        cv2.putText(frame, str(i), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class FileVideo:
+    # Plays a video file at its own frame rate, looping at the end
+    def __init__(self, path, loop=True):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.pacer = Pacer(1.0 / (fps if fps and fps > 0 else 30))
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        self.pacer.wait()
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class SyntheticAudio:
+    # Sine tone and/or white noise. Runs in real time: read(n) returns once n
+    # samples' worth of time has passed, like a blocking microphone read.
+    def __init__(self, rate=44100, channels=1, frequency=440.0, amplitude=0.3, noise=0.0, seed=0):
+        self.rate = rate
+        self.channels = channels
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.position = 0
+        self.pacer = None
+
+    def samples(self, n):
+        t = (self.position + np.arange(n)) / self.rate
+        self.position += n
+        signal = self.amplitude * np.sin(2 * np.pi * self.frequency * t) if self.frequency else np.zeros(n)
+        if self.noise:
+            signal = signal + self.noise * self.rng.standard_normal(n)
+        return np.clip(signal * 32767, -32768, 32767).astype(np.int16)
+
+    def read(self, n, exception_on_overflow=False):
+        if self.pacer is None or self.pacer.interval != n / self.rate:
+            self.pacer = Pacer(n / self.rate)
+        self.pacer.wait()
+        return np.repeat(self.samples(n), self.channels).tobytes()
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class WavAudio(SyntheticAudio):
+    # 16-bit WAV file played in a loop. The file has to match the capture rate.
+    def __init__(self, path, rate=44100, channels=1):
+        super().__init__(rate, channels)
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("Only 16-bit WAV files are supported")
+            if wav.getframerate() != rate:
+                raise ValueError(f"{path} is {wav.getframerate()} Hz, expected {rate}")
+            data = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            self.data = data[:: wav.getnchannels()]  # first channel
+        if not len(self.data):
+            raise ValueError(f"{path} has no audio")
+
+    def samples(self, n):
+        indices = (self.position + np.arange(n)) % len(self.data)
+        self.position += n
+        return self.data[indices]
+
+
+class NullAudioSink:
+    # Discards audio but blocks like a sound card, so playback keeps real time
+    def __init__(self, rate=44100, channels=1):
+        self.rate = rate
+        self.channels = channels
+        self.pacer = None
+        self.written = 0
+
+    def write(self, data):
+        frames = len(data) // 2 // self.channels
+        if self.pacer is None or self.pacer.interval != frames / self.rate:
+            self.pacer = Pacer(frames / self.rate)
+        self.pacer.wait()
+        self.written += frames
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class WindowDisplay:
+    def show(self, name, frame):
+        cv2.imshow(name, frame)
+
+    def resize(self, name, width, height):
+        cv2.resizeWindow(name, width, height)
+
+    def poll(self):
+        # Key pressed since the last call, -1 if none
+        return cv2.waitKey(1)
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+class NullDisplay:
+    def __init__(self):
+        self.frames = {}
+
+    def show(self, name, frame):
+        self.frames[name] = self.frames.get(name, 0) + 1
+
+    def resize(self, name, width, height):
+        pass
+
+    def poll(self):
+        time.sleep(0.001)  # stands in for waitKey's event loop wait
+        return -1
+
+    def close(self):
+        pass
+
+
+_pyaudio = None
+
+
+def pyaudio_instance():
+    # PyAudio is only needed (and only imported) for real devices
+    global _pyaudio
+    if _pyaudio is None:
+        import pyaudio
+
+        _pyaudio = pyaudio.PyAudio()
+    return _pyaudio
+
+
+def open_video(spec, width=640, height=480, fps=30):
+    # "synthetic", "file:<path>", "rec:<recording dir>" or a camera index
+    spec = str(spec)
+    if spec == "synthetic":
+        return SyntheticVideo(width, height, fps)
+    if spec.startswith("file:"):
+        return FileVideo(spec[len("file:") :])
+    if spec.startswith("rec:"):
+        from recording import RecordedVideo
+
+        return RecordedVideo(spec[len("rec:") :])
+    return cv2.VideoCapture(int(spec))
+
+
+def open_audio_source(spec, rate=44100, channels=1, chunk=1024, device=None):
+    # "mic", "tone[:<hz>]", "noise", "wav:<path>" or "rec:<recording dir>"
+    if spec == "mic":
+        import pyaudio
+
+        return pyaudio_instance().open(
+            format=pyaudio.paInt16,
+            channels=channels,
+            rate=rate,
+            input=True,
+            input_device_index=device,
+            frames_per_buffer=chunk,
+        )
+    if spec == "tone" or spec.startswith("tone:"):
+        frequency = float(spec.split(":", 1)[1]) if ":" in spec else 440.0
+        return SyntheticAudio(rate, channels, frequency)
+    if spec == "noise":
+        return SyntheticAudio(rate, channels, frequency=0, noise=0.1)
+    if spec.startswith("wav:"):
+        return WavAudio(spec[len("wav:") :], rate, channels)
+    if spec.startswith("rec:"):
+        from recording import RecordedAudio
+
+        return RecordedAudio(spec[len("rec:") :], rate, channels)
+    raise ValueError(f"Unknown audio source {spec!r}")
+
+
+def open_audio_sink(spec, rate=44100, channels=1, chunk=1024):
+    # "speaker" or "null"
+    if spec == "speaker":
+        import pyaudio
+
+        return pyaudio_instance().open(
+            format=pyaudio.paInt16, channels=channels, rate=rate, output=True, frames_per_buffer=chunk
+        )
+    if spec == "null":
+        return NullAudioSink(rate, channels)
+    raise ValueError(f"Unknown audio sink {spec!r}")
+
+
+def open_display(spec):
+    # "window" or "null"
+    if spec == "window":
+        return WindowDisplay()
+    if spec == "null":
+        return NullDisplay()
+    raise ValueError(f"Unknown display {spec!r}")
+
+
+def close_audio():
+    global _pyaudio
+    if _pyaudio is not None:
+        _pyaudio.terminate()
+        _pyaudio = None
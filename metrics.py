@@ -0,0 +1,270 @@
+import bisect
+import json
+import threading
+import time
+from collections import deque
+
+# Counters, gauges and histograms for the hot paths, exposed in Prometheus text
+# format over HTTP and as JSON snapshots. The default registry starts disabled:
+# it then hands out one shared no-op metric, so instrumented code costs a method
+# call. Call enable() before the instrumented objects are built.
+
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+
+class NullMetric:
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, fn=None):
+        self.lock = threading.Lock()
+        self.value = 0
+        self.fn = fn  # read an existing counter instead of keeping one
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def get(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Registry:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.help = {}
+
+    def get(self, cls, name, help, labels, **kwargs):
+        if not self.enabled:
+            return NULL_METRIC
+        key = _key(name, labels)
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None or kwargs.get("fn") is not None:
+                metric = self.metrics[key] = cls(**kwargs)
+                self.help.setdefault(name, (cls.kind, help))
+            return metric
+
+    def counter(self, name, help="", fn=None, **labels):
+        return self.get(Counter, name, help, labels, fn=fn)
+
+    def gauge(self, name, help="", fn=None, **labels):
+        return self.get(Gauge, name, help, labels, fn=fn)
+
+    def histogram(self, name, help="", buckets=LATENCY_BUCKETS, **labels):
+        return self.get(Histogram, name, help, labels, buckets=buckets)
+
+    def remove(self, name, **labels):
+        with self.lock:
+            self.metrics.pop(_key(name, labels), None)
+
+    def items(self):
+        with self.lock:
+            return sorted(self.metrics.items())
+
+    def render(self):
+        # Prometheus text exposition format
+        lines, seen = [], set()
+        for (name, labels), metric in self.items():
+            if name not in seen:
+                kind, help = self.help[name]
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                seen.add(name)
+            if metric.kind == "histogram":
+                value = metric.get()
+                for bound, count in value["buckets"]:
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {metric.get()}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        out = {}
+        for (name, labels), metric in self.items():
+            value = metric.get()
+            if metric.kind == "histogram":
+                value = {"sum": value["sum"], "count": value["count"], "buckets": value["buckets"][:-1]}
+            out[name + _format_labels(labels)] = value
+        return out
+
+
+class Tracer:
+    # Per-frame spans for one frame in `sample_every` (0 = off). Sampling is keyed
+    # on the frame's sequence number, so every stage that sees the frame agrees
+    # on whether it is traced without passing any context along.
+    def __init__(self, sample_every=0, capacity=4096):
+        self.sample_every = sample_every
+        self.spans = deque(maxlen=capacity)
+
+    def sampled(self, key):
+        return self.sample_every and key % self.sample_every == 0
+
+    def record(self, name, key, start, end):
+        # start/end from time.perf_counter()
+        self.spans.append({"name": name, "frame": key, "start": start, "duration_ms": (end - start) * 1000})
+
+    def recent(self, limit=500):
+        return list(self.spans)[-limit:]
+
+
+REGISTRY = Registry()
+TRACER = Tracer()
+
+
+def enable():
+    REGISTRY.enabled = True
+
+
+def enabled():
+    return REGISTRY.enabled
+
+
+def counter(name, help="", fn=None, **labels):
+    return REGISTRY.counter(name, help, fn, **labels)
+
+
+def gauge(name, help="", fn=None, **labels):
+    return REGISTRY.gauge(name, help, fn, **labels)
+
+
+def histogram(name, help="", buckets=LATENCY_BUCKETS, **labels):
+    return REGISTRY.histogram(name, help, buckets, **labels)
+
+
+def remove(name, **labels):
+    # For metrics of things that go away, e.g. a participant's queue
+    REGISTRY.remove(name, **labels)
+
+
+def serve(port, host="127.0.0.1"):
+    # Enables the registry and serves it from a daemon thread. http.server is
+    # imported here, it is a noticeable part of the startup of every entry point.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        # /metrics (Prometheus), /metrics.json, /traces[?sample=N] (sets the sampling)
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/metrics":
+                body, content_type = REGISTRY.render().encode(), "text/plain; version=0.0.4"
+            elif url.path == "/metrics.json":
+                body, content_type = json.dumps(REGISTRY.snapshot()).encode(), "application/json"
+            elif url.path == "/traces":
+                query = parse_qs(url.query)
+                if "sample" in query:
+                    TRACER.sample_every = int(query["sample"][0])
+                body = json.dumps({"sample_every": TRACER.sample_every, "spans": TRACER.recent()}).encode()
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class SnapshotWriter(threading.Thread):
+    # Appends one JSON line per interval: time, all metrics and per-second rates
+    # of the counters since the previous line
+    def __init__(self, path, interval=5.0):
+        super().__init__(name="metrics-json", daemon=True)
+        enable()
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        previous, last = {}, time.monotonic()
+        while not self.stop_event.wait(self.interval):
+            now = time.monotonic()
+            values = REGISTRY.snapshot()
+            items = REGISTRY.items()
+            counters = [name + _format_labels(labels) for (name, labels), m in items if m.kind == Counter.kind]
+            rates = {name: (values[name] - previous[name]) / (now - last) for name in counters if name in previous}
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "metrics": values, "rates": rates}) + "\n")
+            previous, last = values, now
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+class AudioMixer:
+    # Mixes the audio of every sender in a room on a fixed tick. Each sender's
+    # PCM is queued as it arrives; mix() takes one tick of samples from each
+    # (zero-padded on underrun), sums them once in int32 and gives every
+    # receiver the total minus its own contribution, clipped back to int16.
+    #
+    # A sender only contributes once `prebuffer` ticks are queued, so network
+    # jitter does not chop its audio into tick-sized fragments, and anything
+    # beyond `max_buffer` ticks is dropped from the front to bound the delay.
+    # `delay` is how long the audio of the last mix waited in the queues, on
+    # average over the senders in it.
+    def __init__(self, rate=44100, channels=1, tick=0.02, prebuffer=2, max_buffer=10):
+        self.rate = rate
+        self.channels = channels
+        self.tick = tick
+        self.samples = int(round(rate * tick)) * channels
+        self.prebuffer = prebuffer
+        self.max_buffer = max_buffer
+        self.queues = {}
+        self.active = set()
+        self.delay = 0.0
+        self.stats_counts = {"ticks": 0, "underruns": 0, "dropped": 0}
+
+    def push(self, sender, pcm):
+        samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2)
+        queued = self.queues.get(sender)
+        queued = samples if queued is None else np.concatenate([queued, samples])
+        limit = self.max_buffer * self.samples
+        if len(queued) > limit:
+            self.stats_counts["dropped"] += len(queued) - limit
+            queued = queued[-limit:]
+        self.queues[sender] = queued
+        if len(queued) >= self.prebuffer * self.samples:
+            self.active.add(sender)
+
+    def remove(self, sender):
+        self.queues.pop(sender, None)
+        self.active.discard(sender)
+
+    def take(self, sender):
+        queued = self.queues[sender]
+        frame = queued[: self.samples]
+        self.queues[sender] = queued[self.samples :]
+        if len(frame) < self.samples:
+            # ran dry: pad this tick and wait for a full prebuffer again
+            self.stats_counts["underruns"] += 1
+            self.active.discard(sender)
+            frame = np.concatenate([frame, np.zeros(self.samples - len(frame), dtype=np.int16)])
+        return frame
+
+    def mix(self, receivers):
+        # Returns {receiver: int16 PCM bytes} for one tick, or {} while nobody is talking
+        senders = sorted(self.active)
+        if not senders:
+            return {}
+        self.stats_counts["ticks"] += 1
+        self.delay = sum(len(self.queues[s]) for s in senders) / len(senders) / self.channels / self.rate
+        frames = np.empty((len(senders), self.samples), dtype=np.int32)
+        for row, sender in enumerate(senders):
+            frames[row] = self.take(sender)
+        total = frames.sum(axis=0)
+        everyone = np.clip(total, -32768, 32767).astype(np.int16).tobytes()
+        # all minus-self mixes in one pass, row i is what sender i hears
+        minus_self = np.clip(total - frames, -32768, 32767).astype(np.int16)
+        rows = {sender: row for row, sender in enumerate(senders)}
+        mixes = {}
+        for receiver in receivers:
+            row = rows.get(receiver)
+            if row is None:
+                mixes[receiver] = everyone
+            elif len(senders) > 1:
+                mixes[receiver] = minus_self[row].tobytes()
+        return mixes
+
+    def stats(self):
+        stats = dict(self.stats_counts)
+        stats["senders"] = len(self.active)
+        return stats
@@ -0,0 +1,473 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import time
+from collections import deque, namedtuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", datefmt="%H:%M:%S"
+)
+logger = logging.getLogger(__name__)
+
+# Network impairment proxy: listens where a client would connect, forwards to
+# the relay (or a VideoChat server) and back, and makes the path look like a
+# bad network in user space, without root or tc/netem. Each direction is a Link
+# with its own conditions:
+#   latency, jitter  one-way delay in seconds, jitter drawn from a normal distribution
+#   kbps             bottleneck rate; traffic queues behind it (None: unlimited)
+#   loss             probability a packet is lost
+#   reorder          probability a packet is held back behind the ones after it
+#   queue            seconds of backlog the bottleneck holds before it drops (UDP)
+#                    or stops reading so the sender's TCP window fills (TCP)
+# TCP cannot lose or reorder bytes, so a lost segment is delivered after a
+# retransmission timeout instead, holding up everything behind it the way TCP
+# head-of-line blocking does. A profile is a list of phases that repeats, so
+# conditions can change on a script (congestion bursts, say); every random
+# choice comes from a seeded generator and everything done is logged.
+Conditions = namedtuple(
+    "Conditions", ["latency", "jitter", "kbps", "loss", "reorder", "queue"], defaults=(0.0, 0.0, None, 0.0, 0.0, 0.5)
+)
+Phase = namedtuple("Phase", ["duration", "up", "down"])  # up: client to server, down: server to client
+
+MSS = 1448  # TCP bytes are impaired in segments of this size
+MIN_RTO = 0.2
+
+
+def phase(duration=None, up=None, down=None, **both):
+    # Phase with the same conditions both ways unless `up`/`down` override fields
+    return Phase(duration, Conditions(**{**both, **(up or {})}), Conditions(**{**both, **(down or {})}))
+
+
+PROFILES = {
+    "perfect": [phase()],
+    "3g": [
+        phase(latency=0.1, jitter=0.03, loss=0.01, reorder=0.005, up={"kbps": 400}, down={"kbps": 1600}),
+    ],
+    "wifi": [
+        # a busy access point: mostly fine, with regular bursts of contention
+        phase(8, latency=0.01, jitter=0.01, kbps=8000, loss=0.005),
+        phase(2, latency=0.06, jitter=0.05, kbps=2000, loss=0.05, reorder=0.02, queue=0.3),
+    ],
+    "transcontinental": [phase(latency=0.08, jitter=0.004, kbps=20000, loss=0.002)],
+}
+
+
+def load_profile(spec):
+    # A name from PROFILES, or a JSON file: [{"duration": s, "up": {...}, "down": {...}, <both ways>...}, ...]
+    if spec in PROFILES:
+        return PROFILES[spec]
+    with open(spec) as f:
+        return [phase(**entry) for entry in json.load(f)]
+
+
+def describe(phases):
+    return [{"duration": p.duration, "up": p.up._asdict(), "down": p.down._asdict()} for p in phases]
+
+
+class Schedule:
+    # Which phase of a profile is in force, shared by every link so all
+    # connections see the same network at the same time
+    def __init__(self, phases, log):
+        self.phases = phases
+        self.log = log
+        self.start = time.monotonic()
+        self.cycle = sum(p.duration or 0 for p in phases)
+        self.current = None
+
+    def at(self, now):
+        index = 0
+        if self.cycle and len(self.phases) > 1:
+            t = (now - self.start) % self.cycle
+            # a phase without a duration lasts for good
+            while index < len(self.phases) - 1 and t >= (self.phases[index].duration or float("inf")):
+                t -= self.phases[index].duration
+                index += 1
+        if index != self.current:
+            self.current = index
+            self.log.event("phase", index=index)
+        return self.phases[index]
+
+
+class Link:
+    # One direction of one connection. due() decides when a packet leaves
+    # (or that it is lost) and counts what happened to it.
+    def __init__(self, name, schedule, direction, rng, log, ordered):
+        self.name = name
+        self.schedule = schedule
+        self.direction = direction
+        self.rng = rng
+        self.log = log
+        self.ordered = ordered  # TCP: nothing is dropped or overtaken
+        self.busy_until = 0.0
+        self.last_due = 0.0
+        self.counts = dict.fromkeys(("packets", "bytes", "lost", "queue_drops", "reordered", "retransmits"), 0)
+        self.delay_sum = 0.0
+
+    def conditions(self, now):
+        return getattr(self.schedule.at(now), self.direction)
+
+    def backlog(self, now):
+        return max(0.0, self.busy_until - now)
+
+    def due(self, size, now):
+        # Time the packet is delivered, None if it is not
+        c = self.conditions(now)
+        self.counts["packets"] += 1
+        sent = now
+        if c.kbps:
+            if not self.ordered and self.backlog(now) > c.queue:
+                self.counts["queue_drops"] += 1
+                self.log.packet(self.name, "queue_drop", size)
+                return None
+            sent = max(now, self.busy_until) + size * 8 / (c.kbps * 1000)
+            self.busy_until = sent
+        delay = max(0.0, self.rng.gauss(c.latency, c.jitter)) if c.jitter else c.latency
+        if c.loss and self.rng.random() < c.loss:
+            if not self.ordered:
+                self.counts["lost"] += 1
+                self.log.packet(self.name, "lost", size)
+                return None
+            # resent after a timeout, as TCP would
+            delay += max(MIN_RTO, 4 * c.latency + 4 * c.jitter)
+            self.counts["retransmits"] += 1
+            self.log.packet(self.name, "retransmit", size)
+        elif c.reorder and not self.ordered and self.rng.random() < c.reorder:
+            delay += max(0.01, 2 * c.jitter)
+            self.counts["reordered"] += 1
+            self.log.packet(self.name, "reordered", size)
+        due = sent + delay
+        if self.ordered:
+            due = max(due, self.last_due)
+            self.last_due = due
+        self.counts["bytes"] += size
+        self.delay_sum += due - now
+        return due
+
+    def summary(self):
+        delivered = self.counts["packets"] - self.counts["lost"] - self.counts["queue_drops"]
+        mean = self.delay_sum / delivered * 1000 if delivered else 0.0
+        return {**self.counts, "mean_delay_ms": round(mean, 1)}
+
+
+class ProxyLog:
+    # JSON lines: the run's settings, phase changes, connections, periodic link
+    # summaries and, with `packets`, every packet that was lost, reordered or
+    # resent. Times are seconds since the proxy started.
+    def __init__(self, path=None, packets=False):
+        self.file = open(path, "a") if path else None
+        self.packets = packets
+        self.start = time.monotonic()
+
+    def event(self, kind, **fields):
+        if self.file is not None:
+            record = {"t": round(time.monotonic() - self.start, 4), "event": kind, **fields}
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+
+    def packet(self, link, what, size):
+        if self.packets:
+            self.event(what, link=link, size=size)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ImpairmentProxy:
+    def __init__(
+        self, listen_ip, listen_port, target_ip, target_port, phases, seed=0, log=None, interval=5.0, udp_idle=30.0
+    ):
+        self.listen_ip = listen_ip
+        self.port = listen_port
+        self.target = (target_ip, target_port)
+        self.phases = phases
+        self.seed = seed
+        self.log = log or ProxyLog()
+        self.interval = interval
+        self.udp_idle = udp_idle  # seconds without traffic either way before a UDP session is closed
+        self.schedule = Schedule(phases, self.log)
+        self.links = {}
+        self.connections = 0
+        self.servers = []
+        self.tasks = []
+        self.udp = None
+
+    def link(self, name, direction, ordered):
+        # Each link draws from its own generator, seeded from the run's seed and
+        # its name, so a rerun makes the same choices for the same traffic
+        link = Link(name, self.schedule, direction, random.Random(f"{self.seed}/{name}"), self.log, ordered)
+        self.links[name] = link
+        return link
+
+    async def pipe(self, reader, writer, link):
+        # One TCP direction. Segments leave in order from a queue (timers due at
+        # the same instant may fire in any order), the close after the last one.
+        # While the receiver does not drain what was written, nothing more is
+        # read, so a slow receiver fills the sender's TCP window, not the proxy.
+        loop = asyncio.get_running_loop()
+        in_flight = deque()
+        arrived = asyncio.Event()
+        writable = asyncio.Event()
+        writable.set()
+
+        async def deliver():
+            while True:
+                if not in_flight:
+                    arrived.clear()
+                    await arrived.wait()
+                    continue
+                # due times never decrease (the link is ordered), so the head is next
+                delay = in_flight[0][0] - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                data = in_flight.popleft()[1]
+                if data is None:
+                    writer.close()
+                    return
+                if writer.is_closing():
+                    continue
+                writer.write(data)
+                writable.clear()
+                try:
+                    await writer.drain()
+                except (ConnectionError, OSError):
+                    pass
+                writable.set()
+
+        def send(due, data):
+            in_flight.append((due, data))
+            arrived.set()
+
+        delivery = asyncio.create_task(deliver())
+        try:
+            while True:
+                await writable.wait()
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for i in range(0, len(data), MSS):
+                    now = loop.time()
+                    send(link.due(len(data[i : i + MSS]), now), data[i : i + MSS])
+                    # a full bottleneck stops reading, so the sender's own buffers fill up
+                    overflow = link.backlog(now) - link.conditions(now).queue
+                    if overflow > 0:
+                        await asyncio.sleep(overflow)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            send(max(link.last_due, loop.time()), None)
+            await delivery
+
+    async def handle_tcp(self, client_reader, client_writer):
+        self.connections += 1
+        name = f"tcp{self.connections}"
+        peer = client_writer.get_extra_info("peername")
+        try:
+            server_reader, server_writer = await asyncio.open_connection(*self.target)
+        except OSError as e:
+            logger.warning(f"{name}: cannot reach {self.target}: {e}")
+            client_writer.close()
+            return
+        for w in (client_writer, server_writer):
+            w.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.log.event("open", connection=name, peer=str(peer))
+        logger.info(f"{name}: {peer} -> {self.target}")
+        up, down = self.link(f"{name}/up", "up", True), self.link(f"{name}/down", "down", True)
+        await asyncio.gather(self.pipe(client_reader, server_writer, up), self.pipe(server_reader, client_writer, down))
+        self.log.event("close", connection=name, up=up.summary(), down=down.summary())
+        logger.info(f"{name} closed: up {up.summary()} down {down.summary()}")
+        del self.links[up.name], self.links[down.name]
+
+    async def start(self):
+        server = await asyncio.start_server(self.handle_tcp, self.listen_ip, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.servers.append(server)
+        loop = asyncio.get_running_loop()
+        transport, frontend = await loop.create_datagram_endpoint(
+            lambda: UdpFrontend(self), local_addr=(self.listen_ip, self.port)
+        )
+        self.servers.append(transport)
+        self.udp = frontend
+        self.tasks.append(asyncio.create_task(self.expire_udp()))
+        self.log.event(
+            "start", listen=self.port, target=list(self.target), seed=self.seed, phases=describe(self.phases)
+        )
+        self.tasks.append(asyncio.create_task(self.report()))
+        logger.info(f"Impairing {self.listen_ip}:{self.port} (TCP and UDP) -> {self.target[0]}:{self.target[1]}")
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for name, link in list(self.links.items()):
+                summary = link.summary()
+                self.log.event("summary", link=name, **summary)
+                logger.info(f"{name}: {summary}")
+
+    async def expire_udp(self):
+        while True:
+            await asyncio.sleep(min(self.udp_idle / 2, self.interval))
+            self.udp.expire(asyncio.get_running_loop().time() - self.udp_idle)
+
+    async def serve_forever(self):
+        await self.start()
+        await asyncio.Event().wait()
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+        for server in self.servers:
+            server.close()
+        if self.udp is not None:
+            for session in list(self.udp.sessions.values()):
+                session.close("stop")
+        self.log.event("stop")
+        self.log.close()
+
+
+class UdpFrontend(asyncio.DatagramProtocol):
+    # The proxy's UDP port. Every client address gets its own socket towards the
+    # target, so replies find their way back.
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.transport = None
+        self.sessions = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        session = self.sessions.get(addr)
+        if session is None:
+            session = self.sessions[addr] = UdpSession(self, addr)
+            asyncio.ensure_future(session.open())
+        session.send_up(data)
+
+    def expire(self, idle_since):
+        # Closes the sessions without traffic either way since `idle_since` (loop time)
+        for session in [s for s in self.sessions.values() if s.last_active < idle_since]:
+            session.close("idle")
+
+
+class UdpSession(asyncio.DatagramProtocol):
+    def __init__(self, frontend, addr):
+        proxy = frontend.proxy
+        proxy.connections += 1
+        name = f"udp{proxy.connections}"
+        self.frontend = frontend
+        self.addr = addr
+        self.name = name
+        self.up = proxy.link(f"{name}/up", "up", False)
+        self.down = proxy.link(f"{name}/down", "down", False)
+        self.transport = None
+        self.waiting = []  # datagrams from the client before the upstream socket is open
+        self.closed = False
+        self.last_active = asyncio.get_running_loop().time()
+        proxy.log.event("open", connection=name, peer=str(addr))
+        logger.info(f"{name}: {addr} -> {proxy.target}")
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(lambda: self, remote_addr=self.frontend.proxy.target)
+        except OSError as e:
+            logger.warning(f"{self.name}: cannot reach {self.frontend.proxy.target}: {e}")
+            self.close("unreachable")
+            return
+        if self.closed:
+            transport.close()
+            return
+        self.transport = transport
+        for data in self.waiting:
+            self.transport.sendto(data)
+        self.waiting = None
+
+    def close(self, reason):
+        # Forgets the session; the client's next datagram opens a new one
+        if self.closed:
+            return
+        self.closed = True
+        if self.frontend.sessions.get(self.addr) is self:
+            del self.frontend.sessions[self.addr]
+        if self.transport is not None:
+            self.transport.close()
+        proxy = self.frontend.proxy
+        proxy.log.event("close", connection=self.name, reason=reason, up=self.up.summary(), down=self.down.summary())
+        logger.info(f"{self.name} closed ({reason}): up {self.up.summary()} down {self.down.summary()}")
+        del proxy.links[self.up.name], proxy.links[self.down.name]
+
+    def send_up(self, data):
+        loop = asyncio.get_running_loop()
+        self.last_active = loop.time()
+        due = self.up.due(len(data), loop.time())
+        if due is not None:
+            loop.call_at(due, self.forward_up, data)
+
+    def forward_up(self, data):
+        if self.closed:
+            return
+        if self.transport is None:
+            self.waiting.append(data)
+        else:
+            self.transport.sendto(data)
+
+    def datagram_received(self, data, addr):
+        loop = asyncio.get_running_loop()
+        self.last_active = loop.time()
+        due = self.down.due(len(data), loop.time())
+        if due is not None:
+            loop.call_at(due, self.frontend.transport.sendto, data, self.addr)
+
+    def error_received(self, exc):
+        pass  # e.g. ICMP port unreachable before the server is up; UDP just loses it
+
+    def connection_lost(self, exc):
+        self.close("upstream closed")
+
+
+def proxy_process(listen_ip, target_ip, target_port, profile, seed, port_queue, log_path=None):
+    # Runs a proxy in its own process (see loadgen.py), reporting the port it got
+    async def run():
+        proxy = ImpairmentProxy(listen_ip, 0, target_ip, target_port, load_profile(profile), seed, ProxyLog(log_path))
+        await proxy.start()
+        port_queue.put(proxy.port)
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proxy that adds latency, jitter, rate limits, loss and reordering")
+    parser.add_argument("profile", help=f"{', '.join(PROFILES)} or a JSON file of phases")
+    parser.add_argument("-i", "--ip", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("-p", "--port", type=int, default=1223, help="Port to listen on, TCP and UDP (default: 1223)")
+    parser.add_argument("-t", "--target", default="127.0.0.1:1222", help="Server ip:port (default: 127.0.0.1:1222)")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--log", help="Append a JSON lines log of the run to this file")
+    parser.add_argument("--log_packets", action="store_true", help="Also log every lost, reordered or resent packet")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between link summaries (default: 5)")
+    parser.add_argument(
+        "--udp_idle", type=float, default=30, help="Seconds before an idle UDP session is closed (default: 30)"
+    )
+    args = parser.parse_args()
+
+    target_ip, target_port = args.target.rsplit(":", 1)
+    proxy = ImpairmentProxy(
+        args.ip,
+        args.port,
+        target_ip,
+        int(target_port),
+        load_profile(args.profile),
+        seed=args.seed,
+        log=ProxyLog(args.log, args.log_packets),
+        interval=args.interval,
+        udp_idle=args.udp_idle,
+    )
+    try:
+        asyncio.run(proxy.serve_forever())
+    except KeyboardInterrupt:
+        proxy.close()
+        logger.info("Proxy stopped")
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import socket
+import time
+from collections import deque
+
+import metrics
+
+MAX_PARTS = 64  # iovecs per sendmsg, well under IOV_MAX
+
+
+class Outbox:
+    # Outbound queue of one receiver, drained by its own task so a slow link
+    # only ever delays itself: put() never blocks the sender that forwards.
+    #
+    # Audio, mixes and ACKs go into a small priority lane that is always sent
+    # first; video into a lane holding the newest `max_video` frames, the oldest
+    # being dropped when another arrives (with a single receiver delta frames
+    # repeat everything since its last ACK, so any of them can be skipped; rooms
+    # do not carry delta video). Messages are written with
+    # non-blocking scatter-gather sendmsg() of headers and payloads as they are,
+    # several per call, on a duplicate of the connection's socket; the asyncio
+    # transport only reads.
+    def __init__(self, sock, max_video=3, max_priority=32, dropped=None, delay=metrics.NULL_METRIC):
+        self.sock = socket.socket(sock.family, sock.type, sock.proto, fileno=os.dup(sock.fileno()))
+        self.sock.setblocking(False)
+        self.max_video = max_video
+        self.max_priority = max_priority
+        self.priority = deque()
+        self.video = deque()
+        self.batch = []  # (size, enqueue time) of the messages being written, never dropped
+        self.queued_bytes = 0
+        self.sent_bytes = 0
+        self.dropped = {"video": 0, "audio": 0}
+        self.dropped_metrics = dropped or {"video": metrics.NULL_METRIC, "audio": metrics.NULL_METRIC}
+        self.delay = delay
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    def put(self, header, payload, video=False):
+        if self.closed:
+            return
+        if video:
+            lane, limit, kind = self.video, self.max_video, "video"
+        else:
+            lane, limit, kind = self.priority, self.max_priority, "audio"
+        if len(lane) >= limit:
+            old_header, old_payload, _ = lane.popleft()
+            self.queued_bytes -= len(old_header) + len(old_payload)
+            self.dropped[kind] += 1
+            self.dropped_metrics[kind].inc()
+        lane.append((header, payload, time.monotonic()))
+        self.queued_bytes += len(header) + len(payload)
+        self.wakeup.set()
+
+    def discard_video(self, stream):
+        # Drops the queued video of one sender, e.g. before telling the receiver it left
+        kept = deque()
+        for entry in self.video:
+            if int.from_bytes(entry[0][2:4], "big") == stream:  # the header's stream id
+                self.queued_bytes -= len(entry[0]) + len(entry[1])
+            else:
+                kept.append(entry)
+        self.video = kept
+
+    def lag(self, now=None):
+        # How long the oldest message still queued for this receiver has waited
+        now = time.monotonic() if now is None else now
+        oldest = [lane[0][2] for lane in (self.priority, self.video) if lane]
+        if self.batch:
+            oldest.append(self.batch[0][1])
+        return now - min(oldest) if oldest else 0.0
+
+    def fill(self):
+        # Next messages to write: the priority lane, then at most one video frame,
+        # so audio arriving meanwhile waits behind one frame at most
+        parts = []
+        while len(parts) < MAX_PARTS and (self.priority or self.video):
+            video = not self.priority
+            header, payload, queued = (self.priority or self.video).popleft()
+            self.batch.append((len(header) + len(payload), queued))
+            parts.append(memoryview(header).cast("B"))
+            if len(payload):
+                parts.append(memoryview(payload).cast("B"))
+            if video:
+                break
+        return parts
+
+    async def writable(self):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.sock.fileno()
+        loop.add_writer(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_writer(fd)
+
+    async def run(self):
+        parts = []
+        try:
+            while not self.closed:
+                if not parts:
+                    parts = self.fill()
+                    if not parts:
+                        self.wakeup.clear()
+                        await self.wakeup.wait()
+                        continue
+                try:
+                    sent = self.sock.sendmsg(parts)
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                self.sent_bytes += sent
+                self.queued_bytes -= sent
+                while parts and sent >= len(parts[0]):
+                    sent -= len(parts[0])
+                    parts.pop(0)
+                if parts and sent:
+                    parts[0] = parts[0][sent:]
+                self.complete(sum(len(p) for p in parts))
+                if parts:
+                    await self.writable()
+        except OSError:
+            pass  # the receiver went away; its own handler cleans up
+        finally:
+            self.closed = True
+            self.sock.close()
+
+    def complete(self, remaining):
+        # Retires fully written messages from the batch, `remaining` bytes are still unsent
+        now = time.monotonic()
+        written = sum(size for size, _ in self.batch) - remaining
+        while self.batch and written >= self.batch[0][0]:
+            size, queued = self.batch.pop(0)
+            written -= size
+            self.delay.observe(now - queued)
+
+    def close(self):
+        # The duplicate is closed here too: a task cancelled before it ever ran
+        # never gets to its finally, and the connection would stay open
+        self.closed = True
+        self.wakeup.set()
+        if self.task is not None:
+            self.task.cancel()
+        self.sock.close()
@@ -0,0 +1,159 @@
+import logging
+import queue
+import time
+from threading import Condition, Event, Lock, Thread
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    def __init__(self):
+        self.lock = Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_processed = 0
+        self.last_time = time.monotonic()
+
+    def snapshot(self):
+        # Totals plus the rate since the previous snapshot
+        with self.lock:
+            now = time.monotonic()
+            elapsed = max(now - self.last_time, 1e-6)
+            rate = (self.processed - self.last_processed) / elapsed
+            self.last_processed, self.last_time = self.processed, now
+            return {"processed": self.processed, "dropped": self.dropped, "errors": self.errors, "rate": rate}
+
+
+class LatestQueue:
+    # Single-slot queue: a put replaces whatever has not been consumed yet
+    # (latest-frame-wins), counting the replaced item as a drop.
+    def __init__(self):
+        self.cond = Condition()
+        self.item = None
+        self.has_item = False
+        self.dropped = 0
+
+    def put(self, item, timeout=None):
+        with self.cond:
+            if self.has_item:
+                self.dropped += 1
+            self.item, self.has_item = item, True
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.has_item, timeout):
+                raise queue.Empty
+            item, self.item, self.has_item = self.item, None, False
+            return item
+
+    def qsize(self):
+        return int(self.has_item)
+
+
+class FifoQueue(queue.Queue):
+    # Lossless bounded FIFO: producers block while it is full
+    dropped = 0
+
+
+class Stage(Thread):
+    # Runs `work` in its own thread. Producers (no inbox) call work() repeatedly,
+    # other stages call work(item) for every item taken from the inbox. A non-None
+    # result is put on the outbox.
+    def __init__(self, name, work, stop_event, inbox=None, outbox=None, poll=0.1):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.stop_event = stop_event
+        self.inbox = inbox
+        self.outbox = outbox
+        self.poll = poll
+        self.stats = StageStats()
+        self.timed = metrics.enabled()
+        self.latency = metrics.histogram("stage_seconds", "Time spent in one call of a pipeline stage", stage=name)
+        metrics.counter("stage_errors_total", "Exceptions raised by a stage", fn=lambda: self.stats.errors, stage=name)
+
+    def put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.outbox.put(item, timeout=self.poll)
+                return
+            except queue.Full:
+                continue
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.inbox is None:
+                    item = None
+                else:
+                    try:
+                        item = self.inbox.get(timeout=self.poll)
+                    except queue.Empty:
+                        continue
+                start = time.perf_counter() if self.timed else 0.0
+                result = self.work() if self.inbox is None else self.work(item)
+                if self.timed:
+                    self.latency.observe(time.perf_counter() - start)
+            except (ConnectionError, OSError) as e:
+                logger.info(f"Stage {self.name} stopping: {e}")
+                self.stop_event.set()
+                break
+            except Exception as e:
+                with self.stats.lock:
+                    self.stats.errors += 1
+                logger.error(f"Error in stage {self.name}: {e}")
+                continue
+            with self.stats.lock:
+                self.stats.processed += 1
+            if result is not None and self.outbox is not None:
+                self.put(result)
+
+
+class Pipeline:
+    def __init__(self):
+        self.stop_event = Event()
+        self.stages = []
+        self.queues = {}
+
+    def queue(self, name, latest=False, maxsize=0):
+        q = LatestQueue() if latest else FifoQueue(maxsize)
+        self.queues[name] = q
+        metrics.gauge("queue_depth", "Items waiting in a pipeline queue", fn=q.qsize, queue=name)
+        metrics.counter("queue_dropped_total", "Items replaced or dropped", fn=lambda: q.dropped, queue=name)
+        return q
+
+    def add(self, name, work, inbox=None, outbox=None):
+        stage = Stage(name, work, self.stop_event, inbox, outbox)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout=1.0):
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.join(timeout)
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def stats(self):
+        stats = {stage.name: stage.stats.snapshot() for stage in self.stages}
+        for name, q in self.queues.items():
+            stats[name] = {"depth": q.qsize(), "dropped": q.dropped}
+        return stats
+
+    def format_stats(self):
+        parts = []
+        for name, s in self.stats().items():
+            if "rate" in s:
+                parts.append(f"{name} {s['rate']:.1f}/s")
+            else:
+                parts.append(f"{name} q={s['depth']} drop={s['dropped']}")
+        return ", ".join(parts)
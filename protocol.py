@@ -0,0 +1,156 @@
+import struct
+import time
+from collections import namedtuple
+from threading import Lock
+
+# Wire format, version 1 (all fields big-endian):
+#   version u8 | type u8 | stream id u16 | sequence u32 | capture timestamp u64 (us) | payload length u32
+# followed by `length` payload bytes. Audio and video share one connection and
+# are told apart by the message type.
+VERSION = 1
+HEADER = struct.Struct("!BBHIQI")
+HEADER_SIZE = HEADER.size
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+JOIN = 1
+LEAVE = 2
+VIDEO = 3
+AUDIO = 4
+ACK = 5
+TILES = 6  # delta video frame, see delta.py
+AUDIO_CODED = 7  # compressed audio chunk, see audio_codec.py
+SIMULCAST = 8  # one spatial layer of a video frame, see simulcast.py
+COMFORT_NOISE = 9  # the sender's audio is silent until further audio, see vad.py
+
+MESSAGE_NAMES = {
+    JOIN: "join",
+    LEAVE: "leave",
+    VIDEO: "video",
+    AUDIO: "audio",
+    ACK: "ack",
+    TILES: "tiles",
+    AUDIO_CODED: "audio_coded",
+    SIMULCAST: "simulcast",
+    COMFORT_NOISE: "comfort_noise",
+}
+AUDIO_TYPES = (AUDIO, AUDIO_CODED)
+
+# JOIN payload: the room name in UTF-8, optionally followed by a NUL byte and
+# the session token of an earlier connection to resume. The relay answers every
+# JOIN with a JOIN whose stream id is the participant id and whose payload is
+# the session token (see session.py).
+SESSION_TOKEN_SIZE = 16
+
+# ACK payload: sequence number and capture timestamp of the newest video frame
+# the receiver has displayed (acknowledgements are cumulative). The ACK's stream
+# id names the participant whose frame is acknowledged.
+ACK_PAYLOAD = struct.Struct("!IQ")
+
+Header = namedtuple("Header", ["version", "type", "stream", "seq", "timestamp", "length"])
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def now_us():
+    return time.time_ns() // 1000
+
+
+def pack_header(msg_type, length, stream=0, seq=0, timestamp=None):
+    if timestamp is None:
+        timestamp = now_us()
+    return HEADER.pack(VERSION, msg_type, stream, seq & 0xFFFFFFFF, timestamp, length)
+
+
+def unpack_header(data):
+    header = Header._make(HEADER.unpack(data))
+    if header.version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {header.version}")
+    if header.length > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {header.length} bytes exceeds limit")
+    return header
+
+
+def restamp(header, stream):
+    # Same message, different stream id (the relay tags messages with the sender)
+    return HEADER.pack(VERSION, header.type, stream, header.seq, header.timestamp, header.length)
+
+
+def pack_join(room, token=None):
+    return room.encode("utf-8") + (b"\0" + token if token else b"")
+
+
+def unpack_join(payload):
+    # (room, session token or None)
+    room, _, token = bytes(payload).partition(b"\0")
+    return room.decode("utf-8"), token or None
+
+
+def pack_ack(header):
+    return ACK_PAYLOAD.pack(header.seq, header.timestamp)
+
+
+def unpack_ack(payload):
+    return ACK_PAYLOAD.unpack(payload)
+
+
+def send_parts(sock, parts):
+    # Scatter-gather send of header and payload without concatenating them
+    parts = [memoryview(p).cast("B") for p in parts]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while parts and sent >= len(parts[0]):
+            sent -= len(parts[0])
+            parts.pop(0)
+        if parts and sent:
+            parts[0] = parts[0][sent:]
+
+
+def read_message(reader):
+    # reader is a framing.FrameReader; the payload view is reused on the next read
+    header = unpack_header(reader.read_header(HEADER_SIZE))
+    return header, reader.read_payload(header.length)
+
+
+async def read_message_async(reader):
+    # reader is an asyncio.StreamReader
+    data = await reader.readexactly(HEADER_SIZE)
+    header = unpack_header(data)
+    return header, data, await reader.readexactly(header.length)
+
+
+class MessageWriter:
+    # Thread-safe sender that keeps one sequence counter per (type, stream)
+    def __init__(self, sock, stream=0):
+        self.sock = sock
+        self.stream = stream
+        self.lock = Lock()
+        self.seq = {}
+
+    def next_seq(self, msg_type, stream):
+        key = (msg_type, stream)
+        seq = self.seq.get(key, 0)
+        self.seq[key] = seq + 1
+        return seq
+
+    def send(self, msg_type, payload=b"", stream=None, timestamp=None, keyframe=False, seq=None):
+        # keyframe only matters to datagram transports, TCP delivers everything.
+        # An explicit seq reuses a number, e.g. for every simulcast layer of a frame.
+        stream = self.stream if stream is None else stream
+        with self.lock:
+            if seq is None:
+                seq = self.next_seq(msg_type, stream)
+            header = pack_header(msg_type, len(payload), stream, seq, timestamp)
+            self.write([header, payload])
+        return seq
+
+    def write(self, parts):
+        # Called with the lock held
+        send_parts(self.sock, parts)
+
+    def join(self, room, token=None):
+        return self.send(JOIN, pack_join(room, token))
+
+    def ack(self, header):
+        return self.send(ACK, pack_ack(header), stream=header.stream)
@@ -0,0 +1,401 @@
+import argparse
+import bisect
+import mmap
+import os
+import queue
+import socket
+import threading
+import time
+
+import numpy as np
+
+from audio_codec import AudioDecoder
+from protocol import (
+    AUDIO,
+    AUDIO_CODED,
+    COMFORT_NOISE,
+    HEADER_SIZE,
+    LEAVE,
+    SIMULCAST,
+    TILES,
+    VIDEO,
+    MessageWriter,
+    now_us,
+    unpack_header,
+)
+from simulcast import unpack_layer
+
+# A recording is a directory of time-segmented files. Each segment-NNNNNN.rec
+# holds the messages exactly as the relay forwarded them (protocol header plus
+# payload, nothing re-encoded). The matching .idx file holds one little-endian
+# (arrival time us u64, offset u32) entry per message, in arrival order, so a
+# timestamp is found by binary search over memory-mapped arrays.
+INDEX_DTYPE = np.dtype([("time", "<u8"), ("offset", "<u4")])
+SEGMENT_SECONDS = 60
+SEGMENT_BYTES = 1 << 31  # offsets are u32
+REPLAYED_TYPES = (VIDEO, TILES, AUDIO, AUDIO_CODED, SIMULCAST, COMFORT_NOISE)
+
+
+def segment_name(number, ext):
+    return f"segment-{number:06d}.{ext}"
+
+
+class Recorder:
+    # Taps forwarded messages without slowing the caller: record() only appends
+    # to a bounded queue (dropping when it is full) and a writer thread drains it
+    # in batches, one write per file per batch.
+    def __init__(self, path, segment_seconds=SEGMENT_SECONDS, max_batch=256, max_queue=4096):
+        self.path = path
+        self.segment_seconds = segment_seconds
+        self.max_batch = max_batch
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.data_file = None
+        self.index_file = None
+        self.segment_start = None
+        self.size = 0
+        os.makedirs(path, exist_ok=True)
+        existing = [name for name in os.listdir(path) if name.endswith(".rec")]
+        self.next_segment = len(existing) + 1
+        self.thread = threading.Thread(target=self.run, name=f"recorder-{path}", daemon=True)
+        self.thread.start()
+
+    def record(self, header, payload):
+        # header is the 20-byte wire header, both are kept by reference
+        try:
+            self.queue.put_nowait((now_us(), header, payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def open_segment(self, start):
+        self.close_segment()
+        self.data_file = open(os.path.join(self.path, segment_name(self.next_segment, "rec")), "ab")
+        self.index_file = open(os.path.join(self.path, segment_name(self.next_segment, "idx")), "ab")
+        self.segment_start = start
+        self.size = 0
+        self.next_segment += 1
+
+    def close_segment(self):
+        for f in (self.data_file, self.index_file):
+            if f is not None:
+                f.close()
+        self.data_file = self.index_file = None
+
+    def write_batch(self, batch):
+        chunks, entries = [], []
+        for arrival, header, payload in batch:
+            size = len(header) + len(payload)
+            if (
+                self.data_file is None
+                or arrival - self.segment_start >= self.segment_seconds * 1e6
+                or self.size + size > SEGMENT_BYTES
+            ):
+                self.flush(chunks, entries)
+                chunks, entries = [], []
+                self.open_segment(arrival)
+            entries.append((arrival, self.size))
+            chunks.append(header)
+            chunks.append(payload)
+            self.size += size
+        self.flush(chunks, entries)
+
+    def flush(self, chunks, entries):
+        # Data before index, so an index entry never points past the data
+        if not entries:
+            return
+        self.data_file.write(b"".join(chunks))
+        self.index_file.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+        self.data_file.flush()
+        self.index_file.flush()
+        self.written += len(entries)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.write_batch(batch)
+                    self.close_segment()
+                    return
+                batch.append(item)
+            self.write_batch(batch)
+        self.close_segment()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class Segment:
+    def __init__(self, data_path, index_path):
+        self.data_path = data_path
+        with open(index_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize
+            self.index_map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else None
+        self.index = np.frombuffer(self.index_map, dtype=INDEX_DTYPE) if size else np.empty(0, dtype=INDEX_DTYPE)
+        with open(data_path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(data_path) else b""
+
+    def message(self, i):
+        # (arrival time us, Header, payload view) of the i-th message
+        offset = int(self.index["offset"][i])
+        view = memoryview(self.data)
+        header = unpack_header(view[offset : offset + HEADER_SIZE])
+        start = offset + HEADER_SIZE
+        return int(self.index["time"][i]), header, view[start : start + header.length]
+
+
+class Player:
+    # Memory-maps every segment of a recording. seek() is a binary search over
+    # segment start times followed by one over that segment's index.
+    def __init__(self, path):
+        self.path = path
+        names = sorted(name for name in os.listdir(path) if name.endswith(".rec"))
+        self.segments = []
+        for name in names:
+            segment = Segment(os.path.join(path, name), os.path.join(path, name[: -len(".rec")] + ".idx"))
+            if len(segment.index):
+                self.segments.append(segment)
+        self.starts = [int(s.index["time"][0]) for s in self.segments]
+
+    @property
+    def start_time(self):
+        return self.starts[0] if self.starts else None
+
+    @property
+    def end_time(self):
+        return int(self.segments[-1].index["time"][-1]) if self.segments else None
+
+    def __len__(self):
+        return sum(len(s.index) for s in self.segments)
+
+    def seek(self, timestamp):
+        # Position (segment, message) of the first message at or after `timestamp` (us)
+        s = max(0, bisect.bisect_right(self.starts, timestamp) - 1)
+        while s < len(self.segments):
+            i = int(np.searchsorted(self.segments[s].index["time"], timestamp, side="left"))
+            if i < len(self.segments[s].index):
+                return s, i
+            s += 1
+        return len(self.segments), 0
+
+    def messages(self, start=None, end=None):
+        # Yields (arrival time us, Header, payload view) from `start` up to `end`
+        s, i = self.seek(start) if start is not None else (0, 0)
+        while s < len(self.segments):
+            segment = self.segments[s]
+            for j in range(i, len(segment.index)):
+                message = segment.message(j)
+                if end is not None and message[0] > end:
+                    return
+                yield message
+            s, i = s + 1, 0
+
+    def play(self, start=None, end=None, speed=1.0):
+        # Same as messages(), paced to the recorded arrival times
+        origin = None
+        for message in self.messages(start, end):
+            if origin is None:
+                origin = (message[0], time.monotonic())
+            delay = (message[0] - origin[0]) / 1e6 / speed - (time.monotonic() - origin[1])
+            if delay > 0:
+                time.sleep(delay)
+            yield message
+
+
+class RecordedVideo:
+    # VideoCapture-like source decoding one participant's recorded video in real time.
+    # Video decoding is imported here, so recording on the relay does without cv2.
+    def __init__(self, path, stream=None, loop=True):
+        from delta import TileDecoder
+
+        self.player = Player(path)
+        self.stream = stream
+        self.loop = loop
+        self.decoder = TileDecoder()
+        self.messages = self.player.play()
+
+    def isOpened(self):
+        return len(self.player) > 0
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        import cv2
+
+        while True:
+            try:
+                _, header, payload = next(self.messages)
+            except StopIteration:
+                if not self.loop:
+                    return False, None
+                self.messages = self.player.play()
+                continue
+            msg_type = header.type
+            if msg_type == SIMULCAST:
+                layer, msg_type, _, offset = unpack_layer(payload)
+                if layer != 0:
+                    continue  # the largest layer is enough
+                payload = payload[offset:]
+            if msg_type not in (VIDEO, TILES):
+                continue
+            if self.stream is None:
+                self.stream = header.stream  # first participant seen
+            if header.stream != self.stream:
+                continue
+            if msg_type == TILES:
+                frame = self.decoder.decode(payload)
+            else:
+                frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                return True, frame
+
+    def release(self):
+        pass
+
+
+class RecordedAudio:
+    # PyAudio-stream-like source replaying one participant's recorded audio
+    def __init__(self, path, rate=44100, channels=1, stream=None):
+        self.player = Player(path)
+        self.rate = rate
+        self.channels = channels
+        self.stream = stream
+        self.decoder = AudioDecoder(rate)
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.messages = self.player.messages()
+        self.pacer = None
+
+    def next_chunk(self):
+        while True:
+            try:
+                _, header, payload = next(self.messages)
+            except StopIteration:
+                self.messages = self.player.messages()
+                if not len(self.player):
+                    return np.zeros(1024 * self.channels, dtype=np.int16)
+                continue
+            if header.type not in (AUDIO, AUDIO_CODED):
+                continue
+            if self.stream is None:
+                self.stream = header.stream
+            if header.stream == self.stream:
+                pcm = self.decoder.decode(payload) if header.type == AUDIO_CODED else bytes(payload)
+                return np.frombuffer(pcm, dtype=np.int16)
+
+    def read(self, n, exception_on_overflow=False):
+        if self.pacer is None or self.pacer.interval != n / self.rate:
+            from media import Pacer
+
+            self.pacer = Pacer(n / self.rate)
+        self.pacer.wait()
+        needed = n * self.channels
+        while len(self.pending) < needed:
+            self.pending = np.concatenate([self.pending, self.next_chunk()])
+        out, self.pending = self.pending[:needed], self.pending[needed:]
+        return out.tobytes()
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def drain(sock):
+    # Reads and discards what the relay sends back (join answer, mixes, the others' media)
+    # until the connection closes, so its outbox for us never backs up
+    try:
+        while sock.recv(1 << 16):
+            pass
+    except OSError:
+        pass
+
+
+class ReplayedParticipant:
+    # One recorded stream id replayed over its own relay connection, so the
+    # room sees as many participants as were recorded
+    def __init__(self, ip, port, room):
+        self.sock = socket.create_connection((ip, port))
+        self.drainer = threading.Thread(target=drain, args=(self.sock,), name="replay-drain", daemon=True)
+        self.drainer.start()
+        self.writer = MessageWriter(self.sock)
+        self.writer.join(room)
+        self.frames = {}  # recorded -> replayed seq, so simulcast layers stay grouped by frame
+
+    def send(self, header, payload):
+        if header.type != SIMULCAST:
+            self.writer.send(header.type, payload)
+            return
+        self.frames[header.seq] = self.writer.send(SIMULCAST, payload, seq=self.frames.get(header.seq))
+        if len(self.frames) > 64:
+            del self.frames[next(iter(self.frames))]
+
+    def close(self):
+        self.writer.send(LEAVE)
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.drainer.join()
+        self.sock.close()
+
+
+def replay(path, ip, port, room, speed=1.0, stream=None):
+    # Sends a recording into a relay room with the recorded timing, every recorded
+    # participant (or only `stream`) joining as one participant of its own
+    participants = {}
+    sent = 0
+    try:
+        for _, header, payload in Player(path).play(speed=speed):
+            if header.type not in REPLAYED_TYPES or stream not in (None, header.stream):
+                continue
+            if header.stream not in participants:
+                participants[header.stream] = ReplayedParticipant(ip, port, room)
+            participants[header.stream].send(header, payload)
+            sent += 1
+    finally:
+        for participant in participants.values():
+            participant.close()
+    return sent
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, seek and replay relay recordings")
+    parser.add_argument("command", choices=["info", "seek", "replay"], help="What to do")
+    parser.add_argument("path", help="Recording directory (one room)")
+    parser.add_argument("-t", "--time", type=float, default=0, help="Seconds from the start, for seek")
+    parser.add_argument("-i", "--ip", default="127.0.0.1", help="Relay address, for replay")
+    parser.add_argument("-p", "--port", type=int, default=1222, help="Relay port, for replay")
+    parser.add_argument("-r", "--room", default="replay", help="Room to replay into")
+    parser.add_argument("-s", "--speed", type=float, default=1.0, help="Replay speed")
+    parser.add_argument("--stream", type=int, help="Replay only this participant's stream id")
+    args = parser.parse_args()
+
+    player = Player(args.path)
+    if args.command == "info":
+        span = (player.end_time - player.start_time) / 1e6 if len(player) else 0
+        print(f"{len(player.segments)} segments, {len(player)} messages, {span:.1f} s")
+    elif not len(player):
+        parser.exit(1, f"{args.path}: empty recording\n")
+    elif args.command == "seek":
+        target = player.start_time + int(args.time * 1e6)
+        start = time.perf_counter()
+        position = player.seek(target)
+        took = (time.perf_counter() - start) * 1e6
+        for arrival, header, payload in player.messages(target):
+            print(
+                f"segment {position[0]} message {position[1]}: {(arrival - player.start_time) / 1e6:.3f} s, "
+                f"type {header.type} stream {header.stream} seq {header.seq}, {len(payload)} bytes "
+                f"(found in {took:.1f} us)"
+            )
+            break
+        else:
+            print(f"Nothing recorded after {args.time:.3f} s")
+    else:
+        print(f"Replayed {replay(args.path, args.ip, args.port, args.room, args.speed, args.stream)} messages")
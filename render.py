@@ -0,0 +1,204 @@
+import logging
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import metrics
+from delta import TileDecoder
+from protocol import TILES
+
+logger = logging.getLogger(__name__)
+
+# Rendering of any number of remote video streams into one window. The receive
+# thread only hands encoded frames over; decoding happens on worker threads
+# (cv2 releases the GIL), and the main thread shows the composited canvas.
+
+
+class GridRenderer:
+    # Every stream owns one tile of a preallocated canvas, laid out in a near
+    # square grid. submit() keeps only the newest undecoded frame per stream, so
+    # frames that are superseded before a worker gets to them are never decoded.
+    # A worker decodes one stream at a time (delta frames patch that stream's
+    # canvas in order), resizes straight into the stream's tile slice, and calls
+    # `on_decoded(header)`, e.g. to acknowledge the frame. render() shows the
+    # canvas from the calling thread, at most `max_fps` times a second and only
+    # when something changed. With a PlayoutScheduler (avsync.py), resized tiles
+    # wait there for their audio and render() copies the due ones in. A frame
+    # that fails to decode is counted, logged and skipped.
+    def __init__(
+        self, display, name="Room", tile_size=(320, 240), max_fps=30, workers=2, on_decoded=None, scheduler=None
+    ):
+        self.display = display
+        self.name = name
+        self.tile_size = tile_size
+        self.interval = 1.0 / max_fps
+        self.on_decoded = on_decoded
+        self.scheduler = scheduler
+        self.lock = threading.Lock()  # guards streams, pending and the canvas
+        self.work = threading.Condition(self.lock)
+        self.streams = []
+        self.pending = {}
+        self.busy = set()
+        self.decoders = {}
+        self.canvas = None
+        self.dirty = False
+        self.last_render = 0.0
+        self.stopped = False
+        self.skipped = 0
+        self.decoded = 0
+        self.errors = 0
+        self.has_video = False  # a decoded frame is on the canvas
+        self.first_frame = None  # time.time() the first one was shown
+        self.layout()
+        self.skipped_metric = metrics.counter("render_skipped_total", "Frames superseded before decoding")
+        metrics.counter("render_decode_errors_total", "Frames that failed to decode", fn=lambda: self.errors)
+        self.decode_latency = metrics.histogram("decode_seconds", "Video decode time")
+        self.render_latency = metrics.histogram("render_seconds", "Time to display one frame")
+        metrics.gauge("render_streams", "Streams in the grid", fn=lambda: len(self.streams))
+        self.threads = [
+            threading.Thread(target=self.decode_loop, name=f"render-decode-{i}", daemon=True) for i in range(workers)
+        ]
+        for t in self.threads:
+            t.start()
+
+    def layout(self):
+        # Caller holds the lock (or nothing runs yet). Reallocates only when the grid changes.
+        n = max(1, len(self.streams))
+        cols = math.ceil(math.sqrt(n))
+        rows = math.ceil(n / cols)
+        w, h = self.tile_size
+        if self.canvas is None or self.canvas.shape[:2] != (rows * h, cols * w):
+            self.canvas = np.zeros((rows * h, cols * w, 3), dtype=np.uint8)
+        else:
+            self.canvas[:] = 0
+        self.cols = cols
+        self.dirty = True
+
+    def tile(self, stream):
+        i = self.streams.index(stream)
+        w, h = self.tile_size
+        y, x = divmod(i, self.cols)
+        return self.canvas[y * h : (y + 1) * h, x * w : (x + 1) * w]
+
+    def submit(self, header, payload):
+        # From the receive thread; payload has to stay valid (copy reused buffers)
+        with self.lock:
+            if header.stream not in self.streams:
+                self.streams.append(header.stream)
+                self.decoders[header.stream] = TileDecoder()
+                self.layout()
+            if header.stream in self.pending:
+                self.skipped += 1
+                self.skipped_metric.inc()
+            self.pending[header.stream] = (header, payload)
+            self.work.notify()
+
+    def put(self, item):
+        # (header, payload), so the renderer can stand in for a pipeline queue
+        self.submit(*item)
+
+    def remove(self, stream):
+        with self.lock:
+            if stream in self.streams:
+                self.streams.remove(stream)
+                self.pending.pop(stream, None)
+                self.decoders.pop(stream, None)
+                self.layout()
+        if self.scheduler is not None:
+            self.scheduler.remove(stream)
+
+    def next_job(self):
+        # Caller holds the lock: a stream with a frame waiting and no decode in progress
+        for stream, job in self.pending.items():
+            if stream not in self.busy:
+                del self.pending[stream]
+                self.busy.add(stream)
+                return stream, job
+        return None
+
+    def decode_loop(self):
+        while True:
+            with self.lock:
+                job = self.next_job()
+                while job is None and not self.stopped:
+                    self.work.wait()
+                    job = self.next_job()
+                if self.stopped:
+                    return
+                decoder = self.decoders.get(job[0])
+            stream, (header, payload) = job
+            start = time.perf_counter()
+            try:
+                if header.type == TILES:
+                    frame = decoder.decode(payload) if decoder is not None else None
+                else:
+                    frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+            except Exception as e:
+                # a malformed frame must not take the worker, and all video with it, down
+                frame = None
+                with self.lock:
+                    self.errors += 1
+                logger.warning(f"Cannot decode frame {header.seq} of stream {stream}: {e!r}")
+            finally:
+                with self.lock:
+                    self.busy.discard(stream)
+                    if stream in self.pending:
+                        self.work.notify()
+            if frame is None:
+                continue
+            if self.scheduler is not None:
+                tile = cv2.resize(frame, self.tile_size, interpolation=cv2.INTER_AREA)
+                self.label(tile, stream)
+                self.scheduler.push(header, tile)
+                with self.lock:
+                    self.decoded += 1
+            else:
+                with self.lock:
+                    if stream not in self.streams:
+                        continue
+                    tile = self.tile(stream)
+                    cv2.resize(frame, self.tile_size, dst=tile, interpolation=cv2.INTER_AREA)
+                    self.label(tile, stream)
+                    self.dirty = self.has_video = True
+                    self.decoded += 1
+            end = time.perf_counter()
+            self.decode_latency.observe(end - start)
+            if metrics.TRACER.sampled(header.seq):
+                metrics.TRACER.record("decode", header.seq, start, end)
+            if self.on_decoded is not None:
+                self.on_decoded(header)
+
+    def label(self, tile, stream):
+        cv2.putText(tile, str(stream), (8, 22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+
+    def render(self, now=None):
+        # From the main thread; True if the canvas was shown
+        now = time.monotonic() if now is None else now
+        if self.scheduler is not None:
+            due = self.scheduler.pop_due()
+            with self.lock:
+                for stream, tile in due:
+                    if stream in self.streams:
+                        self.tile(stream)[:] = tile
+                        self.dirty = self.has_video = True
+        if not self.dirty or now - self.last_render < self.interval:
+            return False
+        start = time.perf_counter()
+        with self.lock:
+            self.display.show(self.name, self.canvas)
+            self.dirty = False
+            if self.first_frame is None and self.has_video:
+                self.first_frame = time.time()
+        self.last_render = now
+        self.render_latency.observe(time.perf_counter() - start)
+        return True
+
+    def close(self):
+        with self.lock:
+            self.stopped = True
+            self.work.notify_all()
+        for t in self.threads:
+            t.join()
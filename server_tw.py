@@ -1,128 +1,564 @@
-import socket, sys, cv2, pickle, struct
-from threading import Thread
-from datetime import datetime
-from time import sleep
-import pyaudio
-from array import array
-
-print("[DEBUG] Imported all required modules")
-
-sending, receiving = False, False
-HEADERSIZE = 10
-chunk = 1024  # Record in chunks of 1024 samples
-sample_format = pyaudio.paInt16  # 16 bits per sample
-channels = 1  # Changed from 2 to 1 (mono audio)
-fs = 44100  # Record at 44100 samples per second
-seconds = 3
-
-print("[DEBUG] Initialized global variables")
-
-
-class myClass:
-    def __init__(self, i, clientsocket, audiosocket):
-        print(f"[DEBUG] Initializing client {i}")
-        self.i = i
-        self.name = str(i)
-        self.threads = []
-        self.stop = False
-        self.buffer = None
-        self.clientsocket = clientsocket
-        self.audiosocket = audiosocket
-        self.p = pyaudio.PyAudio()
-        self.stream = self.p.open(
-            format=sample_format, channels=channels, rate=fs, frames_per_buffer=chunk, input=True, output=True
-        )
-        print(f"[DEBUG] Client {i} initialized successfully")
-
-    def receive_and_send(self, clientsocket, audiosocket):
-        print(f"[DEBUG] Client {self.i} starting receive_and_send loop")
-        print("Receiving...", self.stop)
-        while not self.stop:
-            data = b""
-            msg_size = int(clientsocket.recv(HEADERSIZE))
-            print(f"[DEBUG] Client {self.i} received message size: {msg_size}")
-            while len(data) < msg_size:
-                data += clientsocket.recv(4096)
-            audio_data = audiosocket.recv(4096)
-            print(f"[DEBUG] Client {self.i} received audio data length: {len(audio_data)}")
-
-            ##############  send as soon as you receive it  #############
-            o = 1 if (self.i == 0) else 0
-            print(f"[DEBUG] Client {self.i} forwarding video data to client {o}")
-            clients[o].clientsocket.sendall(bytes("{:<{}}".format(len(data), HEADERSIZE), "utf-8") + data)
-            if len(audio_data) == 4096:
-                print("S", end=" | ")
-                print(f"[DEBUG] Client {self.i} forwarding audio data to client {o}")
-                self.stream.write(audio_data)
-                print(max(array("h", audio_data)))
-                clients[o].audiosocket.sendall(audio_data)
-            ##############################################################
-        print(f"[DEBUG] Client {self.i} receive_and_send loop stopped")
-        print("Receiving(stopped)...", self.stop)
-
-    def inititate(self):
-        print(f"[DEBUG] Client {self.i} initiating connection")
-        clientsocket, audiosocket = self.clientsocket, self.audiosocket
-
-        t = Thread(
-            target=self.receive_and_send,
-            args=(
-                clientsocket,
-                audiosocket,
-            ),
-        )
-        self.stop = False
-        t.start()
-        print(f"[DEBUG] Client {self.i} thread started")
-        sleep(1)
-        self.threads.append(t)
-
-    def end(self):
-        print(f"[DEBUG] Client {self.i} ending connection")
-        self.stop = True
-        self.clientsocket.close()
-        for t in self.threads:
-            t.join()
-        self.stream.close()
-        self.p.terminate()
-        print(f"[DEBUG] Client {self.i} ended successfully")
+import asyncio
+import argparse
+import logging
+import os
+import time
+
+import metrics
+from audio_codec import AudioDecoder, AudioEncoder, is_coded_audio
+from mixer import AudioMixer
+from outbox import Outbox
+from protocol import (
+    ACK,
+    ACK_PAYLOAD,
+    AUDIO,
+    AUDIO_CODED,
+    COMFORT_NOISE,
+    JOIN,
+    LEAVE,
+    MESSAGE_NAMES,
+    SIMULCAST,
+    TILES,
+    VIDEO,
+    ProtocolError,
+    SESSION_TOKEN_SIZE,
+    now_us,
+    pack_header,
+    read_message_async,
+    restamp,
+    unpack_ack,
+    unpack_join,
+)
+from recording import Recorder
+from simulcast import LayerRates, LayerSelector, is_layer, unpack_layer
+from startup import Startup
+from vad import COMFORT_PAYLOAD, SILENT_LEVEL, ActiveSpeaker, level, pack_comfort_noise, unpack_comfort_noise
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", datefmt="%H:%M:%S"
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOM = "default"
 
 # IP = "192.168.0.108"
 IP = "127.0.0.1"
-audio_PORT = 1234
-
-print("[DEBUG] Setting up server sockets")
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.bind((IP, 1222))
-s.listen()
-print("[DEBUG] Video socket bound to port 1222")
-
-audio_s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-audio_s.bind((IP, audio_PORT))
-audio_s.listen()
-print("[DEBUG] Audio socket bound to port", audio_PORT)
-
-clients = []
-print("[DEBUG] Waiting for client connections...")
-for i in range(2):
-    print(f"[DEBUG] Waiting for client {i}")
-    print(i)
-    clientsocket, addr = s.accept()
-    print(f"[DEBUG] Client {i} video connection accepted from {addr}")
-    audiosocket, addr = audio_s.accept()
-    print(f"[DEBUG] Client {i} audio connection accepted from {addr}")
-    obj = myClass(i, clientsocket, audiosocket)
-    clients.append(obj)
-
-print("[DEBUG] Initiating connections for both clients")
-clients[0].inititate()
-clients[1].inititate()
-
-print("[DEBUG] Server running. Press Enter to stop.")
-# sleep(10)
-input()
-print("closing all")
-print("[DEBUG] Closing all client connections")
-for obj in clients:
-    obj.end()
+PORT = 1222
+MIX_STREAM = 0  # stream id of mixed audio, participant ids start at 1
+MEDIA_TYPES = (VIDEO, TILES, AUDIO, AUDIO_CODED, SIMULCAST, COMFORT_NOISE)
+SPEAKER_WEIGHT = 2.0  # budget shares the active speaker's video gets, everyone else one
+CODED_LEVEL = -40.0  # assumed level of talkers sending coded audio, when not mixing
+
+
+def check_payload(header, data):
+    # Payloads the relay unpacks itself, or that would fail in every receiver,
+    # are checked first: a malformed one disconnects its sender (ProtocolError)
+    # instead of failing the handler, the room's mixer or the receivers
+    if header.type == ACK and len(data) != ACK_PAYLOAD.size:
+        raise ProtocolError(f"ACK of {len(data)} bytes")
+    if header.type == SIMULCAST and not is_layer(data):
+        raise ProtocolError("Simulcast layer with a short header, unknown layer or media type")
+    if header.type == AUDIO_CODED and not is_coded_audio(data):
+        raise ProtocolError("Coded audio with an unknown codec, a short header or a bad ADPCM state")
+    if header.type == COMFORT_NOISE and len(data) < COMFORT_PAYLOAD.size:
+        raise ProtocolError("Empty comfort noise payload")
+
+
+class Participant:
+    def __init__(self, id, room, writer, outbox):
+        self.id = id
+        self.room = room
+        self.writer = writer
+        self.outbox = outbox  # everything sent to the participant goes through here
+        self.name = str(writer.get_extra_info("peername"))
+        self.decoder = None
+        self.encoder = None
+        self.mix_seq = 0
+        self.layer_rates = None  # as a simulcast sender
+        self.selector = None  # as a simulcast receiver
+        self.noise_level = None  # background level of its last comfort noise, dBFS
+        self.quiet_ticks = 0  # mix ticks it got no mix for
+        self.token = os.urandom(SESSION_TOKEN_SIZE)  # resumes the participant on another connection
+        self.resumed = None  # set when a suspended participant comes back
+
+
+class Relay:
+    # A connection joins a room with a JOIN message carrying the room name;
+    # afterwards its audio and video messages are forwarded to every other
+    # member of the room, re-tagged with the sender's participant id as stream id.
+    # Forwarding only queues the message in each receiver's Outbox (outbox.py),
+    # so a receiver on a slow link falls behind, and sheds video, on its own
+    # instead of holding up the sender and everyone else in the room.
+    #
+    # With mixing on, audio is not forwarded: every tick the room's AudioMixer
+    # produces one mix per member (everyone but themselves), sent as stream
+    # MIX_STREAM and encoded with `mix_codec`, so each client receives a single
+    # audio stream whatever the room size. Senders that are silent send comfort
+    # noise markers instead of audio (vad.py), so they cost the mixer nothing;
+    # a member that gets no mix (nobody else talks) is sent comfort noise.
+    #
+    # Audio and comfort noise also tell who is talking: the room's ActiveSpeaker
+    # gets a larger share of each receiver's simulcast budget.
+    #
+    # Simulcast messages carry one of several sizes of the same frame. Each
+    # receiver gets one layer per sender, picked by its LayerSelector from the
+    # ACKs the receiver sends back, and forwarded as a plain video message; the
+    # relay never decodes or re-encodes video.
+    #
+    # With `record_dir` set, every media message a room receives is also handed
+    # to that room's Recorder (see recording.py) as the bytes that were read.
+    #
+    # JOIN is answered with the participant id and a session token. A connection
+    # that drops without LEAVE suspends its participant for `resume_timeout`
+    # seconds: out of the room, but with its id and state kept, so a JOIN with
+    # the token resumes it without the others noticing a new participant. The
+    # JOIN has to name the participant's room; a token is no way into another.
+    def __init__(
+        self,
+        ip=IP,
+        port=PORT,
+        backlog=1024,
+        mix=True,
+        mix_codec="pcm",
+        rate=44100,
+        tick=0.02,
+        record_dir=None,
+        video_queue=3,
+        audio_queue=32,
+        resume_timeout=10.0,
+    ):
+        self.ip = ip
+        self.port = port
+        self.backlog = backlog
+        self.mix = mix
+        self.mix_codec = mix_codec
+        self.rate = rate
+        self.tick = tick
+        self.rooms = {}
+        self.mixers = {}
+        self.speakers = {}
+        self.comfort_interval = max(1, round(0.2 / tick))  # ticks between comfort noise updates
+        self.record_dir = record_dir
+        self.recorders = {}
+        self.video_queue = video_queue
+        self.audio_queue = audio_queue
+        self.resume_timeout = resume_timeout
+        self.sessions = {}  # session token -> participant, connected or suspended
+        self.mix_task = None
+        self.server = None
+        self.next_id = 1
+        self.connections = 0
+        self.resumes = 0
+        self.messages = 0
+        self.bytes = 0
+        self.acks = 0
+        metrics.counter("relay_connections_total", "Accepted connections", fn=lambda: self.connections)
+        metrics.counter("relay_resumed_total", "Sessions resumed on a new connection", fn=lambda: self.resumes)
+        metrics.counter("relay_messages_total", "Media messages received", fn=lambda: self.messages)
+        metrics.counter("relay_bytes_total", "Media payload bytes received", fn=lambda: self.bytes)
+        metrics.counter("relay_acks_total", "Acknowledgements passed back to senders", fn=lambda: self.acks)
+        metrics.gauge("relay_rooms", "Open rooms", fn=lambda: len(self.rooms))
+        metrics.gauge("relay_participants", "Connected participants", fn=lambda: sum(map(len, self.rooms.values())))
+        self.forwarded = {
+            t: metrics.counter("relay_forwarded_bytes_total", "Bytes written to receivers", type=MESSAGE_NAMES[t])
+            for t in (VIDEO, TILES, AUDIO, AUDIO_CODED, COMFORT_NOISE, ACK)
+        }
+        for direction in ("up", "down"):
+            metrics.counter(
+                "relay_layer_switches_total",
+                "Simulcast layer changes of receivers",
+                fn=lambda d=direction: sum(p.selector.switches[d] for p in self.participants() if p.selector),
+                direction=direction,
+            )
+        metrics.counter(
+            "relay_speaker_changes_total",
+            "Changes of active speaker",
+            fn=lambda: sum(s.changes for s in self.speakers.values()),
+        )
+        metrics.counter(
+            "relay_recording_dropped_total",
+            "Messages the recorders could not keep up with",
+            fn=lambda: sum(r.dropped for r in self.recorders.values()),
+        )
+        self.dropped = {
+            kind: metrics.counter("relay_dropped_total", "Messages dropped from receiver queues", type=kind)
+            for kind in ("video", "audio")
+        }
+        self.queue_delay = metrics.histogram("relay_queue_delay_seconds", "Time messages wait in receiver queues")
+        self.timed = metrics.enabled()
+        self.mix_latency = metrics.histogram("relay_mix_seconds", "Time to mix and send one tick for all rooms")
+
+    def members(self, room):
+        return self.rooms.setdefault(room, set())
+
+    def participants(self):
+        return [p for members in list(self.rooms.values()) for p in members]
+
+    def mixer(self, room):
+        if room not in self.mixers:
+            self.mixers[room] = AudioMixer(self.rate, tick=self.tick)
+        return self.mixers[room]
+
+    def recorder(self, room):
+        if room not in self.recorders:
+            safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in room)
+            self.recorders[room] = Recorder(os.path.join(self.record_dir, safe))
+        return self.recorders[room]
+
+    def allocate_id(self):
+        # Ids are u16 stream ids: after wrapping, skip the mix and anyone still connected or suspended
+        in_use = {p.id for p in self.sessions.values()}
+        if len(in_use) >= 0xFFFF:
+            raise ProtocolError("No participant ids left")
+        while True:
+            id = self.next_id & 0xFFFF
+            self.next_id += 1
+            if id != MIX_STREAM and id not in in_use:
+                return id
+
+    def speaker(self, room):
+        if room not in self.speakers:
+            self.speakers[room] = ActiveSpeaker()
+        return self.speakers[room]
+
+    def mix_audio(self, participant, header, data):
+        if participant.decoder is None:
+            participant.decoder = AudioDecoder(self.rate)
+        if header.type == AUDIO_CODED:
+            try:
+                pcm = participant.decoder.decode(data)
+            except (ValueError, IndexError) as e:
+                # check_payload passed it, but the codec still could not decode it
+                raise ProtocolError(f"Undecodable coded audio: {e}") from e
+        else:
+            pcm = data
+        self.mixer(participant.room).push(participant.id, pcm)
+        return pcm
+
+    def forward_layer(self, sender, header, data, members):
+        # Sends this layer to the receivers whose selector picked it, returns them
+        layer, msg_type, keyframe, offset = unpack_layer(data)
+        now = time.monotonic()
+        if sender.layer_rates is None:
+            sender.layer_rates = LayerRates()
+        sender.layer_rates.observe(layer, len(data), now)
+        rates = sender.layer_rates.current(now)
+        weight = SPEAKER_WEIGHT if self.speaker(sender.room).update(now) == sender.id else 1.0
+        frame = memoryview(data)[offset:]
+        receivers = []
+        for p in members:
+            if p is sender:
+                continue
+            if p.selector is None:
+                p.selector = LayerSelector()
+            backlog = p.outbox.queued_bytes
+            if p.selector.admit(sender.id, layer, keyframe, header.seq, len(frame), rates, backlog, now, weight):
+                receivers.append(p)
+        if receivers:
+            tagged = pack_header(msg_type, len(frame), sender.id, header.seq, header.timestamp)
+            for p in receivers:
+                p.outbox.put(tagged, frame, video=True)
+            self.forwarded[msg_type].inc(len(receivers) * len(frame))
+        return receivers
+
+    def send_mixes(self):
+        now = now_us()
+        for room, mixer in self.mixers.items():
+            members = {p.id: p for p in self.rooms.get(room, ())}
+            mixes = mixer.mix(members)
+            # stamped with when the mixed audio reached the relay, which receivers line video up against
+            timestamp = now - int(mixer.delay * 1e6)
+            self.send_comfort_noise(members, mixes, timestamp)
+            for id, pcm in mixes.items():
+                p = members[id]
+                if self.mix_codec == "pcm":
+                    msg_type, payload = AUDIO, pcm
+                else:
+                    if p.encoder is None:
+                        p.encoder = AudioEncoder(self.mix_codec, self.rate)
+                    msg_type, payload = AUDIO_CODED, p.encoder.encode(pcm)
+                p.outbox.put(pack_header(msg_type, len(payload), MIX_STREAM, p.mix_seq, timestamp), payload)
+                p.mix_seq += 1
+                self.forwarded[msg_type].inc(len(payload))
+
+    def send_comfort_noise(self, members, mixes, timestamp):
+        # Members with nothing to hear get the loudest background of the others now and then
+        for p in members.values():
+            if p.id in mixes:
+                p.quiet_ticks = 0
+                continue
+            if p.quiet_ticks % self.comfort_interval == 0:
+                levels = [o.noise_level for o in members.values() if o is not p and o.noise_level is not None]
+                payload = pack_comfort_noise(max(levels) if levels else -SILENT_LEVEL)
+                p.outbox.put(pack_header(COMFORT_NOISE, len(payload), MIX_STREAM, 0, timestamp), payload)
+                self.forwarded[COMFORT_NOISE].inc(len(payload))
+            p.quiet_ticks += 1
+
+    async def mix_loop(self):
+        # Absolute deadlines, so the tick does not drift with the time spent mixing
+        deadline = time.monotonic()
+        while True:
+            deadline += self.tick
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            if time.monotonic() - deadline > 5 * self.tick:
+                deadline = time.monotonic()  # fell far behind (e.g. suspended), resync
+            start = time.perf_counter() if self.timed else 0.0
+            self.send_mixes()
+            if self.timed:
+                self.mix_latency.observe(time.perf_counter() - start)
+
+    def watch(self, participant):
+        # Per-receiver queue metrics, removed again when the participant leaves
+        # the outbox changes when the participant resumes on another connection
+        p, id = participant, str(participant.id)
+        metrics.gauge(
+            "relay_receiver_lag_seconds", "Age of the oldest queued message", fn=lambda: p.outbox.lag(), participant=id
+        )
+        metrics.gauge(
+            "relay_receiver_queued_bytes", "Bytes queued", fn=lambda: p.outbox.queued_bytes, participant=id
+        )
+        for kind in ("video", "audio"):
+            metrics.counter(
+                "relay_receiver_dropped_total",
+                "Messages dropped from this receiver's queue",
+                fn=lambda k=kind: p.outbox.dropped[k],
+                participant=id,
+                type=kind,
+            )
+
+    def unwatch(self, participant):
+        id = str(participant.id)
+        metrics.remove("relay_receiver_lag_seconds", participant=id)
+        metrics.remove("relay_receiver_queued_bytes", participant=id)
+        for kind in ("video", "audio"):
+            metrics.remove("relay_receiver_dropped_total", participant=id, type=kind)
+
+    def resume(self, token, room, writer, outbox):
+        # The participant holding this session token, moved onto a new connection; None if unknown
+        participant = self.sessions.get(token)
+        if participant is None:
+            return None
+        if room != participant.room:
+            raise ProtocolError(f"Session token of room {participant.room!r} used to join {room!r}")
+        participant.writer.close()  # in case the old connection is still half open
+        participant.outbox.close()
+        participant.writer = writer
+        participant.outbox = outbox
+        participant.name = str(writer.get_extra_info("peername"))
+        if participant.resumed is not None:
+            participant.resumed.set()
+        members = self.members(participant.room)
+        members.add(participant)
+        self.resumes += 1
+        logger.info(f"{participant.name} resumed as participant {participant.id} in room {participant.room!r}")
+        return participant
+
+    async def suspend(self, participant):
+        # Out of the room until it resumes or `resume_timeout` passes
+        self.members(participant.room).discard(participant)
+        participant.resumed = asyncio.Event()
+        try:
+            await asyncio.wait_for(participant.resumed.wait(), self.resume_timeout)
+        except asyncio.TimeoutError:
+            pass
+        participant.resumed = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        participant = None
+        outbox = None
+        left = False
+        try:
+            header, _, data = await read_message_async(reader)
+            if header.type != JOIN:
+                logger.warning(f"Expected join, got {MESSAGE_NAMES.get(header.type, header.type)}")
+                return
+            room, token = unpack_join(data)
+            room = room or DEFAULT_ROOM
+            outbox = Outbox(
+                writer.get_extra_info("socket"),
+                self.video_queue,
+                self.audio_queue,
+                dropped=self.dropped,
+                delay=self.queue_delay,
+            ).start()
+            participant = self.resume(token, room, writer, outbox) if token else None
+            if participant is None:
+                participant = Participant(self.allocate_id(), room, writer, outbox)
+                self.sessions[participant.token] = participant
+                self.watch(participant)
+                self.members(participant.room).add(participant)
+                logger.info(
+                    f"{participant.name} joined room {participant.room!r} "
+                    f"({len(self.members(participant.room))} members)"
+                )
+            members = self.members(participant.room)
+            outbox.put(pack_header(JOIN, len(participant.token), participant.id), participant.token)
+
+            while True:
+                header, _, data = await read_message_async(reader)
+                if header.type == LEAVE:
+                    left = True
+                    break
+                check_payload(header, data)
+                if self.record_dir is not None and header.type in MEDIA_TYPES:
+                    self.recorder(participant.room).record(restamp(header, participant.id), data)
+                if header.type == ACK:
+                    # acknowledgements go back to the sender of the frame only
+                    others = [p for p in members if p.id == header.stream]
+                    if participant.selector is not None:
+                        participant.selector.on_ack(header.stream, unpack_ack(data)[0])
+                elif header.type == COMFORT_NOISE:
+                    participant.noise_level = unpack_comfort_noise(data)
+                    self.speaker(participant.room).silence(participant.id)
+                    if self.mix:
+                        continue  # the mixer just stops getting audio from it
+                    others = [p for p in members if p is not participant]
+                elif header.type in (AUDIO, AUDIO_CODED) and self.mix:
+                    self.messages += 1
+                    self.bytes += len(data)
+                    pcm = self.mix_audio(participant, header, data)
+                    self.speaker(participant.room).speech(participant.id, level(pcm), time.monotonic())
+                    continue
+                elif header.type == SIMULCAST:
+                    self.messages += 1
+                    self.bytes += len(data)
+                    self.forward_layer(participant, header, data, members)
+                    continue
+                elif header.type in (VIDEO, TILES, AUDIO, AUDIO_CODED):
+                    others = [p for p in members if p is not participant]
+                    if header.type in (AUDIO, AUDIO_CODED):
+                        # coded audio is not decoded just for its level
+                        loudness = level(data) if header.type == AUDIO else CODED_LEVEL
+                        self.speaker(participant.room).speech(participant.id, loudness, time.monotonic())
+                else:
+                    continue
+                if header.type == ACK:
+                    self.acks += 1
+                else:
+                    self.messages += 1
+                    self.bytes += len(data)
+                tagged = restamp(header, participant.id)
+                video = header.type in (VIDEO, TILES)
+                for p in others:
+                    p.outbox.put(tagged, data, video)
+                self.forwarded[header.type].inc(len(others) * len(data))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ProtocolError as e:
+            logger.warning(f"Dropping {writer.get_extra_info('peername')}: {e}")
+            left = True  # a misbehaving client does not get to resume
+        finally:
+            if outbox is not None:
+                outbox.close()
+            writer.close()
+            # unless another connection has resumed the participant meanwhile
+            if participant is not None and participant.outbox is outbox:
+                if not left and self.resume_timeout > 0:
+                    await self.suspend(participant)
+                if participant.outbox is outbox:
+                    await self.depart(participant)
+
+    async def depart(self, participant):
+        del self.sessions[participant.token]
+        self.unwatch(participant)
+        members = self.members(participant.room)
+        members.discard(participant)
+        leave = pack_header(LEAVE, 0, participant.id)
+        for p in members:
+            if p.selector is not None:
+                p.selector.forget(participant.id)
+            # nothing of the participant's reaches the others after they heard it left
+            p.outbox.discard_video(participant.id)
+            p.outbox.put(leave, b"")
+        if participant.room in self.mixers:
+            self.mixers[participant.room].remove(participant.id)
+        if participant.room in self.speakers:
+            self.speakers[participant.room].silence(participant.id)
+        if not members:
+            del self.rooms[participant.room]
+            self.mixers.pop(participant.room, None)
+            self.speakers.pop(participant.room, None)
+            recorder = self.recorders.pop(participant.room, None)
+            if recorder is not None:
+                await asyncio.get_running_loop().run_in_executor(None, recorder.close)
+        dropped = participant.outbox.dropped
+        logger.info(
+            f"{participant.name} left room {participant.room!r} "
+            f"({dropped['video']} video / {dropped['audio']} audio messages dropped for it)"
+        )
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.ip, self.port, backlog=self.backlog)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.mix:
+            self.mix_task = asyncio.create_task(self.mix_loop())
+        logger.info(f"Relay listening on {self.ip}:{self.port}")
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        await self.server.serve_forever()
+
+    def close(self):
+        if self.mix_task is not None:
+            self.mix_task.cancel()
+        for recorder in self.recorders.values():
+            recorder.close()
+        self.recorders = {}
+        if self.server is not None:
+            self.server.close()
+
+
+if __name__ == "__main__":
+    startup = Startup("server_tw")
+    parser = argparse.ArgumentParser(description="Video Chat Relay Server")
+    parser.add_argument("-i", "--ip", default=IP, help=f"Address to bind (default: {IP})")
+    parser.add_argument("-p", "--port", type=int, default=PORT, help=f"Relay port (default: {PORT})")
+    parser.add_argument("--no_mix", action="store_true", help="Forward every audio stream instead of mixing")
+    parser.add_argument(
+        "--mix_codec", choices=["pcm", "ulaw", "adpcm"], default="pcm", help="Codec for mixed audio (default: pcm)"
+    )
+    parser.add_argument("--rate", type=int, default=44100, help="Audio sample rate of the room (default: 44100)")
+    parser.add_argument("--record", help="Record every room into this directory")
+    parser.add_argument("--video_queue", type=int, default=3, help="Video frames queued per receiver (default: 3)")
+    parser.add_argument("--audio_queue", type=int, default=32, help="Audio/control messages queued (default: 32)")
+    parser.add_argument(
+        "--resume_timeout", type=float, default=10, help="Seconds a dropped session can be resumed (default: 10)"
+    )
+    parser.add_argument("--metrics_port", type=int, help="Serve Prometheus metrics on this localhost port")
+    parser.add_argument("--metrics_json", help="Append a JSON metrics snapshot to this file periodically")
+    parser.add_argument("--metrics_interval", type=float, default=5, help="Seconds between JSON snapshots")
+    parser.add_argument("--startup_json", help="Append the startup milestones to this file as a JSON line")
+    args = parser.parse_args()
+    startup.path = args.startup_json
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.metrics_json:
+        metrics.SnapshotWriter(args.metrics_json, args.metrics_interval).start()
+
+    relay = Relay(
+        args.ip,
+        args.port,
+        mix=not args.no_mix,
+        mix_codec=args.mix_codec,
+        rate=args.rate,
+        record_dir=args.record,
+        video_queue=args.video_queue,
+        audio_queue=args.audio_queue,
+        resume_timeout=args.resume_timeout,
+    )
+
+    async def serve():
+        await relay.start()
+        startup.mark("listening")
+        logger.info(f"Startup: {startup.report()}")
+        await relay.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        for recorder in relay.recorders.values():
+            recorder.close()
+        logger.info("Relay stopped")
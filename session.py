@@ -0,0 +1,112 @@
+import socket
+import time
+
+from framing import FrameReader
+from protocol import JOIN, LEAVE, MessageWriter, ProtocolError, pack_header, pack_join, read_message, send_parts
+
+# Client side of a relay connection that survives the connection dropping. The
+# relay answers JOIN with our participant id and a session token; when the
+# connection breaks, read() connects again and joins with that token, which
+# resumes the same participant: the others keep our stream id and everything
+# they hold for it (jitter buffer, clock offset, decoder, grid tile), and we
+# keep theirs. Nothing is renegotiated, the media threads carry on.
+
+
+class SessionWriter(MessageWriter):
+    # Messages sent while the connection is down are dropped, as on a lossy link
+    def __init__(self):
+        super().__init__(None)
+        self.dropped = 0
+
+    def write(self, parts):
+        if self.sock is None:
+            self.dropped += 1
+            return
+        try:
+            send_parts(self.sock, parts)
+        except OSError:
+            self.dropped += 1
+
+
+class RelaySession:
+    # connect() once, then read() from one thread and send through `writer` from
+    # any. A drop is retried with backoff for `resume_for` seconds.
+    def __init__(self, address, room, timeout=5.0, resume_for=30.0):
+        self.address = address
+        self.room = room
+        self.timeout = timeout  # per connection attempt, including the relay's answer
+        self.resume_for = resume_for
+        self.writer = SessionWriter()
+        self.reader = None
+        self.id = None
+        self.token = None
+        self.resumes = 0
+        self.closed = False
+
+    def connect(self):
+        # Connects and joins, resuming once there is a token; returns once the relay has answered
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        try:
+            reader = FrameReader(sock)
+            payload = pack_join(self.room, self.token)
+            send_parts(sock, [pack_header(JOIN, len(payload)), payload])
+            header, answer = read_message(reader)  # the relay answers before sending anything else
+            if header.type != JOIN:
+                raise ProtocolError(f"Expected the relay's join answer, got type {header.type}")
+            sock.settimeout(None)
+        except BaseException:
+            sock.close()
+            raise
+        self.id, self.token = header.stream, bytes(answer)
+        self.reader = reader
+        with self.writer.lock:
+            if self.closed:  # closed while resuming
+                sock.close()
+                return
+            self.writer.sock = sock
+
+    def read(self):
+        # Next (header, payload) from the relay, None once closed. Raises ConnectionError
+        # when the session could not be resumed.
+        while True:
+            try:
+                return read_message(self.reader)
+            except (OSError, ProtocolError):
+                if self.closed:
+                    return None
+                self.reconnect()
+
+    def reconnect(self):
+        self.disconnect()
+        deadline = time.monotonic() + self.resume_for
+        delay = 0.1
+        while not self.closed:
+            try:
+                self.connect()
+                self.resumes += 1
+                return
+            except (OSError, ProtocolError) as e:
+                if time.monotonic() + delay > deadline:
+                    raise ConnectionError(f"Could not resume the session: {e}") from e
+            time.sleep(delay)
+            delay = min(2 * delay, 2.0)
+
+    def disconnect(self):
+        with self.writer.lock:
+            sock, self.writer.sock = self.writer.sock, None
+        if sock is not None:
+            sock.close()
+
+    def close(self):
+        # Leaves the room; a read() blocked on the connection returns None
+        self.closed = True
+        with self.writer.lock:
+            sock, self.writer.sock = self.writer.sock, None
+        if sock is None:
+            return
+        try:
+            send_parts(sock, [pack_header(LEAVE, 0)])
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
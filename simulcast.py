@@ -0,0 +1,217 @@
+import struct
+import time
+
+from protocol import TILES, VIDEO
+
+# Simulcast payload: layer u8 | media type u8 | flags u8, then the frame as the
+# media type would carry it (a JPEG for video, a tile payload for tiles). Layer
+# 0 is full size and every further layer halves the width and height. All
+# layers of one captured frame share the header's sequence number, so an ACK
+# for whichever layer a receiver got acknowledges that frame.
+LAYER_HEADER = struct.Struct("!BBB")
+KEYFRAME = 1
+MAX_LAYERS = 3
+
+
+def pack_layer(layer, msg_type, keyframe=True):
+    return LAYER_HEADER.pack(layer, msg_type, KEYFRAME if keyframe else 0)
+
+
+def unpack_layer(payload):
+    # (layer, media type, keyframe, offset of the frame)
+    layer, msg_type, flags = LAYER_HEADER.unpack_from(payload)
+    return layer, msg_type, bool(flags & KEYFRAME), LAYER_HEADER.size
+
+
+def is_layer(payload):
+    # Whether the relay can forward the payload: a complete header, a known layer and a video type
+    if len(payload) < LAYER_HEADER.size:
+        return False
+    layer, msg_type, _ = LAYER_HEADER.unpack_from(payload)
+    return layer < MAX_LAYERS and msg_type in (VIDEO, TILES)
+
+
+def encode_layers(frame, params, layers=MAX_LAYERS):
+    # One JPEG per layer, largest first; every JPEG is a keyframe. cv2 is only
+    # imported by senders, the relay picks layers without it.
+    import cv2
+
+    h, w = frame.shape[:2]
+    payloads = []
+    for layer in range(layers):
+        if layer:
+            frame = cv2.resize(frame, (max(1, w >> layer), max(1, h >> layer)), interpolation=cv2.INTER_AREA)
+        payloads.append(pack_layer(layer, VIDEO) + cv2.imencode(".jpg", frame, params)[1].tobytes())
+    return payloads
+
+
+class LayerRates:
+    # Bytes per second each layer of one sender takes, as seen by the relay
+    def __init__(self, window=1.0, stale=2.0):
+        self.window = window
+        self.stale = stale
+        self.rates = [None] * MAX_LAYERS
+        self.bytes = [0] * MAX_LAYERS
+        self.last_seen = [None] * MAX_LAYERS
+        self.start = None
+
+    def observe(self, layer, size, now):
+        if layer >= MAX_LAYERS:
+            return
+        if self.start is None:
+            self.start = now
+        self.bytes[layer] += size
+        self.last_seen[layer] = now
+        elapsed = now - self.start
+        if elapsed >= self.window:
+            for i, total in enumerate(self.bytes):
+                if total:
+                    rate = total / elapsed
+                    self.rates[i] = rate if self.rates[i] is None else 0.5 * self.rates[i] + 0.5 * rate
+            self.bytes = [0] * MAX_LAYERS
+            self.start = now
+
+    def current(self, now):
+        # Rate per layer: None for layers not being sent, infinite until measured
+        return [
+            (float("inf") if rate is None else rate) if seen is not None and now - seen < self.stale else None
+            for rate, seen in zip(self.rates, self.last_seen)
+        ]
+
+
+class LayerSelector:
+    # Decides, for one receiver, which layer of each sender to forward. The link
+    # to the receiver is measured from the ACKs it sends back through the relay:
+    # round trip from forwarding a frame to its ACK, and bytes acknowledged per
+    # second. A budget follows those the way BitrateController's level does:
+    # cut to what was delivered when the round trip or the relay's write backlog
+    # says the link is congested, raised by `probe_gain` every `probe_interval`
+    # while it is not. A raise followed by congestion doubles the wait before the
+    # next one (up to `max_hold`), so a link that cannot carry the next layer is
+    # not pushed into a queue every second; a raise that holds until the next
+    # one, or for `stable` seconds, halves it again, so probing speeds up once
+    # the network recovers.
+    # Each sender gets an equal share of the budget and the highest layer that
+    # fits in it, the room's active speaker `weight` shares. A receiver moves to
+    # a different layer only on a keyframe of that layer, and starts on the lowest.
+    def __init__(
+        self,
+        target_latency=0.2,
+        max_backlog=256 * 1024,
+        interval=0.25,
+        probe_interval=0.5,
+        probe_gain=2.0,
+        max_hold=30.0,
+        stable=2.0,
+    ):
+        self.target_latency = target_latency
+        self.max_backlog = max_backlog
+        self.interval = interval
+        self.probe_interval = probe_interval
+        self.probe_gain = probe_gain
+        self.max_hold = max_hold
+        self.stable = stable
+        self.hold = probe_interval
+        self.raised = None
+        self.current = {}
+        self.last_seq = {}
+        self.inflight = {}
+        self.delivered = 0
+        self.srtt = None
+        self.throughput = None
+        self.budget = None
+        self.last_update = None
+        self.last_probe = None
+        self.switches = {"up": 0, "down": 0}
+
+    def choose(self, rates, weight=1.0):
+        if self.budget is None:
+            return max((i for i, rate in enumerate(rates) if rate is not None), default=None)
+        share = self.budget * weight / max(1.0, len(self.current) + weight - 1)
+        fitting = [i for i, rate in enumerate(rates) if rate is not None and rate <= share]
+        if fitting:
+            return min(fitting)
+        return max((i for i, rate in enumerate(rates) if rate is not None), default=None)
+
+    def admit(self, sender, layer, keyframe, seq, size, rates, backlog, now=None, weight=1.0):
+        # True if this layer message is to be forwarded to the receiver
+        now = time.monotonic() if now is None else now
+        self.update(now, backlog)
+        current = self.current.get(sender)
+        if layer != current:
+            desired = self.choose(rates, weight)
+            # Layers of a frame arrive largest first, so a step down repeats the
+            # frame just forwarded, at the smaller size
+            if layer != desired or not keyframe or seq < self.last_seq.get(sender, -1):
+                return False
+            if current is not None:
+                self.switches["up" if layer < current else "down"] += 1
+            self.current[sender] = layer
+        self.last_seq[sender] = seq
+        self.inflight[(sender, seq)] = (size, now)
+        return True
+
+    def on_ack(self, sender, seq, now=None):
+        now = time.monotonic() if now is None else now
+        entry = self.inflight.pop((sender, seq), None)
+        if entry is None:
+            return
+        # cumulative, like the ACKs themselves
+        for key in [k for k in self.inflight if k[0] == sender and k[1] < seq]:
+            self.delivered += self.inflight.pop(key)[0]
+        size, sent = entry
+        self.delivered += size
+        rtt = now - sent
+        self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+
+    def forget(self, sender):
+        self.current.pop(sender, None)
+        self.last_seq.pop(sender, None)
+        for key in [k for k in self.inflight if k[0] == sender]:
+            del self.inflight[key]
+
+    def update(self, now, backlog=0):
+        if self.last_update is None:
+            self.last_update = self.last_probe = now
+            return
+        elapsed = now - self.last_update
+        if elapsed < self.interval:
+            return
+        rate = self.delivered / elapsed
+        self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+        self.delivered = 0
+        self.last_update = now
+        for key in [k for k, (_, sent) in self.inflight.items() if now - sent > 4 * self.target_latency + 1]:
+            del self.inflight[key]  # never acknowledged
+
+        congested = (self.srtt is not None and self.srtt > self.target_latency) or backlog > self.max_backlog
+        if congested:
+            cap = self.throughput * 0.85
+            self.budget = cap if self.budget is None else min(self.budget, cap)
+            self.last_probe = now
+            if self.raised is not None:
+                self.hold = min(self.max_hold, self.hold * 2)  # the last raise was too much
+                self.raised = None
+            return
+        probe = (
+            self.throughput
+            and self.srtt is not None
+            and self.srtt < self.target_latency / 2
+            and now - self.last_probe >= self.hold
+        )
+        if self.raised is not None and (probe or now - self.raised >= self.stable):
+            self.hold = max(self.probe_interval, self.hold / 2)  # the last raise held
+            self.raised = None
+        if probe:
+            # never more than a few times what is actually being delivered
+            self.budget = min(max(self.budget or 0.0, self.throughput) * self.probe_gain, 4 * self.throughput)
+            self.last_probe = self.raised = now
+
+    def stats(self):
+        return {
+            "layers": dict(self.current),
+            "srtt_ms": None if self.srtt is None else self.srtt * 1000,
+            "throughput_kbps": None if self.throughput is None else self.throughput * 8 / 1000,
+            "budget_kbps": None if self.budget is None else self.budget * 8 / 1000,
+            "switches": dict(self.switches),
+        }
@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+import time
+
+# Startup milestones of an entry point: "imported" when it is created (after the
+# module imports), then e.g. "connected", "camera", "audio", "warm" and
+# "first_frame" (the first remote frame on screen). They are kept as wall-clock
+# times so bench_startup.py can measure them from when it started the process.
+
+
+class Startup:
+    def __init__(self, name, path=None):
+        self.name = name
+        self.path = path  # report() appends the milestones here as one JSON line
+        self.lock = threading.Lock()
+        self.marks = {}
+        self.reported = False
+        self.mark("imported")
+
+    def mark(self, milestone, when=None):
+        # Only the first time counts
+        with self.lock:
+            self.marks.setdefault(milestone, time.time() if when is None else when)
+
+    def parallel(self, **tasks):
+        # Runs every task on its own thread and marks it by name when it finishes.
+        # Returns the results by name once all are done, or raises the first error.
+        results = {}
+        errors = []
+
+        def run(name, task):
+            try:
+                results[name] = task()
+                self.mark(name)
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=item, name=f"startup-{item[0]}") for item in tasks.items()]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def elapsed(self):
+        # Seconds from the end of the imports to every milestone so far
+        with self.lock:
+            start = self.marks["imported"]
+            return {milestone: round(t - start, 3) for milestone, t in self.marks.items()}
+
+    def report(self):
+        # Once: appends the milestones to `path`; returns elapsed(), None if already reported
+        with self.lock:
+            if self.reported:
+                return None
+            self.reported = True
+            marks = dict(self.marks)
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"entry": self.name, "pid": os.getpid(), "marks": marks}) + "\n")
+        return self.elapsed()
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from audio_codec import ADPCM_STATE, AUDIO_HEADER, AudioDecoder, AudioEncoder, is_coded_audio, lowpass
+
+
+def tone(n=1024, rate=44100, freq=440.0, amplitude=8000):
+    t = np.arange(n) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def snr_db(reference, decoded):
+    noise = reference.astype(np.float64) - decoded.astype(np.float64)
+    return 10 * np.log10(np.sum(reference.astype(np.float64) ** 2) / max(np.sum(noise**2), 1e-9))
+
+
+def round_trip(codec, samples, coded_rate=None, decoder=None):
+    payload = AudioEncoder(codec, 44100, coded_rate).encode(samples.tobytes())
+    assert is_coded_audio(payload)
+    return np.frombuffer((decoder or AudioDecoder(44100)).decode(payload), dtype=np.int16)
+
+
+def test_pcm_is_exact():
+    samples = tone()
+    assert np.array_equal(round_trip("pcm", samples), samples)
+
+
+@pytest.mark.parametrize("codec, min_snr", [("ulaw", 30), ("adpcm", 20)])
+def test_lossy_codecs_keep_the_signal(codec, min_snr):
+    samples = tone()
+    decoded = round_trip(codec, samples)
+    assert len(decoded) == len(samples)
+    assert snr_db(samples, decoded) > min_snr
+
+
+def test_adpcm_chunks_decode_on_their_own():
+    # every chunk carries its predictor state, so a lost chunk does not derail the next
+    samples = tone(4096)
+    encoder = AudioEncoder("adpcm")
+    payloads = [encoder.encode(samples[i : i + 1024].tobytes()) for i in range(0, 4096, 1024)]
+    decoded = np.concatenate([np.frombuffer(AudioDecoder().decode(p), dtype=np.int16) for p in payloads])
+    assert snr_db(samples, decoded) > 20
+
+
+def test_voice_rate_restores_the_chunk_length():
+    samples = tone(1024, freq=300.0)
+    decoded = round_trip("ulaw", samples, coded_rate=16000)
+    assert len(decoded) == len(samples)
+    # the anti-aliasing filter delays the signal by half its length
+    delay = (len(lowpass(16000 / 44100)) - 1) // 2
+    assert snr_db(samples[:-delay], decoded[delay:]) > 15
+
+
+def test_voice_rate_has_no_clicks_at_chunk_boundaries():
+    samples = tone(8 * 1024, freq=300.0)
+    encoder, decoder = AudioEncoder("pcm", 44100, 16000), AudioDecoder(44100)
+    chunks = [encoder.encode(samples[i : i + 1024].tobytes()) for i in range(0, len(samples), 1024)]
+    decoded = np.concatenate([np.frombuffer(decoder.decode(c), dtype=np.int16) for c in chunks])
+    edges = np.zeros(len(samples), dtype=bool)
+    for boundary in range(1024, len(samples) + 1, 1024):
+        edges[boundary - 40 : boundary + 40] = True
+    inside = ~edges
+    inside[:1024] = False  # the filter's start-up
+
+    def error(delay):
+        return np.abs(decoded[delay:].astype(int) - samples[: len(samples) - delay])
+
+    # line the output up with the input where no boundary is near, whatever the filter's delay
+    delay = min(range(32), key=lambda d: error(d)[inside[: len(samples) - d]].max())
+    e = error(delay)
+    # the boundaries are as close to the input as the rest of the stream
+    assert e[edges[: len(e)]].max() <= 1.5 * e[inside[: len(e)]].max() + 10
+
+
+def test_is_coded_audio_rejects_unknown_and_short_payloads():
+    assert not is_coded_audio(b"")
+    assert not is_coded_audio(AUDIO_HEADER.pack(9, 1, 44100, 1024))
+    assert not is_coded_audio(AUDIO_HEADER.pack(2, 1, 44100, 1024))  # ADPCM without its state
+    assert is_coded_audio(AUDIO_HEADER.pack(0, 1, 44100, 0))
+
+
+@pytest.mark.parametrize(
+    "index, padded, valid", [(0, 0, True), (88, 1, True), (89, 0, False), (200, 0, False), (0, 2, False)]
+)
+def test_is_coded_audio_checks_the_adpcm_state(index, padded, valid):
+    payload = AUDIO_HEADER.pack(2, 1, 44100, 20) + ADPCM_STATE.pack(0, index, padded) + bytes(10)
+    assert is_coded_audio(payload) == valid
+    if valid:
+        assert len(np.frombuffer(AudioDecoder(44100).decode(payload), dtype=np.int16)) == 20
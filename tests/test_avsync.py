@@ -0,0 +1,96 @@
+import pytest
+
+import avsync
+from avsync import ClockOffset, PlayoutScheduler
+from protocol import VIDEO, Header
+
+MS = 1000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Local time in us, moved by the test
+    now = [10_000 * MS]
+    monkeypatch.setattr(avsync, "now_us", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def scheduler(clock):
+    scheduler = PlayoutScheduler(max_late=0.08, default_delay=0.05)
+    # the sender's clock equals ours and messages arrive instantly
+    scheduler.observe(header(clock[0]), arrival=clock[0])
+    return scheduler
+
+
+def header(timestamp, stream=1):
+    return Header(1, VIDEO, stream, 0, timestamp, 0)
+
+
+def at(scheduler, clock, t):
+    clock[0] = t
+    return [frame for _, frame in scheduler.pop_due()]
+
+
+def test_clock_offset_is_the_smallest_recent_delta():
+    offset = ClockOffset(window=2)
+    assert offset.offset() is None
+    offset.observe(1_000_000, arrival=1_050_000)
+    offset.observe(1_100_000, arrival=1_130_000)
+    assert offset.offset() == 30_000
+    offset.observe(5_000_000, arrival=5_040_000)  # the older seconds leave the window
+    assert offset.offset() == 40_000
+
+
+def test_frames_are_due_default_delay_after_capture(scheduler, clock):
+    t = clock[0]
+    scheduler.push(header(t), "a")
+    assert at(scheduler, clock, t + 49 * MS) == []
+    assert at(scheduler, clock, t + 50 * MS) == ["a"]
+
+
+def test_a_reordered_frame_does_not_wait_behind_a_later_one(scheduler, clock):
+    t = clock[0]
+    scheduler.push(header(t + 200 * MS), "later")  # due at +250 ms
+    scheduler.push(header(t + 10 * MS), "earlier")  # arrives second, due at +60 ms
+    assert at(scheduler, clock, t + 60 * MS) == ["earlier"]
+    assert scheduler.waiting() == 1
+    assert at(scheduler, clock, t + 250 * MS) == ["later"]
+
+
+def test_frames_captured_before_the_one_shown_are_dropped(scheduler, clock):
+    t = clock[0]
+    scheduler.push(header(t + 20 * MS), "new")
+    assert at(scheduler, clock, t + 70 * MS) == ["new"]
+    scheduler.push(header(t + 10 * MS), "old")
+    assert scheduler.waiting() == 0
+    assert scheduler.late == 1
+
+
+def test_only_the_newest_due_frame_is_shown(scheduler, clock):
+    t = clock[0]
+    for i, frame in enumerate("abc"):
+        scheduler.push(header(t + i * 10 * MS), frame)
+    assert at(scheduler, clock, t + 100 * MS) == ["c"]
+    assert scheduler.late == 2
+
+
+def test_late_frames_are_dropped_except_the_first(scheduler, clock):
+    t = clock[0]
+    scheduler.push(header(t), "first")
+    assert at(scheduler, clock, t + 500 * MS) == ["first"]  # far behind, but the stream's first
+    scheduler.push(header(t + 100 * MS), "late")  # due at +150 ms
+    assert at(scheduler, clock, t + 300 * MS) == []
+    assert scheduler.late == 1
+
+
+def test_streams_are_scheduled_independently(scheduler, clock):
+    t = clock[0]
+    scheduler.observe(header(t, stream=2), arrival=t)
+    scheduler.push(header(t + 100 * MS, stream=1), "one")
+    scheduler.push(header(t, stream=2), "two")
+    assert scheduler.pop_due() == []
+    clock[0] = t + 50 * MS
+    assert scheduler.pop_due() == [(2, "two")]
+    scheduler.remove(1)
+    assert scheduler.waiting() == 0
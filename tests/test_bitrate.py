@@ -0,0 +1,54 @@
+from bitrate import BitrateController
+
+
+def run(controller, start, seconds, ack_delay=None, step=1 / 30):
+    # Captures whenever the controller allows; frames are acknowledged `ack_delay` later, or never
+    now, seq, pending = start, 0, []
+    while now < start + seconds:
+        while pending and pending[0][1] <= now:
+            controller.on_ack(pending.pop(0)[0], now)
+        if controller.should_capture(now):
+            controller.on_send(seq, 5000, now)
+            if ack_delay is not None:
+                pending.append((seq, now + ack_delay))
+            seq += 1
+        now += step
+    return now
+
+
+def test_level_rises_on_a_fast_link():
+    controller = BitrateController(level=0.5)
+    run(controller, 0.0, 5.0, ack_delay=0.02)
+    assert controller.level == 1.0
+    assert controller.quality == controller.max_quality
+
+
+def test_level_falls_when_rtt_exceeds_the_target():
+    controller = BitrateController(level=1.0, target_latency=0.2)
+    run(controller, 0.0, 5.0, ack_delay=0.5)
+    assert controller.level < 0.5
+
+
+def test_level_falls_when_acks_stop():
+    controller = BitrateController(level=0.5)
+    now = run(controller, 0.0, 3.0, ack_delay=0.02)
+    before = controller.level
+    run(controller, now, 5.0)  # nothing is acknowledged any more
+    assert controller.level < before * 0.5
+    assert controller.stats()["lost"] > 0
+
+
+def test_expired_frames_do_not_resume_at_the_same_level():
+    controller = BitrateController(level=0.8, max_inflight=100)
+    run(controller, 0.0, 3.0)
+    # the unacknowledged frames expired and were counted as congestion
+    assert controller.lost > 0
+    assert controller.level < 0.8
+
+
+def test_capture_is_paced_to_the_target_fps():
+    controller = BitrateController(level=0.0, min_fps=5)
+    assert controller.should_capture(0.0)
+    controller.on_send(0, 1000, 0.0)
+    assert not controller.should_capture(0.1)
+    assert controller.should_capture(0.21)
@@ -0,0 +1,71 @@
+import queue
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import pytest
+
+from codec_pool import CodecPool
+
+QUALITY = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
+
+
+def frame(i, shape=(48, 64, 3)):
+    out = np.full(shape, 40 * i, dtype=np.uint8)
+    out[:, : shape[1] // 2] = 255 - 40 * i
+    return out
+
+
+@pytest.fixture(params=["thread", "process"])
+def pool(request):
+    pool = CodecPool(workers=2, kind=request.param, slots=3, slot_size=48 * 64 * 3)
+    yield pool
+    pool.close()
+
+
+def test_round_trip_in_submission_order(pool):
+    frames = [frame(i) for i in range(3)]
+    for i, f in enumerate(frames):
+        pool.encode(f, QUALITY, context=i)
+    encoded = [pool.get(timeout=5.0) for _ in frames]
+    assert [context for context, _ in encoded] == [0, 1, 2]
+    assert all(jpeg[:2] == b"\xff\xd8" for _, jpeg in encoded)
+
+    for context, jpeg in encoded:
+        pool.decode(jpeg, context=context)
+    for i, f in enumerate(frames):
+        context, decoded = pool.get(timeout=5.0)
+        assert context == i
+        assert decoded.shape == f.shape
+        assert np.abs(decoded.astype(int) - f).mean() < 3
+    assert pool.in_flight() == 0
+
+
+def test_failed_decode_returns_none(pool):
+    pool.decode(b"not a jpeg", context="bad")
+    assert pool.get(timeout=5.0) == ("bad", None)
+
+
+def test_submit_waits_for_a_free_slot():
+    pool = CodecPool(workers=1, kind="process", slots=1, slot_size=48 * 64 * 3)
+    try:
+        pool.encode(frame(0), QUALITY)
+        with pytest.raises(queue.Empty):
+            pool.encode(frame(1), QUALITY, timeout=0.01)
+        pool.get(timeout=5.0)
+        pool.encode(frame(1), QUALITY, timeout=0.01)
+        pool.get(timeout=5.0)
+        with pytest.raises(ValueError):
+            pool.encode(frame(0, (96, 64, 3)), QUALITY)
+    finally:
+        pool.close()
+
+
+def test_close_stops_workers_and_unlinks_the_ring():
+    pool = CodecPool(workers=2, kind="process", slots=2, slot_size=48 * 64 * 3)
+    name = pool.ring.name
+    pool.warm_up((48, 64, 3))
+    pool.close()
+    assert not any(proc.is_alive() for proc in pool.procs)
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
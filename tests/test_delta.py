@@ -0,0 +1,133 @@
+import numpy as np
+
+from delta import KEYFRAME, TILE_HEADER, TileDecoder, TileEncoder
+
+T = 32
+
+
+def frame(colors):
+    # One flat colour per tile, which JPEG keeps nearly exact
+    return np.kron(colors, np.ones((T, T, 1), dtype=np.uint8)).astype(np.uint8)
+
+
+def base():
+    rng = np.random.default_rng(1)
+    return rng.integers(0, 256, (3, 4, 3), dtype=np.uint8)  # 3 x 4 tiles, 96 x 128 pixels
+
+
+def tiles_in(payload):
+    _, _, _, flags, count = TILE_HEADER.unpack_from(payload)
+    return count, bool(flags & KEYFRAME)
+
+
+def send(encoder, image, seq, **kwargs):
+    payload, token = encoder.encode(image, quality=95, **kwargs)
+    encoder.on_send(token, seq)
+    return payload
+
+
+def close_to(a, b):
+    return np.abs(a.astype(int) - b.astype(int)).mean() < 3
+
+
+def test_first_frame_is_a_keyframe():
+    payload = send(TileEncoder(tile=T), frame(base()), 0)
+    assert tiles_in(payload) == (12, True)
+    assert close_to(TileDecoder().decode(payload), frame(base()))
+
+
+def test_only_changed_tiles_after_an_ack():
+    encoder, decoder = TileEncoder(tile=T), TileDecoder()
+    colors = base()
+    decoder.decode(send(encoder, frame(colors), 0))
+    encoder.on_ack(0)
+    assert tiles_in(send(encoder, frame(colors), 1))[0] == 0
+    colors[1, 2] = 255 - colors[1, 2]
+    payload = send(encoder, frame(colors), 2)
+    assert tiles_in(payload) == (1, False)
+    assert close_to(decoder.decode(payload), frame(colors))
+
+
+def noisy(image, rng, std=1.5):
+    # Sensor noise as bench_delta adds it
+    return np.clip(image + rng.normal(0, std, image.shape), 0, 255).astype(np.uint8)
+
+
+def test_noise_on_a_static_frame_sends_no_tiles():
+    rng = np.random.default_rng(2)
+    encoder = TileEncoder(tile=T)
+    image = frame(base())
+    send(encoder, noisy(image, rng), 0)
+    encoder.on_ack(0)
+    assert tiles_in(send(encoder, noisy(image, rng), 1))[0] == 0
+    # a tile that really changed still goes out
+    changed = image.copy()
+    changed[:T, :T] = 255 - changed[:T, :T]
+    assert tiles_in(send(encoder, noisy(changed, rng), 2))[0] == 1
+
+
+def test_threshold_is_a_mean_difference_per_sample():
+    encoder = TileEncoder(tile=T, threshold=6.0)
+    image = frame(base())
+    send(encoder, image, 0)
+    encoder.on_ack(0)
+    shifted = image.astype(int)
+    shifted[:T, :T] += np.where(shifted[:T, :T] < 128, 5, -5)  # mean difference 5
+    shifted[:T, T : 2 * T] += np.where(shifted[:T, T : 2 * T] < 128, 7, -7)  # mean difference 7
+    mask = encoder.changed(encoder.pad(shifted.astype(np.uint8)))
+    assert mask.sum() == 1 and mask[0, 1]
+
+
+def test_unacknowledged_changes_are_repeated():
+    # Frame 1 is never delivered; frame 2 still brings the receiver up to date
+    encoder, decoder = TileEncoder(tile=T), TileDecoder()
+    colors = base()
+    decoder.decode(send(encoder, frame(colors), 0))
+    encoder.on_ack(0)
+    colors[0, 0] = 255 - colors[0, 0]
+    send(encoder, frame(colors), 1)
+    colors[2, 3] = 255 - colors[2, 3]
+    payload = send(encoder, frame(colors), 2)
+    assert tiles_in(payload)[0] == 2
+    assert close_to(decoder.decode(payload), frame(colors))
+
+
+def test_ack_moves_the_reference_to_that_frame():
+    encoder = TileEncoder(tile=T)
+    colors = base()
+    send(encoder, frame(colors), 0)
+    encoder.on_ack(0)
+    colors[0, 0] = 255 - colors[0, 0]
+    send(encoder, frame(colors), 1)
+    encoder.on_ack(1)
+    assert tiles_in(send(encoder, frame(colors), 2))[0] == 0
+    encoder.on_ack(99)  # unknown frames are ignored
+    assert len(encoder.pending) == 1
+
+
+def test_no_reference_until_a_complete_frame_is_acknowledged():
+    encoder = TileEncoder(tile=T, keyframe_interval=1000)
+    colors = base()
+    send(encoder, frame(colors), 0)
+    colors[0, 0] = 0
+    send(encoder, frame(colors), 1)  # still everything, nothing acknowledged yet
+    assert tiles_in(send(encoder, frame(colors), 2))[0] == 12
+    encoder.on_ack(2)
+    assert tiles_in(send(encoder, frame(colors), 3))[0] == 0
+
+
+def test_decoder_waits_for_a_keyframe():
+    encoder = TileEncoder(tile=T)
+    colors = base()
+    send(encoder, frame(colors), 0)
+    encoder.on_ack(0)
+    colors[1, 1] = 0
+    assert TileDecoder().decode(send(encoder, frame(colors), 1)) is None
+
+
+def test_size_change_starts_over_with_a_keyframe():
+    encoder = TileEncoder(tile=T)
+    send(encoder, frame(base()), 0)
+    encoder.on_ack(0)
+    smaller = frame(base()[:2, :2])
+    assert tiles_in(send(encoder, smaller, 1)) == (4, True)
@@ -0,0 +1,48 @@
+import socket
+
+import pytest
+
+from framing import FrameReader, make_header
+
+
+class TrickleSocket:
+    # recv_into hands out at most `step` bytes per call, like a busy TCP socket
+    def __init__(self, data, step=3):
+        self.data = memoryview(data)
+        self.step = step
+
+    def recv_into(self, view, size):
+        n = min(size, self.step, len(self.data))
+        view[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def test_read_frame_across_short_reads():
+    payload = bytes(range(200))
+    reader = FrameReader(TrickleSocket(make_header(len(payload)) + payload), initial_size=16)
+    assert bytes(reader.read_frame()) == payload
+
+
+def test_read_sized_frames_in_a_row():
+    frames = [b"first", b"", b"x" * 1000]
+    data = b"".join(len(f).to_bytes(4, "big") + f for f in frames)
+    reader = FrameReader(TrickleSocket(data, step=7), initial_size=8)
+    assert [bytes(reader.read_sized()) for _ in frames] == frames
+
+
+def test_buffer_grows_and_is_reused():
+    reader = FrameReader(TrickleSocket(b"a" * 10 + b"b" * 100, step=1000), initial_size=16)
+    first = reader.read_payload(10)
+    assert bytes(first) == b"a" * 10
+    assert bytes(reader.read_payload(100)) == b"b" * 100
+    assert len(reader.buffer) >= 100
+
+
+def test_closed_socket_raises():
+    a, b = socket.socketpair()
+    with a, b:
+        b.sendall(make_header(100) + b"short")
+        b.close()
+        with pytest.raises(ConnectionError):
+            FrameReader(a).read_frame()
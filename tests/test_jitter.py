@@ -0,0 +1,79 @@
+import numpy as np
+
+from jitter import AudioJitterBuffer
+
+CHUNK, RATE = 4, 100  # 40 ms chunks keep the numbers small
+
+
+def chunk(value):
+    return np.full(CHUNK, value, dtype=np.int16).tobytes()
+
+
+def buffer():
+    return AudioJitterBuffer(CHUNK, RATE, min_delay=0.02, fade_chunks=2)
+
+
+def put(jitter, seq, value=None):
+    # on time: arrival and capture advance together, so the jitter estimate stays 0
+    jitter.put(seq, seq * 40_000, chunk(seq + 1 if value is None else value), now=seq * 0.04)
+
+
+def played(jitter):
+    return np.frombuffer(jitter.get(), dtype=np.int16)
+
+
+def test_waits_for_the_target_delay_before_playing():
+    jitter = buffer()
+    assert not played(jitter).any()
+    put(jitter, 0)
+    assert (played(jitter) == 1).all()
+
+
+def test_reorders_by_sequence_number():
+    jitter = buffer()
+    for seq in (1, 0, 2):
+        put(jitter, seq)
+    assert [played(jitter)[0] for _ in range(3)] == [1, 2, 3]
+    assert jitter.stats()["played"] == 3
+
+
+def test_late_packets_are_dropped():
+    jitter = buffer()
+    put(jitter, 0)
+    put(jitter, 1)
+    played(jitter)
+    played(jitter)
+    put(jitter, 0)
+    assert jitter.stats()["late"] == 1
+
+
+def test_conceals_with_a_fading_repeat_then_silence():
+    jitter = buffer()
+    put(jitter, 0, 1000)
+    assert (played(jitter) == 1000).all()
+    first, second, third = played(jitter), played(jitter), played(jitter)
+    assert 0 < np.abs(second).max() < np.abs(first).max() <= 1000
+    assert not third.any()
+    assert jitter.stats()["concealed"] == 3
+
+
+def test_a_missing_packet_is_given_up_once_later_ones_wait():
+    jitter = buffer()
+    put(jitter, 0)
+    played(jitter)
+    put(jitter, 2)
+    played(jitter)  # seq 1 never comes: its slot is concealed
+    assert jitter.stats()["lost"] == 1
+    assert played(jitter)[-1] == 3  # faded back in after the concealment
+
+
+def test_comfort_noise_fills_silence_and_the_next_talk_spurt_buffers_again():
+    jitter = buffer()
+    put(jitter, 0)
+    played(jitter)
+    jitter.comfort(40_000, -40.0)
+    noise = played(jitter)
+    assert noise.any() and np.abs(noise).max() < 3000
+    assert jitter.stats()["concealed"] == 0
+    put(jitter, 1, 6)  # audio messages are numbered on, silence takes no numbers
+    assert (played(jitter) == 6).all()
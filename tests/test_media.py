@@ -0,0 +1,78 @@
+import time
+import wave
+
+import numpy as np
+import pytest
+
+import media
+from media import NullAudioSink, NullDisplay, Pacer, SyntheticAudio, SyntheticVideo, WavAudio
+
+
+def write_wav(path, samples, rate=8000, channels=1, width=2):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+
+
+def test_pacer_keeps_real_time():
+    pacer = Pacer(0.01)
+    start = time.monotonic()
+    for _ in range(6):
+        pacer.wait()
+    assert 0.045 <= time.monotonic() - start < 0.2
+
+
+def test_synthetic_video_frames_differ():
+    video = SyntheticVideo(64, 48, fps=1000)
+    ok, first = video.read()
+    ok2, second = video.read()
+    assert ok and ok2
+    assert first.shape == (48, 64, 3) and first.dtype == np.uint8
+    assert not np.array_equal(first, second)
+
+
+def test_synthetic_audio_is_continuous_across_reads():
+    audio = SyntheticAudio(rate=8000, channels=2, frequency=440.0)
+    joined = np.frombuffer(audio.read(80) + audio.read(80), dtype=np.int16)[::2]
+    whole = SyntheticAudio(rate=8000, frequency=440.0).samples(160)
+    np.testing.assert_array_equal(joined, whole)
+
+
+def test_wav_audio_loops_over_the_first_channel(tmp_path):
+    stereo = np.array([[1, -1], [2, -2], [3, -3]], dtype=np.int16)
+    write_wav(tmp_path / "a.wav", stereo, channels=2)
+    audio = WavAudio(str(tmp_path / "a.wav"), rate=8000)
+    assert audio.samples(5).tolist() == [1, 2, 3, 1, 2]
+
+
+def test_wav_audio_rejects_a_mismatched_rate(tmp_path):
+    write_wav(tmp_path / "a.wav", np.zeros(10, dtype=np.int16), rate=16000)
+    with pytest.raises(ValueError):
+        WavAudio(str(tmp_path / "a.wav"), rate=8000)
+
+
+def test_null_sink_and_display_count_what_they_get():
+    sink = NullAudioSink(rate=8000, channels=2)
+    sink.write(bytes(2 * 2 * 40))
+    assert sink.written == 40
+    display = NullDisplay()
+    display.show("remote", None)
+    display.show("remote", None)
+    assert display.frames == {"remote": 2}
+    assert display.poll() == -1
+
+
+def test_open_backends_from_specs():
+    assert isinstance(media.open_video("synthetic"), SyntheticVideo)
+    assert media.open_audio_source("tone:1000", rate=8000).frequency == 1000.0
+    assert media.open_audio_source("noise").noise > 0
+    assert isinstance(media.open_audio_sink("null"), NullAudioSink)
+    assert isinstance(media.open_display("null"), NullDisplay)
+    with pytest.raises(ValueError):
+        media.open_audio_source("bogus")
+    with pytest.raises(ValueError):
+        media.open_audio_sink("bogus")
+    with pytest.raises(ValueError):
+        media.open_display("bogus")
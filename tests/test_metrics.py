@@ -0,0 +1,80 @@
+import json
+import re
+import urllib.request
+
+import pytest
+
+import metrics
+from metrics import NULL_METRIC, Registry, Tracer
+
+# name{label="value",...} value, as in the Prometheus text exposition format
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="[^"]*",?)*\})? -?(\d+(\.\d+)?(e-?\d+)?|\+Inf|NaN)$')
+
+
+@pytest.fixture
+def registry():
+    registry = Registry(enabled=True)
+    sent = registry.counter("frames_sent_total", "Frames sent", stream="1")
+    sent.inc(3)
+    registry.gauge("queue_depth", "Items waiting", fn=lambda: 2, queue="video")
+    latency = registry.histogram("stage_seconds", "Stage time", buckets=(0.01, 0.1), stage="encode")
+    for value in (0.005, 0.05, 0.5):
+        latency.observe(value)
+    return registry
+
+
+def test_disabled_registry_hands_out_the_null_metric():
+    registry = Registry()
+    assert registry.counter("a_total") is NULL_METRIC
+    assert registry.histogram("b_seconds") is NULL_METRIC
+    assert registry.render() == "\n"
+
+
+def test_render_is_prometheus_text(registry):
+    lines = registry.render().splitlines()
+    for line in lines:
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or SAMPLE.match(line), line
+    assert "# TYPE frames_sent_total counter" in lines
+    assert 'frames_sent_total{stream="1"} 3' in lines
+    assert "# TYPE queue_depth gauge" in lines
+    assert 'queue_depth{queue="video"} 2' in lines
+    assert "# TYPE stage_seconds histogram" in lines
+    assert 'stage_seconds_bucket{stage="encode",le="0.01"} 1' in lines
+    assert 'stage_seconds_bucket{stage="encode",le="0.1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="encode",le="+Inf"} 3' in lines
+    assert 'stage_seconds_count{stage="encode"} 3' in lines
+    # HELP and TYPE once per metric name, before its samples
+    assert lines.count("# TYPE frames_sent_total counter") == 1
+    assert lines.index("# TYPE stage_seconds histogram") < lines.index('stage_seconds_count{stage="encode"} 3')
+
+
+def test_snapshot_and_remove(registry):
+    snapshot = registry.snapshot()
+    assert snapshot['frames_sent_total{stream="1"}'] == 3
+    assert snapshot['stage_seconds{stage="encode"}']["count"] == 3
+    registry.remove("queue_depth", queue="video")
+    assert 'queue_depth{queue="video"}' not in registry.snapshot()
+
+
+def test_tracer_samples_by_frame_number():
+    tracer = Tracer(sample_every=4, capacity=2)
+    assert [key for key in range(9) if tracer.sampled(key)] == [0, 4, 8]
+    for key in (0, 4, 8):
+        tracer.record("encode", key, 1.0, 1.002)
+    assert [span["frame"] for span in tracer.recent()] == [4, 8]
+
+
+def test_serve_exposes_metrics_over_http(monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", Registry())
+    server = metrics.serve(0)
+    try:
+        metrics.counter("served_total", "Test counter").inc()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "served_total 1" in response.read().decode().splitlines()
+        with urllib.request.urlopen(f"{base}/metrics.json") as response:
+            assert json.load(response) == {"served_total": 1}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,72 @@
+import numpy as np
+
+from mixer import AudioMixer
+
+RATE, TICK = 1000, 0.01  # 10 samples a tick
+
+
+def pcm(value, ticks=2):
+    return np.full(ticks * 10, value, dtype=np.int16).tobytes()
+
+
+def mixer(**kwargs):
+    return AudioMixer(RATE, tick=TICK, **kwargs)
+
+
+def values(mixes):
+    return {r: set(np.frombuffer(m, dtype=np.int16).tolist()) for r, m in mixes.items()}
+
+
+def test_everyone_hears_everyone_but_themselves():
+    m = mixer()
+    for sender, value in ((1, 100), (2, 20), (3, 3)):
+        m.push(sender, pcm(value))
+    assert values(m.mix([1, 2, 3, 4])) == {1: {23}, 2: {103}, 3: {120}, 4: {123}}
+
+
+def test_a_lone_sender_gets_no_mix():
+    m = mixer()
+    m.push(1, pcm(100))
+    assert values(m.mix([1, 2])) == {2: {100}}
+
+
+def test_nothing_to_mix_before_the_prebuffer():
+    m = mixer(prebuffer=2)
+    m.push(1, pcm(100, ticks=1))
+    assert m.mix([1, 2]) == {}
+    m.push(1, pcm(100, ticks=1))
+    assert values(m.mix([2])) == {2: {100}}
+
+
+def test_mixes_clip_instead_of_wrapping():
+    m = mixer()
+    m.push(1, pcm(30000))
+    m.push(2, pcm(30000))
+    assert values(m.mix([3])) == {3: {32767}}
+
+
+def test_underrun_pads_and_waits_for_the_prebuffer_again():
+    m = mixer(prebuffer=2)
+    m.push(1, pcm(100, ticks=2))
+    m.push(1, np.full(5, 100, dtype=np.int16).tobytes())
+    m.mix([2])
+    m.mix([2])
+    last = np.frombuffer(m.mix([2])[2], dtype=np.int16)
+    assert last[:5].tolist() == [100] * 5 and not last[5:].any()
+    assert m.stats()["underruns"] == 1
+    assert m.mix([2]) == {}
+
+
+def test_queue_is_bounded():
+    m = mixer(max_buffer=3)
+    m.push(1, pcm(100, ticks=5))
+    assert len(m.queues[1]) == 30
+    assert m.stats()["dropped"] == 20
+
+
+def test_removed_senders_leave_the_mix():
+    m = mixer()
+    m.push(1, pcm(100))
+    m.push(2, pcm(20))
+    m.remove(1)
+    assert values(m.mix([3])) == {3: {20}}
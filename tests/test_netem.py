@@ -0,0 +1,74 @@
+import asyncio
+
+from netem import ImpairmentProxy, ProxyLog, phase
+
+
+class Echo(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+
+class Client(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.received.put_nowait(data)
+
+
+async def start_proxy(target_port, **kwargs):
+    proxy = ImpairmentProxy("127.0.0.1", 0, "127.0.0.1", target_port, [phase()], log=ProxyLog(), **kwargs)
+    await proxy.start()
+    return proxy
+
+
+def test_idle_udp_sessions_are_closed():
+    async def run():
+        loop = asyncio.get_running_loop()
+        echo, _ = await loop.create_datagram_endpoint(Echo, local_addr=("127.0.0.1", 0))
+        proxy = await start_proxy(echo.get_extra_info("sockname")[1], udp_idle=0.2, interval=0.05)
+        client, protocol = await loop.create_datagram_endpoint(Client, remote_addr=("127.0.0.1", proxy.port))
+        try:
+            client.sendto(b"ping")
+            assert await asyncio.wait_for(protocol.received.get(), 2.0) == b"ping"
+            assert len(proxy.udp.sessions) == 1
+            await asyncio.sleep(0.5)
+            assert proxy.udp.sessions == {} and proxy.links == {}
+            # the next datagram opens a new session
+            client.sendto(b"again")
+            assert await asyncio.wait_for(protocol.received.get(), 2.0) == b"again"
+            assert len(proxy.udp.sessions) == 1
+        finally:
+            client.close()
+            proxy.close()
+            echo.close()
+
+    asyncio.run(run())
+
+
+def test_tcp_stops_reading_while_the_receiver_does_not():
+    async def run():
+        stalled = asyncio.Event()
+
+        async def never_read(reader, writer):
+            await stalled.wait()
+            writer.close()
+
+        server = await asyncio.start_server(never_read, "127.0.0.1", 0)
+        proxy = await start_proxy(server.sockets[0].getsockname()[1])
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+        try:
+            # far more than the socket buffers hold: the proxy must not buffer it instead
+            writer.write(bytes(64 << 20))
+            await asyncio.sleep(1.0)
+            assert writer.transport.get_write_buffer_size() > 32 << 20
+        finally:
+            writer.transport.abort()
+            stalled.set()
+            proxy.close()
+            server.close()
+
+    asyncio.run(run())
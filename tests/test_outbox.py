@@ -0,0 +1,81 @@
+import asyncio
+import socket
+
+import pytest
+
+from outbox import Outbox
+from protocol import AUDIO, HEADER, VIDEO, pack_header
+
+
+@pytest.fixture
+def outbox():
+    a, b = socket.socketpair()
+    box = Outbox(a, max_video=2, max_priority=3)
+    yield box
+    box.sock.close()
+    a.close()
+    b.close()
+
+
+def message(msg_type, stream, seq, size=10):
+    return pack_header(msg_type, size, stream, seq), bytes(size)
+
+
+def sent(parts):
+    # (type, stream, seq) of the headers among the parts fill() returned
+    headers = [HEADER.unpack(bytes(p)) for p in parts if len(p) == HEADER.size]
+    return [(h[1], h[2], h[3]) for h in headers]
+
+
+def test_video_keeps_the_newest_frames(outbox):
+    for seq in range(5):
+        outbox.put(*message(VIDEO, 1, seq), video=True)
+    assert [HEADER.unpack(h)[3] for h, _, _ in outbox.video] == [3, 4]
+    assert outbox.dropped == {"video": 3, "audio": 0}
+    assert outbox.queued_bytes == 2 * (HEADER.size + 10)
+
+
+def test_priority_lane_is_bounded(outbox):
+    for seq in range(4):
+        outbox.put(*message(AUDIO, 1, seq))
+    assert [HEADER.unpack(h)[3] for h, _, _ in outbox.priority] == [1, 2, 3]
+    assert outbox.dropped == {"video": 0, "audio": 1}
+
+
+def test_fill_sends_priority_first_and_one_frame_at_most(outbox):
+    outbox.put(*message(VIDEO, 1, 0), video=True)
+    outbox.put(*message(VIDEO, 1, 1), video=True)
+    outbox.put(*message(AUDIO, 2, 0))
+    outbox.put(*message(AUDIO, 2, 1))
+    assert sent(outbox.fill()) == [(AUDIO, 2, 0), (AUDIO, 2, 1), (VIDEO, 1, 0)]
+    assert sent(outbox.fill()) == [(VIDEO, 1, 1)]
+    assert outbox.fill() == []
+
+
+def test_discard_video_of_one_sender(outbox):
+    outbox.put(*message(VIDEO, 1, 0), video=True)
+    outbox.put(*message(VIDEO, 2, 0), video=True)
+    outbox.discard_video(1)
+    assert [HEADER.unpack(h)[2] for h, _, _ in outbox.video] == [2]
+    assert outbox.queued_bytes == HEADER.size + 10
+    assert outbox.dropped["video"] == 0
+
+
+def test_nothing_is_queued_once_closed(outbox):
+    outbox.closed = True
+    outbox.put(*message(AUDIO, 1, 0))
+    assert not outbox.priority and outbox.queued_bytes == 0
+
+
+def test_closing_before_the_writer_ran_closes_the_connection():
+    async def run():
+        a, b = socket.socketpair()
+        box = Outbox(a).start()
+        box.close()  # the writer task has not had a turn yet
+        a.close()
+        b.settimeout(1.0)
+        assert b.recv(1) == b""  # no descriptor of a is left open
+        await asyncio.sleep(0)
+        b.close()
+
+    asyncio.run(run())
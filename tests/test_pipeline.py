@@ -0,0 +1,72 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from pipeline import FifoQueue, LatestQueue, Pipeline
+
+
+def test_latest_queue_keeps_the_newest_item():
+    q = LatestQueue()
+    for item in range(3):
+        q.put(item)
+    assert q.qsize() == 1
+    assert q.get(timeout=0) == 2
+    assert q.dropped == 2
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.01)
+
+
+def test_latest_queue_wakes_a_waiting_consumer():
+    q = LatestQueue()
+    got = []
+    consumer = threading.Thread(target=lambda: got.append(q.get(timeout=1.0)))
+    consumer.start()
+    q.put("frame")
+    consumer.join(1.0)
+    assert got == ["frame"]
+    assert q.dropped == 0
+
+
+def test_fifo_queue_blocks_producers_while_full():
+    q = FifoQueue(2)
+    q.put(1)
+    q.put(2)
+    with pytest.raises(queue.Full):
+        q.put(3, timeout=0.01)
+    assert q.get() == 1
+    q.put(3, timeout=0.01)
+    assert [q.get(), q.get()] == [2, 3]
+    assert q.dropped == 0
+
+
+def test_stages_pass_items_in_order_and_count_errors():
+    pipeline = Pipeline()
+    items = iter(range(6))
+    inbox = pipeline.queue("inbox", maxsize=2)
+    outbox = pipeline.queue("outbox")
+
+    def produce():
+        item = next(items, None)
+        if item is None:
+            time.sleep(0.01)
+        return item
+
+    def work(item):
+        if item == 3:
+            raise ValueError("bad frame")
+        return item * 10
+
+    pipeline.add("produce", produce, outbox=inbox)
+    pipeline.add("work", work, inbox=inbox, outbox=outbox)
+    pipeline.start()
+    try:
+        results = [outbox.get(timeout=1.0) for _ in range(5)]
+    finally:
+        pipeline.stop()
+    assert results == [0, 10, 20, 40, 50]
+    stats = pipeline.stats()
+    assert stats["work"]["processed"] == 5
+    assert stats["work"]["errors"] == 1
+    assert stats["outbox"] == {"depth": 0, "dropped": 0}
@@ -0,0 +1,91 @@
+import asyncio
+import socket
+
+import pytest
+
+from framing import FrameReader
+from protocol import (
+    ACK,
+    HEADER_SIZE,
+    JOIN,
+    MAX_PAYLOAD,
+    SESSION_TOKEN_SIZE,
+    VIDEO,
+    Header,
+    MessageWriter,
+    ProtocolError,
+    pack_ack,
+    pack_header,
+    pack_join,
+    read_message,
+    read_message_async,
+    restamp,
+    unpack_ack,
+    unpack_header,
+    unpack_join,
+)
+
+
+def test_header_round_trip():
+    data = pack_header(VIDEO, 1234, stream=7, seq=42, timestamp=1_700_000_000_123_456)
+    assert len(data) == HEADER_SIZE
+    assert unpack_header(data) == Header(1, VIDEO, 7, 42, 1_700_000_000_123_456, 1234)
+
+
+def test_header_limits():
+    # u16 stream and u32 seq (which wraps) at their maxima
+    header = unpack_header(pack_header(VIDEO, 0, stream=0xFFFF, seq=2**32 + 5, timestamp=0))
+    assert (header.stream, header.seq) == (0xFFFF, 5)
+
+
+def test_bad_version_and_oversized_payload():
+    data = bytearray(pack_header(VIDEO, 10))
+    data[0] = 2
+    with pytest.raises(ProtocolError):
+        unpack_header(bytes(data))
+    with pytest.raises(ProtocolError):
+        unpack_header(pack_header(VIDEO, MAX_PAYLOAD + 1))
+
+
+def test_restamp_changes_only_the_stream():
+    header = unpack_header(pack_header(VIDEO, 99, stream=1, seq=3, timestamp=77))
+    assert unpack_header(restamp(header, 9)) == header._replace(stream=9)
+
+
+def test_join_round_trip():
+    assert unpack_join(pack_join("room")) == ("room", None)
+    token = bytes(range(SESSION_TOKEN_SIZE))
+    assert unpack_join(pack_join("räum", token)) == ("räum", token)
+
+
+def test_ack_round_trip():
+    header = unpack_header(pack_header(VIDEO, 0, stream=4, seq=11, timestamp=123))
+    assert unpack_ack(pack_ack(header)) == (11, 123)
+
+
+def test_writer_counts_seq_per_type_and_stream():
+    a, b = socket.socketpair()
+    with a, b:
+        writer = MessageWriter(a, stream=5)
+        writer.send(VIDEO, b"one")
+        writer.send(VIDEO, b"two")
+        writer.send(ACK, b"", stream=3)
+        writer.send(VIDEO, b"layer", seq=1)  # an explicit seq is reused, not counted
+        reader = FrameReader(b)
+        got = []
+        for _ in range(4):
+            h, p = read_message(reader)
+            got.append((h.type, h.stream, h.seq, bytes(p)))  # the payload view is reused
+    assert got == [(VIDEO, 5, 0, b"one"), (VIDEO, 5, 1, b"two"), (ACK, 3, 0, b""), (VIDEO, 5, 1, b"layer")]
+
+
+def test_read_message_async():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(pack_header(JOIN, 4, stream=2) + b"room")
+        reader.feed_eof()
+        return await read_message_async(reader)
+
+    header, raw, payload = asyncio.run(run())
+    assert (header.type, header.stream, payload) == (JOIN, 2, b"room")
+    assert raw == pack_header(JOIN, 4, stream=2, timestamp=header.timestamp)
@@ -0,0 +1,60 @@
+import pytest
+
+from protocol import AUDIO, pack_header
+from recording import Player, Recorder
+
+# Arrival times (us) of the recorded messages; with one-second segments they
+# fall into three segments: [1.0, 1.5], [2.0, 2.5, 2.9], [3.2]
+TIMES = [1_000_000, 1_500_000, 2_000_000, 2_500_000, 2_900_000, 3_200_000]
+
+
+@pytest.fixture
+def player(tmp_path):
+    recorder = Recorder(str(tmp_path), segment_seconds=1)
+    recorder.write_batch([(t, pack_header(AUDIO, 2, 1, seq, t), b"%02d" % seq) for seq, t in enumerate(TIMES)])
+    recorder.close()
+    return Player(str(tmp_path))
+
+
+def test_segments_and_span(player):
+    assert len(player.segments) == 3
+    assert len(player) == len(TIMES)
+    assert (player.start_time, player.end_time) == (TIMES[0], TIMES[-1])
+
+
+@pytest.mark.parametrize(
+    "timestamp, position",
+    [
+        (0, (0, 0)),  # before the start
+        (1_000_000, (0, 0)),  # exactly the first message
+        (1_500_000, (0, 1)),  # exactly a message
+        (1_500_001, (1, 0)),  # past the end of the first segment, continues in the next
+        (2_000_000, (1, 0)),  # exactly a segment start
+        (2_900_000, (1, 2)),  # last message of a segment
+        (3_000_000, (2, 0)),  # between segments
+        (3_200_000, (2, 0)),  # the last message
+        (3_200_001, (3, 0)),  # past the end
+    ],
+)
+def test_seek_finds_the_first_message_at_or_after(player, timestamp, position):
+    assert player.seek(timestamp) == position
+
+
+def test_messages_read_across_segments(player):
+    messages = list(player.messages(1_500_000, 3_000_000))
+    assert [t for t, _, _ in messages] == TIMES[1:5]
+    assert [header.seq for _, header, _ in messages] == [1, 2, 3, 4]
+    assert bytes(messages[-1][2]) == b"04"
+
+
+def test_messages_past_the_end_are_empty(player):
+    assert list(player.messages(TIMES[-1] + 1)) == []
+
+
+def test_empty_recording(tmp_path):
+    Recorder(str(tmp_path)).close()
+    player = Player(str(tmp_path))
+    assert len(player) == 0
+    assert player.start_time is None and player.end_time is None
+    assert player.seek(0) == (0, 0)
+    assert list(player.messages(0)) == []
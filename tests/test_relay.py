@@ -0,0 +1,141 @@
+import asyncio
+import struct
+
+import pytest
+
+from protocol import AUDIO_CODED, JOIN, LEAVE, VIDEO, pack_header, pack_join, read_message_async
+from server_tw import Relay
+
+# ADPCM header with step index 200, which audioop rejects with "bad state"
+BAD_ADPCM = struct.pack("!BBHH", 2, 1, 44100, 1024) + struct.pack("!hBB", 0, 200, 0) + bytes(10)
+
+
+async def join(relay, room="room", token=None):
+    # (reader, writer, participant id, session token)
+    reader, writer = await asyncio.open_connection(relay.ip, relay.port)
+    payload = pack_join(room, token)
+    writer.write(pack_header(JOIN, len(payload)) + payload)
+    header, _, answer = await read_message_async(reader)
+    assert header.type == JOIN
+    return reader, writer, header.stream, answer
+
+
+async def leave(relay, *writers):
+    # Leaves for good, so nothing waits out the resume timeout
+    for writer in writers:
+        writer.write(pack_header(LEAVE, 0))
+        writer.close()
+    await until(lambda: not relay.sessions)
+
+
+async def closed(reader):
+    # Reads until the relay hangs up
+    with pytest.raises(asyncio.IncompleteReadError):
+        while True:
+            await asyncio.wait_for(read_message_async(reader), 2.0)
+
+
+async def until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    assert condition()
+
+
+def with_relay(test, **options):
+    async def run():
+        relay = Relay("127.0.0.1", 0, mix=False, **options)
+        await relay.start()
+        try:
+            await test(relay)
+        finally:
+            relay.close()
+
+    asyncio.run(run())
+
+
+def test_malformed_adpcm_state_disconnects_the_sender():
+    async def run():
+        relay = Relay("127.0.0.1", 0, mix=True, resume_timeout=5.0)
+        await relay.start()
+        try:
+            reader, writer, _, _ = await join(relay)
+            writer.write(pack_header(AUDIO_CODED, len(BAD_ADPCM)) + BAD_ADPCM)
+            # the relay closes the connection (skipping the comfort noise a lone member gets)
+            # instead of the handler dying
+            await closed(reader)
+            writer.close()
+            # dropped for good, not suspended for resume
+            await until(lambda: not relay.sessions)
+        finally:
+            relay.close()
+
+    asyncio.run(run())
+
+
+def test_resume_keeps_the_participant_in_its_room():
+    async def test(relay):
+        a_reader, a_writer, a_id, token = await join(relay)
+        b_reader, b_writer, _, _ = await join(relay)
+        a_writer.transport.abort()  # dropped without LEAVE
+        await until(lambda: len(relay.rooms["room"]) == 1)
+        assert token in relay.sessions  # suspended, not gone
+        a_reader, a_writer, resumed_id, resumed_token = await join(relay, token=token)
+        assert (resumed_id, resumed_token) == (a_id, token)
+        assert len(relay.rooms["room"]) == 2
+        # b never hears that a left, its next message is a's video
+        a_writer.write(pack_header(VIDEO, 3) + b"jpg")
+        header, _, payload = await asyncio.wait_for(read_message_async(b_reader), 2.0)
+        assert (header.type, header.stream, payload) == (VIDEO, a_id, b"jpg")
+        await leave(relay, a_writer, b_writer)
+
+    with_relay(test, resume_timeout=5.0)
+
+
+def test_resume_replaces_a_connection_that_is_still_open():
+    async def test(relay):
+        old_reader, old_writer, id, token = await join(relay)
+        reader, writer, resumed_id, _ = await join(relay, token=token)
+        assert resumed_id == id
+        await closed(old_reader)
+        assert [p.id for p in relay.rooms["room"]] == [id]
+        # the old connection closing does not suspend or remove the resumed participant
+        old_writer.close()
+        await asyncio.sleep(0.1)
+        assert token in relay.sessions
+        assert len(relay.rooms["room"]) == 1
+        await leave(relay, writer)
+
+    with_relay(test, resume_timeout=5.0)
+
+
+def test_expired_tokens_join_as_someone_new():
+    async def test(relay):
+        _, a_writer, a_id, token = await join(relay)
+        b_reader, b_writer, _, _ = await join(relay)
+        a_writer.transport.abort()
+        header, _, _ = await asyncio.wait_for(read_message_async(b_reader), 2.0)
+        assert (header.type, header.stream) == (LEAVE, a_id)  # once the resume timeout passed
+        assert token not in relay.sessions
+        _, writer, id, new_token = await join(relay, token=token)
+        assert id != a_id and new_token != token
+        await leave(relay, writer, b_writer)
+
+    with_relay(test, resume_timeout=0.2)
+
+
+def test_a_token_does_not_resume_into_another_room():
+    async def test(relay):
+        _, a_writer, _, token = await join(relay, "a")
+        a_writer.transport.abort()
+        await until(lambda: not relay.rooms["a"])
+        reader, writer = await asyncio.open_connection(relay.ip, relay.port)
+        payload = pack_join("b", token)
+        writer.write(pack_header(JOIN, len(payload)) + payload)
+        await closed(reader)
+        assert "b" not in relay.rooms
+        assert token in relay.sessions  # still resumable into its own room
+        writer.close()
+
+    with_relay(test, resume_timeout=5.0)
@@ -0,0 +1,83 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from media import NullDisplay
+from delta import TILE_HEADER
+from protocol import TILES, VIDEO, Header
+from render import GridRenderer
+
+TILE = (64, 48)
+
+
+@pytest.fixture
+def renderer():
+    decoded = threading.Semaphore(0)
+    grid = GridRenderer(NullDisplay(), tile_size=TILE, max_fps=1000, on_decoded=lambda header: decoded.release())
+    grid.decoded_event = decoded
+    yield grid
+    grid.close()
+
+
+def submit(grid, stream, colour, seq=0):
+    frame = np.full((96, 128, 3), colour, dtype=np.uint8)
+    payload = cv2.imencode(".jpg", frame)[1].tobytes()
+    grid.submit(Header(1, VIDEO, stream, seq, 0, len(payload)), payload)
+    assert grid.decoded_event.acquire(timeout=5)
+
+
+def test_streams_are_laid_out_in_a_near_square_grid(renderer):
+    assert renderer.canvas.shape == (48, 64, 3)
+    for stream in (1, 2, 3):
+        submit(renderer, stream, 200)
+    assert renderer.streams == [1, 2, 3]
+    assert renderer.canvas.shape == (96, 128, 3)
+    assert renderer.render(now=1.0)
+    assert renderer.display.frames == {"Room": 1}
+
+
+def test_decoded_frames_land_in_their_tile(renderer):
+    submit(renderer, 1, 0)
+    submit(renderer, 2, 220)  # a new stream clears the canvas for the new grid
+    submit(renderer, 1, 40, seq=1)
+    # the labels are drawn top left, the bottom right corner is plain picture
+    assert abs(int(renderer.tile(1)[-4, -4, 0]) - 40) < 8
+    assert abs(int(renderer.tile(2)[-4, -4, 0]) - 220) < 8
+
+
+def test_removed_streams_give_their_tile_back(renderer):
+    for stream in (1, 2):
+        submit(renderer, stream, 100)
+    renderer.remove(1)
+    assert renderer.streams == [2]
+    assert renderer.canvas.shape == (48, 64, 3)
+    assert 1 not in renderer.decoders
+    renderer.remove(7)
+    assert renderer.streams == [2]
+
+
+def test_render_is_rate_limited_and_only_on_change(renderer):
+    submit(renderer, 1, 100)
+    assert renderer.render(now=1.0)
+    assert not renderer.render(now=2.0)  # nothing new
+    submit(renderer, 1, 120, seq=1)
+    assert not renderer.render(now=1.0005)
+    assert renderer.render(now=2.0)
+
+
+def test_malformed_frames_are_skipped_and_decoding_goes_on(renderer):
+    # a keyframe whose mosaic is smaller than one tile, and a payload cut short
+    jpeg = cv2.imencode(".jpg", np.zeros((8, 8, 3), dtype=np.uint8))[1].tobytes()
+    broken = TILE_HEADER.pack(128, 96, 32, 1, 12) + np.arange(12, dtype=">u2").tobytes() + jpeg
+    for seq, payload in enumerate([broken, broken[:3]]):
+        renderer.submit(Header(1, TILES, 1, seq, 0, len(payload)), payload)
+        for _ in range(500):
+            if renderer.errors > seq:
+                break
+            threading.Event().wait(0.01)
+    assert renderer.errors == 2
+    assert all(t.is_alive() for t in renderer.threads)
+    submit(renderer, 1, 90, seq=2)
+    assert renderer.decoded == 1
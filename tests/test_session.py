@@ -0,0 +1,96 @@
+import socket
+import threading
+
+import pytest
+
+from framing import FrameReader
+from protocol import AUDIO, JOIN, LEAVE, pack_header, read_message, send_parts, unpack_join
+from session import RelaySession
+
+TOKEN = b"0123456789abcdef"
+
+
+class FakeRelay:
+    # Answers every JOIN with participant 5 and TOKEN, records the joins, and
+    # hands each connection to `serve(sock, reader)`
+    def __init__(self, serve):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.address = self.listener.getsockname()
+        self.serve = serve
+        self.joins = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            with sock:
+                reader = FrameReader(sock)
+                _, payload = read_message(reader)
+                self.joins.append(unpack_join(payload))
+                send_parts(sock, [pack_header(JOIN, len(TOKEN), 5), TOKEN])
+                self.serve(sock, reader)
+
+    def close(self):
+        self.listener.close()
+
+
+@pytest.fixture
+def relay(request):
+    relay = FakeRelay(request.param)
+    yield relay
+    relay.close()
+
+
+def send_audio_then_drop(sock, reader):
+    send_parts(sock, [pack_header(AUDIO, 2, 1, 7), b"ab"])
+
+
+def send_audio_then_wait_for_leave(sock, reader):
+    send_parts(sock, [pack_header(AUDIO, 2, 1, 8), b"cd"])
+    header, _ = read_message(reader)
+    assert header.type == LEAVE
+
+
+@pytest.mark.parametrize("relay", [send_audio_then_drop], indirect=True)
+def test_resumes_with_the_token_after_a_drop(relay):
+    session = RelaySession(relay.address, "room", timeout=2.0, resume_for=2.0)
+    session.connect()
+    assert (session.id, session.token) == (5, TOKEN)
+    header, payload = session.read()
+    assert (header.seq, bytes(payload)) == (7, b"ab")
+    header, _ = session.read()  # the relay hung up; read() resumed and carries on
+    assert header.seq == 7
+    assert relay.joins[:2] == [("room", None), ("room", TOKEN)]
+    assert session.resumes == 1
+    session.close()
+
+
+@pytest.mark.parametrize("relay", [send_audio_then_wait_for_leave], indirect=True)
+def test_close_leaves_and_ends_reads(relay):
+    session = RelaySession(relay.address, "room", timeout=2.0)
+    session.connect()
+    assert session.read()[0].seq == 8
+    session.close()
+    assert session.read() is None
+    assert session.writer.sock is None
+
+
+def test_gives_up_when_the_relay_is_gone():
+    gone = threading.Event()
+    relay = FakeRelay(lambda sock, reader: gone.wait())
+    session = RelaySession(relay.address, "room", timeout=0.5, resume_for=0.3)
+    session.connect()
+    relay.close()
+    gone.set()
+    with pytest.raises(ConnectionError):
+        session.read()
+
+
+def test_writes_while_disconnected_are_dropped():
+    session = RelaySession(("127.0.0.1", 9), "room")
+    session.writer.write([pack_header(AUDIO, 0)])
+    assert session.writer.dropped == 1
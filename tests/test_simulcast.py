@@ -0,0 +1,61 @@
+from protocol import AUDIO, TILES, VIDEO
+from simulcast import LayerSelector, is_layer, pack_layer, unpack_layer
+
+
+def test_layer_header_round_trip():
+    payload = pack_layer(2, TILES, keyframe=False) + b"frame"
+    layer, msg_type, keyframe, offset = unpack_layer(payload)
+    assert (layer, msg_type, keyframe, payload[offset:]) == (2, TILES, False, b"frame")
+
+
+def test_is_layer_rejects_what_the_relay_cannot_forward():
+    assert is_layer(pack_layer(0, VIDEO))
+    assert not is_layer(pack_layer(0, VIDEO)[:2])
+    assert not is_layer(pack_layer(3, VIDEO))
+    assert not is_layer(pack_layer(0, AUDIO))
+
+
+def test_starts_on_the_lowest_layer_and_switches_on_keyframes():
+    selector = LayerSelector()
+    rates = [4000.0, 1000.0, 250.0]
+    assert not selector.admit(1, 0, True, 0, 100, rates, 0, now=0.0)
+    assert selector.admit(1, 2, True, 0, 100, rates, 0, now=0.0)
+    selector.budget = 10000.0
+    assert not selector.admit(1, 0, False, 1, 100, rates, 0, now=0.1)
+    assert selector.admit(1, 2, False, 1, 100, rates, 0, now=0.1)
+    assert selector.admit(1, 0, True, 2, 100, rates, 0, now=0.2)
+    assert selector.current == {1: 0}
+    assert selector.switches == {"up": 1, "down": 0}
+
+
+def step(selector, now, srtt, delivered=10000):
+    selector.srtt = srtt
+    selector.delivered = delivered
+    selector.update(now)
+
+
+def test_hold_grows_after_failed_raises_and_decays_again():
+    selector = LayerSelector(target_latency=0.2, interval=0.25, probe_interval=0.5)
+    selector.update(0.0)
+    step(selector, 0.5, 0.05)
+    assert selector.raised == 0.5
+    step(selector, 0.75, 0.5)  # congested right after the raise
+    assert selector.hold == 1.0
+    step(selector, 1.75, 0.05)
+    step(selector, 2.0, 0.5)
+    assert selector.hold == 2.0
+    # raises that hold until the next probe halve it back to probe_interval
+    step(selector, 4.0, 0.05)
+    step(selector, 6.0, 0.05)
+    assert selector.hold == 1.0
+    step(selector, 7.0, 0.05)
+    assert selector.hold == 0.5
+
+
+def test_congestion_cuts_the_budget_to_the_throughput():
+    selector = LayerSelector(interval=0.25)
+    selector.update(0.0)
+    step(selector, 0.5, 0.05, delivered=5000)
+    assert selector.budget > 10000
+    step(selector, 1.0, 0.5, delivered=5000)
+    assert selector.budget <= 10000 * 0.85
@@ -0,0 +1,112 @@
+import socket
+import threading
+
+import pytest
+
+from protocol import AUDIO, VIDEO
+from udp_transport import KEYFRAME, PACKET, Reassembler, UdpTransport
+
+
+def add(reassembler, seq, index, count, msg_type=VIDEO, flags=0, now=0.0):
+    reassembler.add(msg_type, flags, 1, index, count, seq, 1000 + seq, b"%d/%d" % (seq, index), now)
+
+
+def test_reassembles_fragments_in_any_order():
+    r = Reassembler()
+    for index in (2, 0, 1):
+        add(r, 4, index, 3)
+    header, payload = r.ready.popleft()
+    assert (header.type, header.stream, header.seq, header.timestamp) == (VIDEO, 1, 4, 1004)
+    assert payload == b"4/04/14/2"
+    assert header.length == len(payload)
+
+
+def test_a_newer_video_frame_drops_older_partials_and_late_fragments():
+    r = Reassembler()
+    add(r, 1, 0, 2)
+    add(r, 2, 0, 1)
+    assert [h.seq for h, _ in r.ready] == [2]
+    assert r.dropped == 1
+    add(r, 1, 1, 2)
+    assert r.late == 1 and len(r.ready) == 1
+
+
+def test_audio_completes_out_of_order_within_the_window():
+    r = Reassembler(window=4)
+    add(r, 10, 0, 1, AUDIO)
+    add(r, 8, 0, 1, AUDIO)
+    add(r, 5, 0, 1, AUDIO)  # older than the window
+    assert [h.seq for h, _ in r.ready] == [10, 8]
+    assert r.late == 1
+
+
+def test_full_window_drops_the_oldest_partial():
+    r = Reassembler(window=8)
+    for seq in range(10, 18):
+        add(r, seq, 0, 2)
+    add(r, 18, 0, 2)
+    assert sorted(r.partials[(VIDEO, 1)]) == list(range(11, 19))
+    # older than every kept partial: dropped instead of evicting itself later
+    add(r, 5, 0, 1)
+    assert not r.ready
+    assert r.dropped == 2
+    add(r, 11, 1, 2)
+    assert [h.seq for h, _ in r.ready] == [11]
+
+
+def test_nacks_stalled_keyframes_only():
+    r = Reassembler(nack_delay=0.03, max_nacks=2)
+    add(r, 1, 0, 3, flags=KEYFRAME)
+    add(r, 2, 0, 3)
+    assert list(r.nacks(0.01)) == []
+    assert list(r.nacks(0.04)) == [(VIDEO, 1, 1, [1, 2])]
+    assert list(r.nacks(0.05)) == []  # backs off
+    assert list(r.nacks(0.07)) == [(VIDEO, 1, 1, [1, 2])]
+    assert list(r.nacks(1.0)) == []  # gave up
+
+
+@pytest.fixture
+def pair():
+    a, b = (socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(2))
+    for s in (a, b):
+        s.bind(("127.0.0.1", 0))
+    sender = UdpTransport(a, b.getsockname(), timeout=0.5, mtu=100)
+    receiver = UdpTransport(b, a.getsockname(), timeout=0.5, mtu=100)
+    yield sender, receiver
+    a.close()
+    b.close()
+
+
+def test_lost_keyframe_fragment_is_resent_on_nack(pair):
+    sender, receiver = pair
+    send = sender.sendto
+    lost = []
+
+    def lose_second_fragment(packet):
+        if PACKET.unpack_from(packet)[4] == 1 and not lost:
+            lost.append(packet)
+        else:
+            send(packet)
+
+    sender.sendto = lose_second_fragment
+    payload = bytes(range(250))
+    sender.send(VIDEO, payload, keyframe=True)
+    # the sender only sees the NACK while it reads
+    done = threading.Event()
+
+    def serve_nacks():
+        while not done.is_set():
+            try:
+                sender.read_message()
+            except socket.timeout:
+                pass
+
+    thread = threading.Thread(target=serve_nacks, daemon=True)
+    thread.start()
+    try:
+        header, received = receiver.read_message()
+    finally:
+        done.set()
+        thread.join()
+    assert lost and received == payload and header.type == VIDEO
+    assert sender.retransmitted == 1
@@ -0,0 +1,86 @@
+import numpy as np
+
+from vad import COMFORT, SILENT, SPEECH, ActiveSpeaker, VoiceActivityDetector, pack_comfort_noise, unpack_comfort_noise
+
+RATE, CHUNK = 8000, 800
+
+
+def talk(speaker, levels, start, end, step=0.1):
+    # Feeds {id: dBFS} every `step` seconds and returns the speaker after each update
+    current = []
+    for i in range(round((end - start) / step)):
+        now = start + i * step
+        for id, level in levels.items():
+            speaker.speech(id, level, now)
+        current.append(speaker.update(now))
+    return current
+
+
+def test_first_talker_becomes_the_speaker():
+    speaker = ActiveSpeaker(hold=1.0)
+    assert speaker.update(0.0) is None
+    assert talk(speaker, {1: -30}, 0.0, 0.3) == [1, 1, 1]
+    assert speaker.changes == 1
+
+
+def test_louder_talker_takes_over_after_hold():
+    speaker = ActiveSpeaker(hold=0.5, timeout=0.3)
+    talk(speaker, {1: -30}, 0.0, 0.5)
+    # 2 is louder from t=0.5 on; the first update takes it for a challenger
+    current = talk(speaker, {1: -30, 2: -10}, 0.5, 1.5)
+    assert current[0] == 1
+    assert current.index(2) >= 5 and set(current[current.index(2):]) == {2}
+    assert speaker.changes == 2
+
+
+def test_short_bursts_do_not_take_over():
+    speaker = ActiveSpeaker(hold=0.5)
+    talk(speaker, {1: -30}, 0.0, 0.5)
+    speaker.speech(2, 0, 0.5)
+    assert speaker.update(0.5) == 1
+    speaker.silence(2)
+    assert talk(speaker, {1: -30}, 0.6, 1.5) == [1] * 9
+    assert speaker.changes == 1
+
+
+def test_switches_at_once_when_the_speaker_stops():
+    speaker = ActiveSpeaker(hold=5.0)
+    talk(speaker, {1: -10, 2: -30}, 0.0, 0.5)
+    assert speaker.current == 1
+    speaker.silence(1)
+    assert speaker.update(0.5) == 2
+
+
+def test_clears_when_nobody_talks():
+    speaker = ActiveSpeaker(timeout=0.3)
+    talk(speaker, {1: -30}, 0.0, 0.3)
+    assert speaker.update(0.6) is None
+    assert speaker.current is None
+    speaker.speech(2, -30, 1.0)
+    assert speaker.update(1.0) == 2
+
+
+def chunk(amplitude, noise=False, seed=0):
+    t = np.arange(CHUNK) / RATE
+    if noise:
+        samples = np.random.default_rng(seed).normal(0, amplitude, CHUNK)
+    else:
+        samples = amplitude * np.sin(2 * np.pi * 200 * t)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def test_voice_versus_steady_noise():
+    vad = VoiceActivityDetector(rate=RATE, chunk=CHUNK, hangover=0.2, sid_interval=0.3, floor_window=0.5)
+    # loud noise counts as speech until the noise floor has been learnt
+    decisions = [vad.process(chunk(300, noise=True, seed=i)) for i in range(10)]
+    assert SPEECH not in decisions[6:]
+    assert vad.process(chunk(8000)) == SPEECH
+    # one chunk of hangover, then a comfort noise update every third chunk
+    after = [vad.process(chunk(300, noise=True, seed=i)) for i in range(7)]
+    assert after == [SPEECH, COMFORT, SILENT, SILENT, COMFORT, SILENT, SILENT]
+
+
+def test_comfort_noise_round_trip():
+    assert unpack_comfort_noise(pack_comfort_noise(-42.4)) == -42.0
+    assert unpack_comfort_noise(pack_comfort_noise(-300)) == -127.0
+    assert unpack_comfort_noise(pack_comfort_noise(3)) == 0.0
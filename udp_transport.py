@@ -0,0 +1,218 @@
+import logging
+import socket
+import struct
+import time
+from collections import deque
+from threading import Lock
+
+from protocol import ACK, AUDIO_TYPES, JOIN, VERSION, Header, now_us, pack_ack
+
+logger = logging.getLogger(__name__)
+
+# Datagram header (big-endian):
+#   kind u8 | message type u8 | flags u8 | pad | stream u16 | fragment index u16 |
+#   fragment count u16 | sequence u32 | capture timestamp u64 (us)
+# DATA packets carry one fragment of a message. NACK packets name a message by
+# (type, stream, sequence) and carry the missing fragment indices as u16s.
+PACKET = struct.Struct("!BBBxHHHIQ")
+DATA = 0
+NACK = 1
+KEYFRAME = 1
+
+MTU_PAYLOAD = 1200
+BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class Partial:
+    def __init__(self, count, flags, timestamp, now):
+        self.parts = [None] * count
+        self.missing = count
+        self.flags = flags
+        self.timestamp = timestamp
+        self.updated = now
+        self.nacks = 0
+
+
+class Reassembler:
+    # Rebuilds messages from fragments. Up to `window` incomplete messages are kept
+    # per (type, stream); when a newer message completes, older incomplete ones are
+    # dropped rather than waited for. Audio may complete out of order within the
+    # window, everything else is delivered newest-only.
+    def __init__(self, window=8, nack_delay=0.03, max_nacks=3):
+        self.window = window
+        self.nack_delay = nack_delay
+        self.max_nacks = max_nacks
+        self.partials = {}
+        self.latest = {}
+        self.ready = deque()
+        self.delivered = 0
+        self.dropped = 0
+        self.late = 0
+
+    def add(self, msg_type, flags, stream, index, count, seq, timestamp, data, now):
+        key = (msg_type, stream)
+        latest = self.latest.get(key)
+        if latest is not None:
+            limit = latest - self.window if msg_type in AUDIO_TYPES else latest
+            if seq <= limit:
+                self.late += 1
+                return
+        partials = self.partials.setdefault(key, {})
+        partial = partials.get(seq)
+        if partial is None:
+            if count == 0 or index >= count:
+                return
+            if len(partials) >= self.window:
+                # the window is full: make room by dropping the oldest, unless that is this one
+                oldest = min(partials)
+                self.dropped += 1
+                if seq < oldest:
+                    return
+                del partials[oldest]
+            partial = partials[seq] = Partial(count, flags, timestamp, now)
+        if index >= len(partial.parts) or partial.parts[index] is not None:
+            return
+        partial.parts[index] = bytes(data)
+        partial.missing -= 1
+        partial.updated = now
+        if partial.missing:
+            return
+
+        partials.pop(seq, None)
+        payload = b"".join(partial.parts)
+        self.ready.append((Header(VERSION, msg_type, stream, seq, partial.timestamp, len(payload)), payload))
+        self.delivered += 1
+        if msg_type in AUDIO_TYPES:
+            self.latest[key] = max(seq, latest if latest is not None else seq)
+        else:
+            self.latest[key] = seq
+            for old in [s for s in partials if s < seq]:
+                del partials[old]
+                self.dropped += 1
+
+    def nacks(self, now):
+        # Missing fragments of keyframes that have stopped making progress
+        for (msg_type, stream), partials in self.partials.items():
+            for seq, partial in partials.items():
+                if not partial.flags & KEYFRAME or partial.nacks >= self.max_nacks:
+                    continue
+                if now - partial.updated < self.nack_delay * (partial.nacks + 1):
+                    continue
+                partial.nacks += 1
+                missing = [i for i, p in enumerate(partial.parts) if p is None]
+                yield msg_type, stream, seq, missing
+
+
+class UdpTransport:
+    # Datagram counterpart of protocol.MessageWriter plus a blocking read_message().
+    # Messages are split into MTU-sized fragments; only keyframes are kept for
+    # NACK-driven retransmission.
+    def __init__(self, sock, peer=None, timeout=5, mtu=MTU_PAYLOAD, window=8, keep_keyframes=4, stream=0):
+        self.sock = sock
+        self.peer = peer
+        self.timeout = timeout
+        self.mtu = mtu
+        self.stream = stream
+        self.lock = Lock()
+        self.seq = {}
+        self.keyframes = deque(maxlen=keep_keyframes)
+        self.retransmit = {}
+        self.reassembler = Reassembler(window)
+        self.sent_packets = 0
+        self.retransmitted = 0
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, BUFFER_SIZE)
+            except OSError:
+                pass
+        sock.settimeout(0.01)
+
+    def next_seq(self, msg_type, stream):
+        key = (msg_type, stream)
+        seq = self.seq.get(key, 0)
+        self.seq[key] = seq + 1
+        return seq
+
+    def sendto(self, packet):
+        if self.peer is None:
+            raise ConnectionError("No peer address yet")
+        self.sock.sendto(packet, self.peer)
+
+    def send(self, msg_type, payload=b"", stream=None, timestamp=None, keyframe=False):
+        stream = self.stream if stream is None else stream
+        timestamp = now_us() if timestamp is None else timestamp
+        view = memoryview(payload).cast("B")
+        count = max(1, -(-len(view) // self.mtu))
+        flags = KEYFRAME if keyframe else 0
+        with self.lock:
+            seq = self.next_seq(msg_type, stream) & 0xFFFFFFFF
+            packets = []
+            for index in range(count):
+                header = PACKET.pack(DATA, msg_type, flags, stream, index, count, seq, timestamp)
+                packets.append(header + view[index * self.mtu : (index + 1) * self.mtu])
+            if keyframe:
+                key = (msg_type, stream, seq)
+                if len(self.keyframes) == self.keyframes.maxlen:
+                    self.retransmit.pop(self.keyframes[0], None)
+                self.keyframes.append(key)
+                self.retransmit[key] = packets
+            for packet in packets:
+                self.sendto(packet)
+            self.sent_packets += count
+        return seq
+
+    def join(self, room):
+        return self.send(JOIN, room.encode("utf-8"))
+
+    def ack(self, header):
+        return self.send(ACK, pack_ack(header), stream=header.stream)
+
+    def handle_nack(self, msg_type, stream, seq, data):
+        indices = struct.unpack(f"!{len(data) // 2}H", data[: len(data) // 2 * 2])
+        with self.lock:
+            packets = self.retransmit.get((msg_type, stream, seq))
+            if packets is None:
+                return
+            for index in indices:
+                if index < len(packets):
+                    self.sendto(packets[index])
+                    self.retransmitted += 1
+
+    def send_nacks(self, now):
+        for msg_type, stream, seq, missing in self.reassembler.nacks(now):
+            header = PACKET.pack(NACK, msg_type, 0, stream, 0, len(missing), seq, 0)
+            self.sendto(header + struct.pack(f"!{len(missing)}H", *missing))
+
+    def read_message(self):
+        deadline = time.monotonic() + self.timeout
+        while not self.reassembler.ready:
+            now = time.monotonic()
+            if now > deadline:
+                raise socket.timeout("Timeout waiting for datagrams")
+            try:
+                packet, addr = self.sock.recvfrom(65536)
+            except socket.timeout:
+                self.send_nacks(now)
+                continue
+            if self.peer is None:
+                self.peer = addr
+            if len(packet) < PACKET.size:
+                continue
+            kind, msg_type, flags, stream, index, count, seq, timestamp = PACKET.unpack_from(packet)
+            data = memoryview(packet)[PACKET.size :]
+            if kind == NACK:
+                self.handle_nack(msg_type, stream, seq, data)
+            elif kind == DATA:
+                self.reassembler.add(msg_type, flags, stream, index, count, seq, timestamp, data, now)
+                self.send_nacks(now)
+        return self.reassembler.ready.popleft()
+
+    def stats(self):
+        r = self.reassembler
+        return {
+            "sent_packets": self.sent_packets,
+            "retransmitted": self.retransmitted,
+            "delivered": r.delivered,
+            "dropped": r.dropped,
+            "late": r.late,
+        }
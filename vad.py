@@ -0,0 +1,183 @@
+import struct
+from collections import deque
+
+import numpy as np
+
+# Voice activity detection and discontinuous transmission (DTX). While nobody
+# speaks, a sender transmits a COMFORT_NOISE message now and then instead of
+# audio: its payload is the background noise level in -dBov, 0 (full scale) to
+# 127 (digital silence), like the RFC 3389 comfort noise payload without the
+# spectral coefficients. Receivers play noise at that level until audio resumes.
+COMFORT_PAYLOAD = struct.Struct("!B")
+SILENT_LEVEL = 127
+
+SPEECH = "speech"  # send the chunk
+COMFORT = "comfort"  # send a comfort noise update instead
+SILENT = "silent"  # send nothing
+
+
+def pack_comfort_noise(level):
+    return COMFORT_PAYLOAD.pack(int(np.clip(round(-level), 0, SILENT_LEVEL)))
+
+
+def unpack_comfort_noise(payload):
+    # Noise level in dBFS
+    return -float(COMFORT_PAYLOAD.unpack_from(payload)[0])
+
+
+def frame_levels(samples, frame):
+    # dBFS and zero-crossing rate of every `frame`-sample frame, in one pass over the chunk
+    n = len(samples) // frame * frame
+    frames = samples[:n].reshape(-1, frame).astype(np.float32)
+    power = np.mean(frames * frames, axis=1) / (32768.0 * 32768.0)
+    energy = 10 * np.log10(power + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame
+    return energy, zcr
+
+
+def level(pcm, channels=1):
+    # Loudest 10 ms (at 44.1 kHz) of a PCM chunk in dBFS
+    samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2 // channels * channels)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if len(samples) < 441:
+        return -100.0
+    return float(frame_levels(samples, 441)[0].max())
+
+
+class VoiceActivityDetector:
+    # Splits each chunk into `frame_ms` frames and computes their energy and
+    # zero-crossing rate with numpy. A frame is speech when it is `margin` dB
+    # above the noise floor and either has a low zero-crossing rate (voiced
+    # sounds; broadband noise crosses zero about every other sample) or is
+    # another `margin` dB louder still (fricatives). Frames quieter than
+    # `min_level` never are; voiced frames louder than `loud_level` always are,
+    # however steady. The noise floor is the quietest frame of the last
+    # `floor_window` seconds (speech always has gaps, steady noise does not).
+    #
+    # process() keeps a chunk "speech" for `hangover` seconds after the last
+    # speech frame, so word endings and short pauses are not clipped, then asks
+    # for a comfort noise update at once and every `sid_interval` seconds.
+    def __init__(
+        self,
+        rate=44100,
+        chunk=1024,
+        channels=1,
+        frame_ms=10,
+        margin=9.0,
+        min_level=-55.0,
+        loud_level=-30.0,
+        max_zcr=0.25,
+        floor_window=2.0,
+        hangover=0.25,
+        sid_interval=0.2,
+        min_frames=2,
+    ):
+        self.rate = rate
+        self.channels = channels
+        self.frame = max(1, rate * frame_ms // 1000)
+        self.margin = margin
+        self.min_level = min_level
+        self.loud_level = loud_level
+        self.max_zcr = max_zcr
+        self.chunk_duration = chunk / rate
+        self.hangover = max(1, round(hangover / self.chunk_duration))
+        self.sid_interval = max(1, round(sid_interval / self.chunk_duration))
+        self.min_frames = min_frames
+        # starts low, so talking from the first chunk on is not taken for noise
+        self.minima = deque([min_level - margin], maxlen=max(2, round(floor_window / self.chunk_duration)))
+        self.floor = min_level - margin
+        self.level = -100.0
+        self.noise_level = -100.0
+        self.remaining = 0  # chunks of hangover left
+        self.silent_chunks = 0
+        self.counts = {SPEECH: 0, COMFORT: 0, SILENT: 0}
+
+    def is_speech(self, pcm):
+        # Raw decision for one chunk, without hangover
+        samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2 // self.channels * self.channels)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if len(samples) < self.frame:
+            return False
+        energy, zcr = frame_levels(samples, self.frame)
+        self.level = float(energy.max())
+        threshold = max(self.floor + self.margin, self.min_level)
+        voiced = zcr < self.max_zcr
+        speech = ((energy > threshold) & (voiced | (energy > threshold + self.margin))) | (
+            voiced & (energy > self.loud_level)
+        )
+        active = np.count_nonzero(speech) >= min(self.min_frames, len(energy))
+        self.minima.append(float(energy.min()))
+        self.floor = min(self.minima)
+        if not active:
+            self.noise_level = float(np.mean(energy))
+        return active
+
+    def process(self, pcm):
+        # SPEECH, COMFORT or SILENT for the chunk just captured
+        if self.is_speech(pcm):
+            self.remaining = self.hangover
+        elif self.remaining:
+            self.remaining -= 1
+        if self.remaining:
+            self.silent_chunks = 0
+            decision = SPEECH
+        else:
+            decision = COMFORT if self.silent_chunks % self.sid_interval == 0 else SILENT
+            self.silent_chunks += 1
+        self.counts[decision] += 1
+        return decision
+
+    def comfort_noise(self):
+        return pack_comfort_noise(self.noise_level)
+
+    def stats(self):
+        return {**self.counts, "floor_db": round(self.floor, 1)}
+
+
+class ActiveSpeaker:
+    # The loudest participant that is talking. Talking means audio has arrived
+    # within `timeout` seconds and no comfort noise since; levels are smoothed.
+    # Another participant takes over only after being louder for `hold` seconds,
+    # or at once when the current speaker stops.
+    def __init__(self, hold=1.0, timeout=0.3):
+        self.hold = hold
+        self.timeout = timeout
+        self.levels = {}  # id -> (smoothed dBFS, time of the last audio)
+        self.current = None
+        self.challenger = None
+        self.changes = 0
+
+    def speech(self, id, level, now):
+        previous = self.levels.get(id)
+        smoothed = level if previous is None else 0.7 * previous[0] + 0.3 * level
+        self.levels[id] = (smoothed, now)
+
+    def silence(self, id):
+        self.levels.pop(id, None)
+
+    def update(self, now):
+        # Current speaker id, None when nobody talks
+        talking = {id: lvl for id, (lvl, seen) in self.levels.items() if now - seen < self.timeout}
+        if not talking:
+            self.current = self.challenger = None
+            return None
+        loudest = max(talking, key=talking.get)
+        if self.current not in talking:
+            self.switch(loudest)
+        elif loudest != self.current:
+            if self.challenger is None or self.challenger[0] != loudest:
+                self.challenger = (loudest, now)
+            elif now - self.challenger[1] >= self.hold:
+                self.switch(loudest)
+        else:
+            self.challenger = None
+        return self.current
+
+    def switch(self, id):
+        if id != self.current:
+            self.current = id
+            self.changes += 1
+        self.challenger = None
@@ -4,9 +4,39 @@ import socket
 import threading
 import argparse
 import logging
-import select
+import queue
 import time
-import pyaudio
+
+import metrics
+from audio_codec import AudioDecoder, AudioEncoder
+from avsync import PlayoutScheduler
+from bitrate import BitrateController
+from codec_pool import CodecPool
+from delta import TileDecoder, TileEncoder
+from framing import FrameReader
+from jitter import AudioJitterBuffer
+from media import close_audio, open_audio_sink, open_audio_source, open_display, open_video
+from pipeline import Pipeline
+from render import GridRenderer
+from simulcast import encode_layers, unpack_layer
+from startup import Startup
+from protocol import (
+    ACK,
+    AUDIO,
+    AUDIO_CODED,
+    COMFORT_NOISE,
+    LEAVE,
+    MESSAGE_NAMES,
+    SIMULCAST,
+    TILES,
+    VIDEO,
+    MessageWriter,
+    now_us,
+    read_message,
+    unpack_ack,
+)
+from udp_transport import UdpTransport
+from vad import COMFORT, SILENT, SPEECH, VoiceActivityDetector, unpack_comfort_noise
 
 # Configure logging
 logging.basicConfig(
@@ -16,55 +46,139 @@ logger = logging.getLogger(__name__)
 
 
 class VideoChat:
-    def __init__(self, is_server=True, server_ip="0.0.0.0", port=12345, timeout=5, audio_index=0):
+    def __init__(
+        self,
+        is_server=True,
+        server_ip="0.0.0.0",
+        port=12345,
+        timeout=5,
+        audio_index=0,
+        bitrate_options=None,
+        delta=False,
+        transport="tcp",
+        audio_codec="pcm",
+        voice_rate=None,
+        codec_workers=0,
+        codec_pool="process",
+        audio_source="mic",
+        audio_sink="speaker",
+        display="window",
+        simulcast=1,
+        room=None,
+        render_fps=30,
+        vad=True,
+        video_source=0,
+        startup=None,
+    ):
         logger.info("Initializing VideoChat...")
         self.is_server = is_server
         self.server_ip = server_ip
         self.port = port
         self.timeout = timeout
         self.audio_index = audio_index
+        self.bitrate_options = bitrate_options or {}
+        self.bitrate = None
+        self.delta = delta
+        self.transport = transport
+        self.audio_codec = audio_codec
+        self.voice_rate = voice_rate
+        self.codec_workers = codec_workers
+        self.codec_pool = codec_pool
+        self.simulcast = simulcast  # spatial layers sent per frame, 1 = plain video
+        self.room = room  # relay room to join, None when talking to a VideoChat server
+        self.render_fps = render_fps
+        self.use_vad = vad  # send comfort noise markers instead of silent audio
+        self.vad = None
+        self.renderer = None  # grid of every remote participant, in rooms
+        self.scheduler = None  # plays remote video out against the remote audio
+        self.encode_pool = None
+        self.decode_pool = None
+        self.tile_encoder = None
+        self.tile_decoder = None
 
-        # Remove camera initialization from here
-        self.cap = None  # Camera will be set later
+        # Devices are opened by open_camera() and open_audio(), beside connecting (see prepare())
+        self.video_source = video_source
+        self.audio_source = audio_source
+        self.audio_sink = audio_sink
+        self.cap = None
+        self.startup = startup or Startup("video_app")
 
         # Initialize audio with specific parameters
         self.CHUNK = 1024
-        self.FORMAT = pyaudio.paInt16
         self.CHANNELS = 1
         self.RATE = 44100
+        self.AUDIO_QUEUE = 50  # chunks, a bit over one second
+        self.STATS_INTERVAL = 5
 
-        self.p = pyaudio.PyAudio()
-        self.audio_input_stream = self.p.open(
-            format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
-            input=True,
-            input_device_index=self.audio_index,
-            frames_per_buffer=self.CHUNK,
-        )
+        self.display = open_display(display)
 
-        self.audio_output_stream = self.p.open(
-            format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
-            output=True,
-            frames_per_buffer=self.CHUNK,
+        logger.info("VideoChat initialized")
+
+    def open_camera(self):
+        self.cap = open_video(self.video_source)
+        if not self.cap.isOpened():
+            logger.error(f"Could not open video source {self.video_source}")
+            raise SystemExit(1)
+
+    def open_audio(self):
+        # Devices by default; synthetic sources and null sinks run headless (see media.py)
+        self.audio_input_stream = open_audio_source(
+            self.audio_source, self.RATE, self.CHANNELS, self.CHUNK, device=self.audio_index
         )
+        self.audio_output_stream = open_audio_sink(self.audio_sink, self.RATE, self.CHANNELS, self.CHUNK)
 
-        logger.info("VideoChat initialized")
+    def start_pools(self):
+        # Process pools fork their workers, which is only safe while no other thread
+        # (camera, audio devices, connecting) can hold a lock the child inherits.
+        # So the pools start before prepare() starts any and last for every session.
+        if self.codec_workers and not self.delta and self.simulcast == 1 and self.encode_pool is None:
+            self.encode_pool = CodecPool(self.codec_workers, self.codec_pool)
+        if self.codec_workers and self.room is None and self.decode_pool is None:
+            self.decode_pool = CodecPool(self.codec_workers, self.codec_pool)
+
+    def close_pools(self):
+        for pool in (self.encode_pool, self.decode_pool):
+            if pool is not None:
+                pool.close()
+        self.encode_pool = self.decode_pool = None
+
+    def warm_up(self):
+        # Gets the first (slow) codec calls done, on the workers too, before media flows
+        for pool in (self.encode_pool, self.decode_pool):
+            if pool is not None:
+                pool.warm_up()
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        cv2.imdecode(cv2.imencode(".jpg", frame)[1], cv2.IMREAD_COLOR)
+        if self.audio_codec != "pcm" or self.voice_rate:
+            # a throwaway encoder, so the session's own starts in step with the receiver
+            AudioEncoder(self.audio_codec, self.RATE, self.voice_rate, self.CHANNELS).encode(bytes(2 * self.CHUNK))
+
+    def prepare(self, connect=None):
+        # Camera, audio devices, codec warm-up and `connect` do not depend on each other, so they run side by side
+        tasks = {"camera": self.open_camera, "audio": self.open_audio, "warm": self.warm_up}
+        if connect is not None:
+            tasks["connected"] = connect
+        self.start_pools()
+        self.startup.parallel(**tasks)
 
     def start_server(self):
+        if self.transport == "udp":
+            return self.start_udp_server()
         logger.info("Starting server...")
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.settimeout(self.timeout)
         self.server.bind((self.server_ip, self.port))
         self.server.listen(5)
+        self.startup.mark("listening")
         logger.info(f"Server listening on port {self.port}")
+        # a client connecting meanwhile waits in the backlog
+        self.prepare()
 
         while True:
             try:
                 logger.info("Waiting for client connection...")
                 client_socket, addr = self.server.accept()
+                self.startup.mark("connected")
                 client_socket.settimeout(self.timeout)
                 logger.info(f"Client connected from {addr}")
                 self.handle_client(client_socket)
@@ -75,88 +189,388 @@ class VideoChat:
                 logger.error(f"Error accepting connection: {e}")
                 break
 
-    def handle_client(self, client_socket):
-        logger.info("Handling client connection...")
+    def start_udp_server(self):
+        logger.info("Starting UDP server...")
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind((self.server_ip, self.port))
+        self.startup.mark("listening")
+        logger.info(f"Server listening on UDP port {self.port}")
+        self.prepare()
+
+        while True:
+            # There is no accept(); the first datagram from a client tells us its address
+            self.server.settimeout(self.timeout)
+            try:
+                logger.info("Waiting for client datagram...")
+                _, addr = self.server.recvfrom(65536)
+            except socket.timeout:
+                logger.warning("Timeout waiting for client. Retrying...")
+                continue
+            self.startup.mark("connected")
+            logger.info(f"Client connected from {addr}")
+            transport = UdpTransport(self.server, addr, timeout=self.timeout)
+            self.run_session(transport, "Client Video", close=False)
+            logger.info("Closing client session...")
+
+    def capture_audio(self):
+        data = self.audio_input_stream.read(self.CHUNK, exception_on_overflow=False)
+        # read() returns at the end of the chunk; the timestamp is its first sample
+        return now_us() - int(self.CHUNK / self.RATE * 1e6), data
+
+    def capture_video(self):
+        # Always drain the camera so frames do not go stale in its buffer, but only
+        # pass on as many as the bitrate controller currently asks for.
+        ret, frame = self.cap.read()
+        if not ret:
+            raise OSError("Failed to capture frame")
+        # Frames travel with their capture time, which the receiver syncs to the audio by
+        timestamp = now_us()
+        if self.is_server:
+            self.local_video.put(frame)
+        if not self.bitrate.should_capture():
+            return None
+        return timestamp, cv2.resize(frame, self.bitrate.frame_size)
+
+    def encode_video(self, item):
+        timestamp, frame = item
+        if self.simulcast > 1:
+            return SIMULCAST, encode_layers(frame, self.bitrate.encode_params(cv2), self.simulcast), None, timestamp
+        if self.delta:
+            data, token = self.tile_encoder.encode(frame, self.bitrate.quality)
+            return TILES, data, token, timestamp
+        return VIDEO, cv2.imencode(".jpg", frame, self.bitrate.encode_params(cv2))[1], None, timestamp
+
+    def submit_encode(self, item):
+        # Frames that find every pool slot busy are dropped, like a full latest queue
+        timestamp, frame = item
         try:
-            while True:
-                # Handle audio
-                try:
-                    # Read audio from microphone
-                    audio_data = self.audio_input_stream.read(self.CHUNK, exception_on_overflow=False)
-                    # Send audio length first
-                    audio_length = len(audio_data)
-                    client_socket.sendall(audio_length.to_bytes(4, byteorder="big"))
-                    # Send audio data
-                    client_socket.sendall(audio_data)
-
-                    # Receive audio from client
-                    audio_length_data = client_socket.recv(4)
-                    if audio_length_data:
-                        audio_length = int.from_bytes(audio_length_data, byteorder="big")
-                        received_audio = client_socket.recv(audio_length)
-                        if received_audio:
-                            self.audio_output_stream.write(received_audio)
-                except Exception as e:
-                    logger.error(f"Error handling audio: {e}")
-                    continue
-
-                # Show server's own video feed
-                ret, frame = self.cap.read()
-                if not ret:
-                    logger.error("Failed to capture frame")
-                    break
-                cv2.imshow("Server Camera", frame)
+            self.encode_pool.encode(frame, self.bitrate.encode_params(cv2), context=timestamp, timeout=0.1)
+        except queue.Empty:
+            self.pipeline.queues["raw_video"].dropped += 1
 
-                # Receive client's video
+    def collect_encoded(self):
+        try:
+            timestamp, data = self.encode_pool.get(timeout=0.1)
+        except queue.Empty:
+            return None
+        return None if data is None else (VIDEO, data, None, timestamp)
+
+    def send_video(self, writer, item):
+        msg_type, data, token, timestamp = item
+        start = time.perf_counter()
+        if msg_type == SIMULCAST:
+            # every layer goes out under the frame's sequence number
+            seq = writer.send(SIMULCAST, data[0], timestamp=timestamp)
+            for layer in data[1:]:
+                writer.send(SIMULCAST, layer, timestamp=timestamp, seq=seq)
+            size = sum(map(len, data))
+        else:
+            keyframe = token is not None and token["keyframe"]
+            seq = writer.send(msg_type, data, timestamp=timestamp, keyframe=keyframe)
+            size = len(data)
+        if metrics.TRACER.sampled(seq):
+            metrics.TRACER.record("send", seq, start, time.perf_counter())
+        self.sent_bytes[msg_type].inc(size)
+        self.bitrate.on_send(seq, size)
+        if token is not None:
+            self.tile_encoder.on_send(token, seq)
+
+    def decode_video(self, writer, item):
+        # Frames are acknowledged once decoded, which is what the delta encoder's
+        # reference and the bitrate controller's RTT are based on
+        header, data = item
+        start = time.perf_counter()
+        if header.type == TILES:
+            frame = self.tile_decoder.decode(data)
+        else:
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if metrics.TRACER.sampled(header.seq):
+            metrics.TRACER.record("decode", header.seq, start, time.perf_counter())
+        if frame is not None:
+            writer.ack(header)
+            return header, frame
+        return None
+
+    def submit_decode(self, writer, item):
+        # Delta frames patch a shared canvas and have to be applied in order here
+        header, data = item
+        if header.type == TILES:
+            return self.decode_video(writer, item)
+        try:
+            self.decode_pool.decode(data, context=header, timeout=0.1)
+        except queue.Empty:
+            self.pipeline.queues["remote_video"].dropped += 1
+
+    def collect_decoded(self, writer):
+        try:
+            header, frame = self.decode_pool.get(timeout=0.1)
+        except queue.Empty:
+            return None
+        if frame is not None:
+            writer.ack(header)
+            return header, frame
+        return None
+
+    def send_audio(self, writer, item):
+        timestamp, data = item
+        if self.vad is not None:
+            decision = self.vad.process(data)
+            self.vad_chunks[decision].inc()
+            if decision != SPEECH:
+                if decision == COMFORT:
+                    payload = self.vad.comfort_noise()
+                    writer.send(COMFORT_NOISE, payload, timestamp=timestamp)
+                    self.sent_bytes[COMFORT_NOISE].inc(len(payload))
+                return
+        msg_type = AUDIO
+        if self.audio_encoder is not None:
+            msg_type, data = AUDIO_CODED, self.audio_encoder.encode(data)
+        writer.send(msg_type, data, timestamp=timestamp)
+        self.sent_bytes[msg_type].inc(len(data))
+
+    def play_audio(self):
+        # The output stream paces this stage; the jitter buffers never block.
+        # Every remote participant has its own buffer, mixed here.
+        mix = np.zeros(self.CHUNK * self.CHANNELS, dtype=np.int32)
+        for buffer in list(self.jitter_buffers.values()):
+            mix += np.frombuffer(buffer.get(), dtype=np.int16)
+        self.audio_output_stream.write(np.clip(mix, -32768, 32767).astype(np.int16).tobytes())
+
+    def receive_message(self, read, writer, video_queue):
+        # Audio and video share the connection, so dispatch on the message type.
+        # Payload views are reused by the reader, hence the copies.
+        try:
+            header, payload = read()
+        except socket.timeout:
+            logger.warning("Timeout waiting for remote data")
+            return
+        if header.type == LEAVE:
+            # a room member left: its tile and its audio go
+            logger.info(f"Participant {header.stream} left")
+            if self.renderer is not None:
+                self.renderer.remove(header.stream)
+            self.scheduler.remove(header.stream)
+            self.jitter_buffers.pop(header.stream, None)
+            self.audio_decoders.pop(header.stream, None)
+            return
+        if header.type in self.received_bytes:
+            self.received_bytes[header.type].inc(header.length)
+            self.scheduler.observe(header)
+        if header.type in (AUDIO, AUDIO_CODED, COMFORT_NOISE):
+            # sequence numbers and timestamps are per stream, so each gets its own buffer
+            jitter = self.jitter_buffers.get(header.stream)
+            if jitter is None:
+                jitter = AudioJitterBuffer(self.CHUNK, self.RATE, self.CHANNELS)
+                self.audio_decoders[header.stream] = AudioDecoder(self.RATE)
+                self.jitter_buffers[header.stream] = jitter
+                self.scheduler.add_audio(header.stream, jitter)
+            if header.type == COMFORT_NOISE:
+                jitter.comfort(header.timestamp, unpack_comfort_noise(payload))
+                return
+            if header.type == AUDIO_CODED:
+                payload = self.audio_decoders[header.stream].decode(payload)
+            jitter.put(header.seq, header.timestamp, payload)
+        elif header.type in (VIDEO, TILES):
+            # capture-to-receive time, only meaningful when both clocks agree
+            self.network_latency.observe(max(0, now_us() - header.timestamp) / 1e6)
+            video_queue.put((header, bytes(payload)))
+        elif header.type == SIMULCAST:
+            # straight from a simulcasting peer, no relay to pick a layer: keep the largest
+            layer, msg_type, _, offset = unpack_layer(payload)
+            if layer == 0:
+                self.network_latency.observe(max(0, now_us() - header.timestamp) / 1e6)
+                video_queue.put((header._replace(type=msg_type), bytes(payload[offset:])))
+        elif header.type == ACK:
+            seq, _ = unpack_ack(payload)
+            self.bitrate.on_ack(seq)
+            if self.delta:
+                self.tile_encoder.on_ack(seq)
+
+    def instrument(self):
+        # No-op metrics unless metrics were enabled on the command line
+        media = (VIDEO, TILES, SIMULCAST, AUDIO, AUDIO_CODED, COMFORT_NOISE)
+        self.sent_bytes = {
+            t: metrics.counter("media_bytes_total", "Media payload bytes", direction="out", type=MESSAGE_NAMES[t])
+            for t in media
+        }
+        self.received_bytes = {
+            t: metrics.counter("media_bytes_total", "Media payload bytes", direction="in", type=MESSAGE_NAMES[t])
+            for t in media
+        }
+        self.network_latency = metrics.histogram("network_latency_seconds", "Capture to receive time of video")
+        self.render_latency = metrics.histogram("render_seconds", "Time to display one frame")
+        self.vad_chunks = {
+            d: metrics.counter("vad_chunks_total", "Captured audio chunks by VAD decision", decision=d)
+            for d in (SPEECH, COMFORT, SILENT)
+        }
+        metrics.gauge("bitrate_level", "Adaptive bitrate level", fn=lambda: self.bitrate.level)
+        metrics.gauge(
+            "jitter_buffer_ms",
+            "Audio queued in the fullest jitter buffer",
+            fn=lambda: max((b.buffered() for b in list(self.jitter_buffers.values())), default=0) * 1000,
+        )
+
+    def build_pipeline(self, conn):
+        # capture -> encode -> send and receive -> decode/playback, each stage on its
+        # own thread. Video queues keep only the newest frame, audio queues are FIFO.
+        if isinstance(conn, UdpTransport):
+            read, writer = conn.read_message, conn
+        else:
+            reader = FrameReader(conn)
+            read, writer = (lambda: read_message(reader)), MessageWriter(conn)
+        self.bitrate = BitrateController(**self.bitrate_options)
+        self.tile_encoder = TileEncoder()
+        self.tile_decoder = TileDecoder()
+        self.jitter_buffers = {}  # remote stream id -> AudioJitterBuffer
+        self.audio_decoders = {}
+        # a written chunk is heard about one chunk later, while the sink plays the previous one
+        self.scheduler = PlayoutScheduler(audio_latency=self.CHUNK / self.RATE)
+        self.audio_encoder = None
+        if self.audio_codec != "pcm" or self.voice_rate:
+            self.audio_encoder = AudioEncoder(self.audio_codec, self.RATE, self.voice_rate, self.CHANNELS)
+        self.vad = VoiceActivityDetector(self.RATE, self.CHUNK, self.CHANNELS) if self.use_vad else None
+        self.instrument()
+        pipeline = self.pipeline = Pipeline()
+        raw_video = pipeline.queue("raw_video", latest=True)
+        encoded_video = pipeline.queue("encoded_video", latest=True)
+        remote_video = pipeline.queue("remote_video", latest=True)
+        self.decoded_video = pipeline.queue("decoded_video", latest=True)
+        self.local_video = pipeline.queue("local_video", latest=True)
+        audio_out = pipeline.queue("audio_out", maxsize=self.AUDIO_QUEUE)
+
+        pipeline.add("audio_capture", self.capture_audio, outbox=audio_out)
+        pipeline.add("audio_send", lambda data: self.send_audio(writer, data), inbox=audio_out)
+        pipeline.add("video_capture", self.capture_video, outbox=raw_video)
+        if self.encode_pool is not None:
+            # JPEG coding fans out to a worker pool (see start_pools()); the collect stages emit in order
+            pipeline.add("video_encode", self.submit_encode, inbox=raw_video)
+            pipeline.add("video_encode_collect", self.collect_encoded, outbox=encoded_video)
+        else:
+            pipeline.add("video_encode", self.encode_video, inbox=raw_video, outbox=encoded_video)
+        pipeline.add("video_send", lambda data: self.send_video(writer, data), inbox=encoded_video)
+        if self.room is not None:
+            # Any number of participants: the renderer decodes them on its own
+            # workers, skipping superseded frames, and composites one grid
+            self.renderer = GridRenderer(
+                self.display,
+                f"Room {self.room}",
+                max_fps=self.render_fps,
+                workers=max(2, self.codec_workers),
+                on_decoded=writer.ack,
+                scheduler=self.scheduler,
+            )
+            pipeline.add("receive", lambda: self.receive_message(read, writer, self.renderer))
+        elif self.decode_pool is not None:
+            pipeline.add("receive", lambda: self.receive_message(read, writer, remote_video))
+            pipeline.add(
+                "video_decode",
+                lambda item: self.submit_decode(writer, item),
+                inbox=remote_video,
+                outbox=self.decoded_video,
+            )
+            pipeline.add("video_decode_collect", lambda: self.collect_decoded(writer), outbox=self.decoded_video)
+        else:
+            pipeline.add("receive", lambda: self.receive_message(read, writer, remote_video))
+            pipeline.add(
+                "video_decode",
+                lambda item: self.decode_video(writer, item),
+                inbox=remote_video,
+                outbox=self.decoded_video,
+            )
+        pipeline.add("audio_playback", self.play_audio)
+        return pipeline
+
+    def run_session(self, conn, window, close=True):
+        pipeline = self.build_pipeline(conn)
+        pipeline.start()
+        last_stats = time.monotonic()
+        try:
+            # cv2 windows have to be driven from the main thread
+            while pipeline.running:
+                shown = []
+                if self.renderer is None:
+                    # one-to-one; in a room the grid renderer pops its own tiles from the scheduler
+                    try:
+                        self.scheduler.push(*self.decoded_video.get(timeout=0))
+                    except queue.Empty:
+                        pass
+                    shown = [(window, frame) for _, frame in self.scheduler.pop_due()]
+                    if shown:
+                        self.startup.mark("first_frame")
                 try:
-                    # Use select to check for data with timeout
-                    ready = select.select([client_socket], [], [], self.timeout)
-                    if not ready[0]:
-                        logger.warning("Timeout waiting for client data")
-                        continue
-
-                    # First receive the length of the frame
-                    length_data = client_socket.recv(4)
-                    if not length_data:
-                        break
-                    frame_length = int.from_bytes(length_data, byteorder="big")
-
-                    # Then receive the frame data with timeout
-                    data = b""
-                    start_time = time.time()
-                    while len(data) < frame_length:
-                        if time.time() - start_time > self.timeout:
-                            logger.warning("Timeout receiving frame data")
-                            break
-                        packet = client_socket.recv(min(frame_length - len(data), 4096))
-                        if not packet:
-                            break
-                        data += packet
-
-                    if len(data) == frame_length:
-                        img_array = np.frombuffer(data, dtype=np.uint8)
-                        frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                        if frame is not None:
-                            cv2.imshow("Client Video", frame)
-                except Exception as e:
-                    logger.error(f"Error receiving frame: {e}")
-                    continue
-
-                if cv2.waitKey(1) & 0xFF == 27:  # Press 'Esc' to exit
+                    shown.append(("Server Camera", self.local_video.get(timeout=0)))
+                except queue.Empty:
+                    pass
+                for name, frame in shown:
+                    start = time.perf_counter()
+                    self.display.show(name, frame)
+                    self.render_latency.observe(time.perf_counter() - start)
+                if self.renderer is not None:
+                    self.renderer.render()
+                    if self.renderer.first_frame is not None:
+                        self.startup.mark("first_frame", self.renderer.first_frame)
+                if "first_frame" in self.startup.marks and not self.startup.reported:
+                    logger.info(f"Startup: {self.startup.report()}")
+
+                if self.display.poll() & 0xFF == 27:  # Press 'Esc' to exit
+                    logger.info("Stopping - Esc pressed")
                     break
+
+                if time.monotonic() - last_stats >= self.STATS_INTERVAL:
+                    logger.info(f"Pipeline: {pipeline.format_stats()}")
+                    logger.info(f"Bitrate: {self.bitrate.stats()}")
+                    for stream, buffer in list(self.jitter_buffers.items()):
+                        logger.info(f"Jitter buffer {stream}: {buffer.stats()}")
+                    logger.info(f"A/V sync: {self.scheduler.stats()}")
+                    if self.vad is not None:
+                        logger.info(f"VAD: {self.vad.stats()}")
+                    if isinstance(conn, UdpTransport):
+                        logger.info(f"Transport: {conn.stats()}")
+                    last_stats = time.monotonic()
         finally:
-            logger.info("Closing client connection...")
-            client_socket.close()
-            cv2.destroyAllWindows()
+            pipeline.stop()
+            self.drain_pools()
+            if self.renderer is not None:
+                self.renderer.close()
+                self.renderer = None
+            if close:
+                (conn.sock if isinstance(conn, UdpTransport) else conn).close()
+            self.display.close()
+
+    def drain_pools(self):
+        # The pools outlive the session: collect what it left in flight, so the next
+        # session's results are its own, and give up on a pool that stopped answering
+        for name in ("encode_pool", "decode_pool"):
+            pool = getattr(self, name)
+            try:
+                while pool is not None and pool.in_flight():
+                    pool.get(timeout=1.0)
+            except queue.Empty:
+                logger.warning(f"{name} stopped answering, closing it")
+                pool.close()
+                setattr(self, name, None)
+
+    def handle_client(self, client_socket):
+        logger.info("Handling client connection...")
+        self.run_session(client_socket, "Client Video")
+        logger.info("Closing client connection...")
 
     def start_client(self):
+        if self.transport == "udp":
+            return self.start_udp_client()
         logger.info("Starting client...")
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.client.settimeout(self.timeout)
+
+        def connect():
+            self.client.connect((self.server_ip, self.port))
+            if self.room is not None:
+                MessageWriter(self.client).join(self.room)
+
         try:
             logger.info(f"Connecting to server at {self.server_ip}:{self.port}")
-            self.client.connect((self.server_ip, self.port))
-            logger.info("Connected to server")
+            self.prepare(connect)
+            logger.info("Connected to server" if self.room is None else f"Joined room {self.room!r}")
         except socket.timeout:
             logger.error("Timeout connecting to server")
             return
@@ -164,62 +578,37 @@ class VideoChat:
             logger.error("Connection refused by server")
             return
 
-        while True:
-            try:
-                # Handle audio
-                audio_data = self.audio_input_stream.read(self.CHUNK, exception_on_overflow=False)
-                # Send audio length first
-                audio_length = len(audio_data)
-                self.client.sendall(audio_length.to_bytes(4, byteorder="big"))
-                # Send audio data
-                self.client.sendall(audio_data)
-
-                # Receive audio from server
-                audio_length_data = self.client.recv(4)
-                if audio_length_data:
-                    audio_length = int.from_bytes(audio_length_data, byteorder="big")
-                    received_audio = self.client.recv(audio_length)
-                    if received_audio:
-                        self.audio_output_stream.write(received_audio)
-            except Exception as e:
-                logger.error(f"Error handling audio: {e}")
-                continue
-
-            ret, frame = self.cap.read()
-            if not ret:
-                logger.error("Failed to capture frame")
-                break
-
-            frame = cv2.resize(frame, (640, 480))
-            encoded_frame = cv2.imencode(".jpg", frame)[1].tobytes()
+        self.run_session(self.client, "Server Video", close=False)
+        logger.info("Closing client connection...")
+        if self.room is not None:
             try:
-                # Send the length of the frame first
-                frame_length = len(encoded_frame)
-                self.client.sendall(frame_length.to_bytes(4, byteorder="big"))
-                # Then send the frame data
-                self.client.sendall(encoded_frame)
-            except socket.timeout:
-                logger.warning("Timeout sending frame to server")
-                continue
-            except Exception as e:
-                logger.error(f"Error sending frame: {e}")
-                break
-
-            if cv2.waitKey(1) == 27:  # Press 'Esc' to exit
-                logger.info("Client stopping - Esc pressed")
-                break
+                MessageWriter(self.client).send(LEAVE)  # or the relay holds our place for a resume
+            except OSError:
+                pass
+        self.client.close()
+        self.cap.release()
 
-        logger.info("Closing client connection...")
+    def start_udp_client(self):
+        logger.info("Starting UDP client...")
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        transport = UdpTransport(self.client, (self.server_ip, self.port), timeout=self.timeout)
+        logger.info(f"Sending to server at {self.server_ip}:{self.port}")
+        self.prepare()
+        transport.join("default")
+        self.startup.mark("connected")
+        self.run_session(transport, "Server Video")
+        logger.info("Closing client session...")
         self.cap.release()
-        self.client.close()
-        cv2.destroyAllWindows()
 
     def run(self):
         logger.info(f"Starting VideoChat in {'server' if self.is_server else 'client'} mode")
-        if self.is_server:
-            self.start_server()
-        else:
-            self.start_client()
+        try:
+            if self.is_server:
+                self.start_server()
+            else:
+                self.start_client()
+        finally:
+            self.close_pools()
 
     def __del__(self):
         # Clean up audio resources
@@ -229,17 +618,18 @@ class VideoChat:
         if hasattr(self, "audio_output_stream"):
             self.audio_output_stream.stop_stream()
             self.audio_output_stream.close()
-        if hasattr(self, "p"):
-            self.p.terminate()
+        close_audio()
 
 
 # Main function
 if __name__ == "__main__":
+    startup = Startup("video_app")
     parser = argparse.ArgumentParser(description="Video Chat Application")
     parser.add_argument(
         "-m", "--mode", choices=["server", "client"], required=True, help="Run as server or client"
     )
     parser.add_argument("-i", "--ip", default="127.0.0.1", help="Server IP address (default: 127.0.0.1)")
+    parser.add_argument("-p", "--port", type=int, default=12345, help="Server port (default: 12345)")
     parser.add_argument(
         "-sc", "--server_camera", type=int, default=0, help="Server camera index (default: 0)"
     )
@@ -248,20 +638,96 @@ if __name__ == "__main__":
     )
     parser.add_argument("-sa", "--server_audio", type=int, default=0, help="Server audio index (default: 0)")
     parser.add_argument("-ca", "--client_audio", type=int, default=1, help="Client audio index (default: 1)")
+    parser.add_argument(
+        "--target_latency", type=float, default=0.2, help="Target round trip in seconds (default: 0.2)"
+    )
+    parser.add_argument("--min_quality", type=int, default=30, help="Lowest JPEG quality (default: 30)")
+    parser.add_argument("--max_quality", type=int, default=90, help="Highest JPEG quality (default: 90)")
+    parser.add_argument("--min_fps", type=float, default=5, help="Lowest frame rate (default: 5)")
+    parser.add_argument("--max_fps", type=float, default=30, help="Highest frame rate (default: 30)")
+    parser.add_argument("--delta", action="store_true", help="Send only changed tiles between keyframes")
+    parser.add_argument(
+        "-t", "--transport", choices=["tcp", "udp"], default="tcp", help="Media transport (default: tcp)"
+    )
+    parser.add_argument(
+        "--audio_codec", choices=["pcm", "ulaw", "adpcm"], default="pcm", help="Audio codec (default: pcm)"
+    )
+    parser.add_argument("--voice_rate", type=int, help="Resample sent audio to this rate, e.g. 16000")
+    parser.add_argument(
+        "--simulcast", type=int, choices=[1, 2, 3], default=1, help="Video layers sent per frame (default: 1)"
+    )
+    parser.add_argument("--room", help="Join this room on a relay (server_tw.py, -p 1222) instead of a server")
+    parser.add_argument("--render_fps", type=float, default=30, help="Room grid refresh rate cap (default: 30)")
+    parser.add_argument("--no_vad", action="store_true", help="Send every audio chunk, silent or not")
+    parser.add_argument(
+        "--codec_workers", type=int, default=0, help="JPEG encode/decode workers, 0 codes inline (default: 0)"
+    )
+    parser.add_argument(
+        "--codec_pool", choices=["process", "thread"], default="process", help="Worker kind (default: process)"
+    )
+    parser.add_argument(
+        "--video", help="Video source: camera index, synthetic, file:<path> or rec:<dir> (default: camera)"
+    )
+    parser.add_argument(
+        "--audio_in", help="Audio source: mic, tone[:<hz>], noise, wav:<path> or rec:<dir> (default: mic)"
+    )
+    parser.add_argument("--audio_out", choices=["speaker", "null"], help="Audio sink (default: speaker)")
+    parser.add_argument("--display", choices=["window", "null"], help="Video display (default: window)")
+    parser.add_argument("--headless", action="store_true", help="Synthetic media and null sinks, no devices")
+    parser.add_argument("--metrics_port", type=int, help="Serve Prometheus metrics on this localhost port")
+    parser.add_argument("--metrics_json", help="Append a JSON metrics snapshot to this file periodically")
+    parser.add_argument("--metrics_interval", type=float, default=5, help="Seconds between JSON snapshots")
+    parser.add_argument("--trace_every", type=int, default=0, help="Record spans for one frame in N (default: off)")
+    parser.add_argument("--startup_json", help="Append the startup milestones to this file as a JSON line")
     args = parser.parse_args()
+    startup.path = args.startup_json
+    if args.simulcast > 1 and (args.delta or args.transport != "tcp"):
+        parser.error("--simulcast sends JPEG layers over TCP, it does not combine with --delta or -t udp")
+    if args.delta and args.room is not None:
+        # the encoder keeps one reference, moved on by any receiver's ACK, and the relay drops video per receiver
+        parser.error("--delta needs a single receiver, it does not combine with --room")
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.metrics_json:
+        metrics.SnapshotWriter(args.metrics_json, args.metrics_interval).start()
+    metrics.TRACER.sample_every = args.trace_every
+    bitrate_options = {
+        "target_latency": args.target_latency,
+        "min_quality": args.min_quality,
+        "max_quality": args.max_quality,
+        "min_fps": args.min_fps,
+        "max_fps": args.max_fps,
+    }
+
+    # --headless swaps every device for a synthetic source or null sink unless given explicitly
+    is_server = args.mode == "server"
+    camera = args.server_camera if is_server else args.client_camera
+    video = args.video or ("synthetic" if args.headless else camera)
+    audio_source = args.audio_in or ("tone" if args.headless else "mic")
+    audio_sink = args.audio_out or ("null" if args.headless else "speaker")
+    display = args.display or ("null" if args.headless else "window")
 
     logger.info("Starting application...")
-    if args.mode == "server":
-        server = VideoChat(is_server=True, audio_index=args.server_audio)
-        server.cap = cv2.VideoCapture(args.server_camera)  # Use specified server camera
-        if not server.cap.isOpened():
-            logger.error(f"Could not open server camera {args.server_camera}")
-            exit(1)
-        server.run()
-    else:
-        client = VideoChat(is_server=False, server_ip=args.ip, audio_index=args.client_audio)
-        client.cap = cv2.VideoCapture(args.client_camera)  # Use specified client camera
-        if not client.cap.isOpened():
-            logger.error(f"Could not open client camera {args.client_camera}")
-            exit(1)
-        client.run()
+    chat = VideoChat(
+        is_server=is_server,
+        server_ip="0.0.0.0" if is_server else args.ip,
+        port=args.port,
+        audio_index=args.server_audio if is_server else args.client_audio,
+        bitrate_options=bitrate_options,
+        delta=args.delta,
+        transport=args.transport,
+        audio_codec=args.audio_codec,
+        voice_rate=args.voice_rate,
+        codec_workers=args.codec_workers,
+        codec_pool=args.codec_pool,
+        audio_source=audio_source,
+        audio_sink=audio_sink,
+        display=display,
+        simulcast=args.simulcast,
+        room=args.room,
+        render_fps=args.render_fps,
+        vad=not args.no_vad,
+        video_source=video,
+        startup=startup,
+    )
+    chat.run()